@@ -1,65 +1,102 @@
-import concurrent
+import argparse
+import asyncio
 import os
 import re
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-import requests
-requests.packages.urllib3.disable_warnings()
-
-import requests
 from lxml import etree
 import csv
-from ADEMNES.log_db import Attempt, DBSession
+from digscraper.attempts import attempt_row, recording, remaining
+from digscraper.fetch import FetchEngine, FetchFailed, Job
+from digscraper.files import CHUNK_SIZE, write_stream
+from digscraper.packstore import shared_writer
+from digscraper import metrics
+from digscraper.workqueue import DATABASE_URL, WorkQueue, run_queue
+from ADEMNES import log_db
 
 RE_URL = re.compile(r'href=[\'"]([\w:/=?.]+)[\'"]')
 RE_ID = re.compile(r's=(\d+)')
+SITE_URL = "http://www.ademnes.de/db/site.php?s={}"
 
 
-session = DBSession()
+def site_path(site_id):
+    """
+    Where a site's HTML is saved
+    """
+    return os.path.join(os.path.dirname(__file__), 'results', "Site_{}.html".format(site_id))
 
 
-def scrape_details(site_id):
+async def handle_details(site_id, response, attempt, store=None):
     """
-    Download the HTML for a given site ID
+    FetchEngine handler: stream the body of a site page to disk (or into the pack store) and log the attempt
     """
-    session = DBSession()
-    url = "http://www.ademnes.de/db/site.php?s={}".format(site_id)
-    r = requests.get(url, verify=False)
-    log_entry = Attempt(
-        site_id=site_id,
-        url=url,
-        status_code=r.status_code,
-    )
-    session.add(log_entry)
-    session.commit()
-    text = str(r.content, encoding="UTF-8")
-    path = os.path.join(os.path.dirname(__file__), 'results', "Site_{}.html".format(site_id))
-    mkdirp(os.path.dirname(path))
-    print((path, r.status_code, url, text[:10]))
-    with open(path, 'w') as fh:
-        fh.write(text)
-        log_entry.saved = True
-        session.add(log_entry)
-        session.commit()
-    return r.status_code, url
-
-
-def download(max_workers=100):
-    """Pull everything from the site"""
-    site_ids = range(1075)
-    already_tried = [a.site_id for a in session.query(Attempt).filter(Attempt.saved == True).all()]
-    to_scrape = [s for s in site_ids if int(s) not in already_tried]
+    url = SITE_URL.format(site_id)
+    fields = dict(status_code=response.status, attempt=attempt.number, started_at=attempt.started_at)
+    with recording(log_db.attempt_log(), site_id, url, **fields) as row:
+        if store is not None:
+            content = await response.read()
+            row['bytes'] = len(content)
+            # Appending to the pack and flushing its journal is disk I/O
+            await asyncio.get_running_loop().run_in_executor(None, store.put, 'ademnes', site_id, 'site', content)
+        else:
+            row['bytes'] = await write_stream(site_path(site_id), response.content.iter_chunked(CHUNK_SIZE))
+        row['latency'] = attempt.latency
+    return response.status, url
+
+
+def record_failure(failure):
+    """
+    Log a job that the FetchEngine gave up on
+    """
+    url = failure.job.url
+    fields = {'error': type(failure.cause).__name__}
+    if failure.attempt is not None:
+        fields.update(
+            attempt=failure.attempt.number, started_at=failure.attempt.started_at, latency=failure.attempt.latency,
+        )
+    log_db.attempt_log().record(**attempt_row(RE_ID.search(url).group(1), url, **fields))
+
+
+def download(concurrency=1000, per_host=100, store=None, site_ids=range(1075)):
+    """Pull everything from the site. Pass a PackWriter as `store` to save pages into a pack store."""
+    # The anti-join against everything already saved happens in SQL
+    to_scrape = remaining(log_db.engine(), site_ids)
     print("Total {}".format(len(site_ids)))
-    print("Tried {}".format(len(already_tried)))
+    print("Tried {}".format(len(site_ids) - len(to_scrape)))
     print("ToDo {}".format(len(to_scrape)))
     print("Go!")
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(scrape_details, s) for s in to_scrape]
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            print(result)
+    fetcher = FetchEngine(concurrency=concurrency, per_host=per_host, source='ademnes')
+    jobs = (Job(SITE_URL.format(s), partial(handle_details, s, store=store)) for s in to_scrape)
+    fetched = {'fetched': 0, 'failed': 0}
 
+    def on_result(result):
+        # Each failure is logged as it happens rather than once the whole crawl is over
+        if isinstance(result, FetchFailed):
+            record_failure(result)
+            fetched['failed'] += 1
+        else:
+            fetched['fetched'] += 1
+
+    fetcher.run(jobs, on_result=on_result)
+    log_db.attempt_log().flush()
+    print("Fetched {fetched}, failed {failed}".format(**fetched))
+
+
+def download_distributed(database_url=DATABASE_URL, concurrency=1000, per_host=100, store=None, poll=30):
+    """
+    Join a crawl shared between several nodes. Site IDs are claimed in batches from the queue at DIGSCRAPER_DATABASE_URL
+    (the compose `db` service's Postgres, or a local SQLite file when it isn't set) and acked there once saved; a worker
+    that dies has its leases reassigned when they expire.
+    """
+    queue = WorkQueue(database_url, 'ademnes')
+    if not queue.stats():
+        # The first node in fills the queue with whatever it hasn't got yet; it's idempotent if two race to do it
+        print("Queued {}".format(queue.put_many(str(s) for s in remaining(log_db.engine(), range(1075)))))
+    print("Queue {}".format(queue.stats()))
+    fetcher = FetchEngine(concurrency=concurrency, per_host=per_host, source='ademnes')
+    counts = run_queue(queue, fetcher, SITE_URL.format, partial(handle_details, store=store), poll=poll)
+    log_db.attempt_log().flush()
+    print(counts)
 
 
 def mkdirp(dirname):
@@ -67,5 +104,28 @@ def mkdirp(dirname):
         os.mkdir(dirname)
 
 
+def main(argv=None):
+    """
+    Crawl the ADEMNES site database
+    """
+    parser = argparse.ArgumentParser(description="Crawl the ADEMNES site database")
+    parser.add_argument('--distributed', action='store_true',
+                        help="Share the crawl with other nodes through the queue at DIGSCRAPER_DATABASE_URL")
+    parser.add_argument('--metrics-port', type=int, help="Serve crawl metrics for Prometheus on this port")
+    parser.add_argument('--pack', help="Save pages into this pack store instead of one file per site")
+    args = parser.parse_args(argv)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    store = shared_writer(args.pack) if args.pack else None
+    try:
+        if args.distributed:
+            download_distributed(store=store)
+        else:
+            download(store=store)
+    finally:
+        if store is not None:
+            store.close()
+
+
 if __name__ == "__main__":
-    download()
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmarks for the DAAHL parsing hot paths, on synthetic pages (see digscraper.synthetic), so they run anywhere.
+
+    python parse_bench.py --save    # record a baseline on this machine
+    python parse_bench.py           # compare against it; exits 1 if anything got slower
+"""
+import os
+import random
+import tempfile
+
+from digscraper import bench, synthetic
+try:
+    from parser import LxmlSoup, SiteRecord, Soup, multidict
+    from scraper import parse_kml
+except ImportError:
+    from daahl.parser import LxmlSoup, SiteRecord, Soup, multidict
+    from daahl.scraper import parse_kml
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+
+def site_sections(page, backend):
+    record = SiteRecord(page, backend)
+    return record.sections()
+
+
+def list_of_dicts(soup):
+    return soup.find_kv_table('REFERENCE:').list_of_dicts()
+
+
+def multidict_pairs(pairs):
+    md = multidict()
+    for pair in pairs:
+        found = md.send(pair)
+    return found
+
+
+def benchmarks(kml_sites=5000):
+    """
+    {name: function} for every benchmark, with the synthetic pages they work on made up front
+    """
+    rng = random.Random(0)
+    typical = synthetic.daahl_page(353102710, rng=rng)
+    big = synthetic.daahl_page(353002210, names=20, components=60, references=150, notes_words=600, rng=rng)
+    references = synthetic.daahl_page(1, references=500, rng=rng)
+    pairs = [(k, 'value {}'.format(i)) for i in range(5000) for k in ('REFERENCE', 'TITLE', 'SERIAL NAME')]
+
+    kml = os.path.join(tempfile.mkdtemp(), 'sites.kml')
+    with open(kml, 'w', encoding='UTF-8') as fh:
+        fh.write(synthetic.daahl_kml(kml_sites, rng=rng))
+
+    bs4_references = Soup(references, 'lxml')
+    lxml_references = LxmlSoup(references)
+    return {
+        'SiteRecord sections, bs4, typical page': lambda: site_sections(typical, 'bs4'),
+        'SiteRecord sections, lxml, typical page': lambda: site_sections(typical, 'lxml'),
+        'SiteRecord sections, bs4, big page': lambda: site_sections(big, 'bs4'),
+        'SiteRecord sections, lxml, big page': lambda: site_sections(big, 'lxml'),
+        'KeyValueTable.list_of_dicts, bs4, 500 references': lambda: list_of_dicts(bs4_references),
+        'KeyValueTable.list_of_dicts, lxml, 500 references': lambda: list_of_dicts(lxml_references),
+        'multidict, 15000 pairs': lambda: multidict_pairs(pairs),
+        'parse_kml, {} sites'.format(kml_sites): lambda: parse_kml(kml),
+    }
+
+
+if __name__ == "__main__":
+    bench.main(benchmarks(), BASELINE, 'Time the DAAHL parsers on synthetic pages')
@@ -1,321 +1,529 @@
-import os
-import csv
-import uuid
-
-from bs4 import BeautifulSoup
-
-import pandas as pd
-
-def site_records():
-    """
-    Yields a SiteRecord data-parsing object for each of the 47K results, one after another.
-    """
-    for root, dirnames, files in os.walk('results'):
-        for f in files:
-            filename = os.path.join(root, f)
-            with open(filename, encoding='UTF-8') as fh:
-                yield SiteRecord(fh.read())
-
-
-class SiteRecord(object):
-    """
-    A single HTML page about a single archaeological site has data broken into a few different sections
-    """
-    def __init__(self, html_text):
-        self.soup = Soup(html_text, 'lxml')
-        self.site_id = None
-
-    def _kv_section(self, cell_value_keyword):
-        table = self.soup.find_kv_table(cell_value_keyword)
-        data = table.as_dict()
-        data['site_id'] = self.site_id
-        # Return a list of one dict for consistency with the list_section so the collector can always .extend
-        return [data]
-
-    def _list_section(self, cell_value_keyword, kv=True):
-        if kv:
-            table = self.soup.find_kv_table(cell_value_keyword)
-        else:
-            table = self.soup.find_titled_table(cell_value_keyword)
-        data = table.list_of_dicts()
-        for d in data:
-            d['site_id'] = self.site_id
-        return data
-
-    def basic_data(self):
-        """
-        Returns dict of basic site data from the soup, like name/lat/lon
-        """
-        # The basic data is in one of the very common "KEY:  value" tables
-        data = self._kv_section('DAAHL SITE #:')
-        self.site_id = data[0].get('DAAHL SITE #', 'ERR-{}'.format(uuid.uuid4()))
-        data[0]['site_id'] = self.site_id
-        return data
-
-    def alternate_names(self):
-        """
-        Returns a list of alternate names for the site, if any.
-        """
-        return self._list_section('MNEMONIC', kv=False)
-
-    def condition_report(self):
-        """
-        Returns a dict of dated condition report information, if any
-        """
-        # Actually up to three parts:
-        #  1) Condition Report (k:v pairs)
-        #  2) Threats (multidict)
-        #  3) Disturbances (multidict)
-        # Looks like #2 and/or #3 shows up only after #1 does in the document?
-        # I haven't actually seen multiple copies of #1 in the same site yet?
-        return self._kv_section('OVERALL CONDITION:')
-
-    def site_tags(self):
-        """
-        returns dict of tags
-        """
-        return self._list_section('FEATURE TYPE', kv=False)
-
-    def contributor(self):
-        """
-        Returns contributor information
-        """
-        return self._kv_section('CONTRIBUTOR:')
-
-    def references(self):
-        """
-        Bibliographic entry.
-        
-        List of reference/title/serial name dictionaries
-        """
-        return self._list_section('REFERENCE:', kv=True)
-
-
-class Soup(BeautifulSoup):
-    """
-    A BeautifulSoup processing tree with some handy utility methods for pulling out common constructs in these 
-    DAAHL records
-    """
-
-    def find_titled_table(self, cell_value):
-        """
-        Find a regular table with the given cell value. The first row is assumed to be headers, and the rest are values
-        """
-        cell = self.find(lambda x: x.text.strip() == cell_value)
-        if cell is None:
-            return RegularTable(BeautifulSoup("", 'lxml'))
-        table_node = (
-            cell
-            .parent  # <td> element
-            .parent  # <tr> element
-            .parent  # container element
-        )
-        return RegularTable(table_node)
-
-    def find_kv_table(self, cell_value):
-        """
-        Find a table which contains the given cell value
-        """
-        cell = self.find(lambda x: x.text.strip() == cell_value)
-        if cell is None:
-            return KeyValueTable(BeautifulSoup("", 'lxml'))
-        table_node = (
-            cell
-            .parent  # <td> element
-            .parent  # <tr> element
-            .parent  # container element
-        )
-        return KeyValueTable(table_node)
-
-
-class Section(object):
-    """
-    A chunk of HTML that contains related data. Probably in some kind of tabular format
-    """
-
-    def list_of_dicts(self):
-        """
-        All sections should be able to pull data in the format of a list, with zero or more data dictionaries in them
-        """
-        raise NotImplemented()
-
-
-class RegularTable(Section):
-    """
-    A regular table, with a header (more than two columns). Less common, but still present
-    """
-
-    def __init__(self, table_node):
-        self.table_node = table_node
-        rows = list(self.rows())
-        self.header = []
-        self.data_rows = []
-        if rows:
-            self.header = rows[0]
-        if len(rows) > 1:
-            self.data_rows = [r for r in rows[1:] if r]
-
-    def rows(self):
-        """
-        Header row followed by data rows. No title row or empty rows.
-        """
-        rows = []
-        for row in self.table_node.find_all('tr'):
-            rdata = [td.text.strip() for td in row.find_all(['th', 'td'])]
-            if len(rdata) > 1:
-                rows.append(rdata)
-        return rows
-
-    def list_of_dicts(self):
-        return [dict(zip(self.header, d)) for d in self.data_rows]
-
-
-class KeyValueTable(Section):
-    """
-    A common pattern for these pages is a table of key-value paris
-      
-      KEY1: value
-      KEY2: value2
-      KEY3: etc
-      ...
-      
-    Most of the time each key is unique (like above). These should be interpreted as a dictionary.
-     
-    but some sections have a table with repeat keys, like this:
-    
-      TITLE: cat in the hat
-      AUTHOR: Dr. Seuss
-      TITLE: hop on pop
-      AUTHOR: Dr. Seuess
-      
-    These should be interpreted as a list of dictionaris.
-    
-    
-    The HTML will look something like this:
-    
-    <container> <!-- maybe table, maybe div -->
-     <tr class=row1>
-       <td class=fldname style='width: 140px'>DAAHL SITE #:</td>
-       <td class=data>343103707 </td>
-     </tr>
-     <tr class=row1>
-        ...
-     </tr>
-    </container
-    
-    """
-    def __init__(self, table_node):
-        self.table_node = table_node or BeautifulSoup("")
-
-    def kv_pairs(self):
-        """
-        Yields pairs of elements from any two-column rows in the table.
-        """
-        for row in self.table_node.find_all('tr'):
-            # Iterate over all the rows in the table-like construct
-            elements = row.find_all('td')
-            if len(elements) == 2:
-                # If it fits the pattern of two-column table row, store the human-readable text values as a k: v pair
-                k = elements[0].text.strip()
-                v = elements[1].text.strip()
-                # Don't include the colons in the key names, that's silly.
-                k = k.rstrip(':')
-                yield k, v
-
-    def as_dict(self):
-        """
-        For k:v pairs which are not expected to have repeated keys, or when repeated keys should overwrite the earlier
-        copy.
-        """
-        return {k: v for k, v in self.kv_pairs()}
-
-    def list_of_dicts(self):
-        """
-        For k:v pairs which represent multiple copies of the same kind of thing, repeated keys signify that we should 
-        start a new dictionary.
-        """
-        md = multidict()
-        l = []
-        for k, v in self.kv_pairs():
-            l = md.send((k, v))
-        return l
-
-
-def coroutine(function):
-    """
-    Automatically "prime" the coroutine:
-      1) initialize it
-      2) advance it to the first `yield` statement
-    """
-    def primed(*args, **kwargs):
-        f = function(*args, **kwargs)
-        next(f)
-        return f
-    return primed
-
-
-@coroutine
-def multidict():
-    """
-    Coroutine to turn a stream of 2-tuples into a list of dicts. Whenever it sees a duplicate key come in, it starts a 
-    new dict.
-    
-    Yields a reference to the list of dicts it's building up with each .send() call so you can pull data out whenever.
-    """
-    l = [{}]  # List with one empty dict to start
-    while True:
-        k, v = yield l   # Yields a reference to the same list over and over.
-        if k in l[-1].keys():
-            l.append({})
-        l[-1][k] = v
-
-
-def save_csv(fname, data):
-    """
-    Save a list of dictionaries to a given file
-    """
-    dirname = os.path.dirname(__file__)
-    # Frustratingly, we don't actually know the headers beforehand. We have to pull all the data into memory and
-    header = set()
-    for d in data:
-        header |= set(d.keys())
-    with open(os.path.join(dirname, fname), 'w', encoding='UTF-8') as fh:
-        writer = csv.DictWriter(fh, header)
-        writer.writeheader()
-        for row in data:
-            if row:
-                writer.writerow(row)
-
-def save_ws(wb, sheet_name, list_of_dicts):
-    sh = wb._add_sheet(sheet_name)
-
-if __name__ == "__main__":
-    sections = {
-        'basic_data': [],
-        'alternate_names': [],
-        'condition_report': [],
-        'site_tags': [],
-        'contributor': [],
-        'references': [],
-    }
-    for i, site in enumerate(site_records()):
-        # call each section parser, and collect the data from the section (if any)
-        for section, container in sections.items():
-            f = getattr(site, section)
-            container.extend(f())
-
-        # Progress counter
-        if i and not i % 100:
-            print(".", end="", flush=True)
-        if i and not i % 10000:
-            print(i)
-
-    print('Save everything as an excel workbook')
-    panel = pd.Panel()
-    with pd.ExcelWriter('daahl.xlsx') as writer:
-        for section, container in sections.items():
-            df = pd.DataFrame(data=container)
-            if 'site_id' in df:
-                df = df.set_index('site_id')
-            df.to_excel(writer, sheet_name=section)
-        writer.save()
+import argparse
+import inspect
+import os
+import uuid
+from functools import partial
+
+from bs4 import BeautifulSoup
+
+from digscraper import profiling
+from digscraper.packstore import PackReader
+from digscraper.parallel import parallel_map
+from digscraper.parsecache import cached_map, source_version
+from digscraper.sections import SectionExtractor, SectionSpec, climb, find_anchor, parse_html
+
+# Where each section of a site page is, and what kind of table it's in
+SITE_SCHEMA = [
+    # The basic data is in one of the very common "KEY:  value" tables
+    SectionSpec('basic_data', 'DAAHL SITE #:', 'kv'),
+    SectionSpec('alternate_names', 'MNEMONIC', 'titled'),
+    SectionSpec('condition_report', 'OVERALL CONDITION:', 'kv'),
+    SectionSpec('site_tags', 'FEATURE TYPE', 'titled'),
+    SectionSpec('contributor', 'CONTRIBUTOR:', 'kv'),
+    SectionSpec('references', 'REFERENCE:', 'multi-kv'),
+]
+SITE_SPECS = {spec.name: spec for spec in SITE_SCHEMA}
+site_extractor = SectionExtractor(SITE_SCHEMA)
+# Changes whenever the parsing code does, which invalidates the parse cache
+PARSER_VERSION = source_version(__file__, inspect.getfile(SectionExtractor))
+
+
+def site_pages(pack=None, skip=()):
+    """
+    Every saved site page, in a fixed order: file names under the results directory, or locations in the pack store if
+    `pack` is the path to one. See read_page.
+
+    Pages in `skip` (as dedup names them: the path under results, or "<id>/<resource>" in a pack) are left out.
+    """
+    if pack is not None:
+        return [location for (_, site_id, resource), location in PackReader(pack).locations('daahl')
+                if '{}/{}'.format(site_id, resource) not in skip]
+    pages = []
+    for root, dirnames, files in os.walk('results'):
+        for f in files:
+            if f.startswith('.'):
+                continue  # A temporary file from a download that never finished
+            path = os.path.join(root, f)
+            if os.path.relpath(path, 'results') not in skip:
+                pages.append(path)
+    return sorted(pages)
+
+
+_pack_readers = {}
+
+
+def read_page(page, pack=None):
+    """
+    The raw bytes of one of the pages from site_pages
+    """
+    if pack is not None:
+        if pack not in _pack_readers:
+            _pack_readers[pack] = PackReader(pack)  # One per process
+        return _pack_readers[pack].read(*page)
+    with open(page, 'rb') as fh:
+        return fh.read()
+
+
+def site_records(pack=None, backend='bs4'):
+    """
+    Yields a SiteRecord data-parsing object for each of the 47K results, one after another.
+
+    Pages are read from the one-file-per-site results directory, or sequentially from a pack store if `pack` is the
+    path to one. `backend` picks the HTML parser, see SiteRecord.
+    """
+    for page in site_pages(pack):
+        yield SiteRecord(str(read_page(page, pack), encoding='UTF-8'), backend)
+
+
+def parse_page(data, backend='lxml'):
+    """
+    All the sections of a page's bytes, as plain rows that are cheap to send between processes
+    """
+    return SiteRecord(str(data, encoding='UTF-8'), backend).sections()
+
+
+def parse_site(page, pack=None, backend='lxml'):
+    return parse_page(read_page(page, pack), backend)
+
+
+def parse_sites(pack=None, backend='lxml', workers=None, cache=None, stats=None, skip=()):
+    """
+    Yields the sections of every saved site page but those in `skip`, in site_pages order, parsed on `workers` cores
+    (all of them by default).
+
+    With `cache` set to the path of a parse cache, pages this version of the parser has seen before aren't parsed
+    again. Pass a dict as `stats` to get the cache's hit and miss counts.
+    """
+    if cache is None:
+        return parallel_map(partial(parse_site, pack=pack, backend=backend), site_pages(pack, skip), workers)
+    return cached_map(
+        partial(parse_page, backend=backend), partial(read_page, pack=pack), site_pages(pack, skip),
+        cache, '{}-{}'.format(PARSER_VERSION, backend), workers, stats=stats,
+    )
+
+
+def site_names(root='sections'):
+    """
+    Yields (site ID, name) for every site's name and alternate names in the Parquet sections under `root`, to build a
+    names.NameIndex from
+    """
+    from digscraper.sink import read_section
+
+    for section, column in [('basic_data', 'SITE NAME'), ('alternate_names', 'NAME')]:
+        table = read_section(root, section)
+        if column not in table.column_names:
+            continue
+        for site_id, name in zip(table.column('site_id').to_pylist(), table.column(column).to_pylist()):
+            if name and name.strip():
+                yield site_id, name.strip()
+
+
+class SiteRecord(object):
+    """
+    A single HTML page about a single archaeological site has data broken into a few different sections
+
+    `backend` is 'bs4' for the BeautifulSoup tree, or 'lxml' for the much faster lxml.html one. Both give the same data.
+    With lxml, every section in SITE_SCHEMA is read in a single pass over the page, the first time any of them is asked
+    for.
+    """
+    def __init__(self, html_text, backend='bs4'):
+        self.backend = backend
+        with profiling.stage('soup'):
+            if backend == 'lxml':
+                self.soup = LxmlSoup(html_text)
+            else:
+                self.soup = Soup(html_text, 'lxml')
+        self.site_id = None
+        self._sections = None
+
+    def _section(self, name):
+        if self.backend == 'lxml':
+            if self._sections is None:
+                with profiling.stage('extract'):
+                    self._sections = site_extractor.extract(self.soup.root)
+            data = [dict(d) for d in self._sections[name]]
+        else:
+            spec = SITE_SPECS[name]
+            with profiling.stage(name):
+                if spec.kind == 'titled':
+                    data = self.soup.find_titled_table(spec.anchor).list_of_dicts()
+                else:
+                    table = self.soup.find_kv_table(spec.anchor)
+                    # A list of one dict for consistency with the lists, so the collector can always .extend
+                    data = [table.as_dict()] if spec.kind == 'kv' else table.list_of_dicts()
+        for d in data:
+            d['site_id'] = self.site_id
+        return data
+
+    def sections(self):
+        """
+        {section name: list of dicts} for every section in SITE_SCHEMA
+        """
+        data = {'basic_data': self.basic_data()}
+        for spec in SITE_SCHEMA[1:]:
+            data[spec.name] = getattr(self, spec.name)()
+        return data
+
+    def basic_data(self):
+        """
+        Returns dict of basic site data from the soup, like name/lat/lon
+        """
+        data = self._section('basic_data')
+        self.site_id = data[0].get('DAAHL SITE #', 'ERR-{}'.format(uuid.uuid4()))
+        data[0]['site_id'] = self.site_id
+        return data
+
+    def alternate_names(self):
+        """
+        Returns a list of alternate names for the site, if any.
+        """
+        return self._section('alternate_names')
+
+    def names(self):
+        """
+        The site's name and then its alternate names, without blanks or repeats, for name matching
+        """
+        names = [self.basic_data()[0].get('SITE NAME')] + [d.get('NAME') for d in self.alternate_names()]
+        return list(dict.fromkeys(n.strip() for n in names if n and n.strip()))
+
+    def condition_report(self):
+        """
+        Returns a dict of dated condition report information, if any
+        """
+        # Actually up to three parts:
+        #  1) Condition Report (k:v pairs)
+        #  2) Threats (multidict)
+        #  3) Disturbances (multidict)
+        # Looks like #2 and/or #3 shows up only after #1 does in the document?
+        # I haven't actually seen multiple copies of #1 in the same site yet?
+        return self._section('condition_report')
+
+    def site_tags(self):
+        """
+        returns dict of tags
+        """
+        return self._section('site_tags')
+
+    def contributor(self):
+        """
+        Returns contributor information
+        """
+        return self._section('contributor')
+
+    def references(self):
+        """
+        Bibliographic entry.
+        
+        List of reference/title/serial name dictionaries
+        """
+        return self._section('references')
+
+
+class Soup(BeautifulSoup):
+    """
+    A BeautifulSoup processing tree with some handy utility methods for pulling out common constructs in these 
+    DAAHL records
+    """
+
+    def find_titled_table(self, cell_value):
+        """
+        Find a regular table with the given cell value. The first row is assumed to be headers, and the rest are values
+        """
+        with profiling.stage('find_titled_table'):
+            cell = self.find(lambda x: x.text.strip() == cell_value)
+        if cell is None:
+            return RegularTable(BeautifulSoup("", 'lxml'))
+        table_node = (
+            cell
+            .parent  # <td> element
+            .parent  # <tr> element
+            .parent  # container element
+        )
+        return RegularTable(table_node)
+
+    def find_kv_table(self, cell_value):
+        """
+        Find a table which contains the given cell value
+        """
+        with profiling.stage('find_kv_table'):
+            cell = self.find(lambda x: x.text.strip() == cell_value)
+        if cell is None:
+            return KeyValueTable(BeautifulSoup("", 'lxml'))
+        table_node = (
+            cell
+            .parent  # <td> element
+            .parent  # <tr> element
+            .parent  # container element
+        )
+        return KeyValueTable(table_node)
+
+
+class LxmlSoup(object):
+    """
+    The same table-finding utilities as Soup, over an lxml.html tree. Anchor cells are found with XPath, and text is
+    pulled out by libxml2 rather than by walking the tree in Python.
+    """
+
+    def __init__(self, html_text):
+        self.root = parse_html(html_text)
+
+    def find_table_node(self, cell_value):
+        return climb(find_anchor(self.root, cell_value), 3)  # <td>, <tr>, then the container element
+
+    def find_titled_table(self, cell_value):
+        return LxmlRegularTable(self.find_table_node(cell_value))
+
+    def find_kv_table(self, cell_value):
+        return LxmlKeyValueTable(self.find_table_node(cell_value))
+
+
+class Section(object):
+    """
+    A chunk of HTML that contains related data. Probably in some kind of tabular format
+
+    Tree access goes through `find_all` and `text`, so the same section logic works on other trees (see LxmlSection).
+    """
+
+    @staticmethod
+    def find_all(node, names):
+        """
+        Descendants of the node with any of the given tag names, in document order
+        """
+        return node.find_all(names)
+
+    @staticmethod
+    def text(node):
+        return node.text
+
+    def list_of_dicts(self):
+        """
+        All sections should be able to pull data in the format of a list, with zero or more data dictionaries in them
+        """
+        raise NotImplemented()
+
+
+class RegularTable(Section):
+    """
+    A regular table, with a header (more than two columns). Less common, but still present
+    """
+
+    def __init__(self, table_node):
+        self.table_node = table_node
+        with profiling.stage('rows'):
+            rows = list(self.rows())
+        self.header = []
+        self.data_rows = []
+        if rows:
+            self.header = rows[0]
+        if len(rows) > 1:
+            self.data_rows = [r for r in rows[1:] if r]
+
+    def rows(self):
+        """
+        Header row followed by data rows. No title row or empty rows.
+        """
+        rows = []
+        for row in self.find_all(self.table_node, ['tr']):
+            rdata = [self.text(td).strip() for td in self.find_all(row, ['th', 'td'])]
+            if len(rdata) > 1:
+                rows.append(rdata)
+        return rows
+
+    def list_of_dicts(self):
+        return [dict(zip(self.header, d)) for d in self.data_rows]
+
+
+class KeyValueTable(Section):
+    """
+    A common pattern for these pages is a table of key-value paris
+      
+      KEY1: value
+      KEY2: value2
+      KEY3: etc
+      ...
+      
+    Most of the time each key is unique (like above). These should be interpreted as a dictionary.
+     
+    but some sections have a table with repeat keys, like this:
+    
+      TITLE: cat in the hat
+      AUTHOR: Dr. Seuss
+      TITLE: hop on pop
+      AUTHOR: Dr. Seuess
+      
+    These should be interpreted as a list of dictionaris.
+    
+    
+    The HTML will look something like this:
+    
+    <container> <!-- maybe table, maybe div -->
+     <tr class=row1>
+       <td class=fldname style='width: 140px'>DAAHL SITE #:</td>
+       <td class=data>343103707 </td>
+     </tr>
+     <tr class=row1>
+        ...
+     </tr>
+    </container
+    
+    """
+    def __init__(self, table_node):
+        self.table_node = table_node if table_node is not None else BeautifulSoup("", 'lxml')
+
+    def kv_pairs(self):
+        """
+        Yields pairs of elements from any two-column rows in the table.
+        """
+        for row in self.find_all(self.table_node, ['tr']):
+            # Iterate over all the rows in the table-like construct
+            elements = self.find_all(row, ['td'])
+            if len(elements) == 2:
+                # If it fits the pattern of two-column table row, store the human-readable text values as a k: v pair
+                k = self.text(elements[0]).strip()
+                v = self.text(elements[1]).strip()
+                # Don't include the colons in the key names, that's silly.
+                k = k.rstrip(':')
+                yield k, v
+
+    def as_dict(self):
+        """
+        For k:v pairs which are not expected to have repeated keys, or when repeated keys should overwrite the earlier
+        copy.
+        """
+        with profiling.stage('kv_pairs'):
+            return {k: v for k, v in self.kv_pairs()}
+
+    def list_of_dicts(self):
+        """
+        For k:v pairs which represent multiple copies of the same kind of thing, repeated keys signify that we should 
+        start a new dictionary.
+        """
+        with profiling.stage('kv_pairs'):
+            pairs = list(self.kv_pairs())
+        with profiling.stage('multidict'):
+            md = multidict()
+            l = []
+            for k, v in pairs:
+                l = md.send((k, v))
+        return l
+
+
+class LxmlSection(Section):
+    """
+    Section tree access for lxml elements. A missing table is None, and has no rows.
+    """
+
+    @staticmethod
+    def find_all(node, names):
+        if node is None:
+            return []
+        return list(node.iterdescendants(*names))
+
+    @staticmethod
+    def text(node):
+        return node.text_content()
+
+
+class LxmlRegularTable(LxmlSection, RegularTable):
+    pass
+
+
+class LxmlKeyValueTable(LxmlSection, KeyValueTable):
+
+    def __init__(self, table_node):
+        self.table_node = table_node
+
+
+def coroutine(function):
+    """
+    Automatically "prime" the coroutine:
+      1) initialize it
+      2) advance it to the first `yield` statement
+    """
+    def primed(*args, **kwargs):
+        f = function(*args, **kwargs)
+        next(f)
+        return f
+    return primed
+
+
+@coroutine
+def multidict():
+    """
+    Coroutine to turn a stream of 2-tuples into a list of dicts. Whenever it sees a duplicate key come in, it starts a 
+    new dict.
+    
+    Yields a reference to the list of dicts it's building up with each .send() call so you can pull data out whenever.
+    """
+    l = [{}]  # List with one empty dict to start
+    while True:
+        k, v = yield l   # Yields a reference to the same list over and over.
+        if k in l[-1].keys():
+            l.append({})
+        l[-1][k] = v
+
+
+def main(argv=None):
+    """
+    Parse every saved DAAHL site page into Parquet, then export it
+    """
+    from digscraper import dedup
+    from digscraper.sink import SectionSink, export_csv, export_xlsx
+
+    parser = argparse.ArgumentParser(description='Parse every saved DAAHL site page into Parquet, then daahl.xlsx')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes to parse with')
+    parser.add_argument('--pack', help='Read pages from this pack store instead of the results directory')
+    parser.add_argument(
+        '--cache', default='parse_cache.sqlite3', help="Parse cache, so unchanged pages aren't re-parsed ('' for none)",
+    )
+    parser.add_argument('--out', default='sections', help='Directory for the Parquet output, one folder per section')
+    parser.add_argument('--xlsx', default='daahl.xlsx', help="Workbook to export afterwards ('' for none)")
+    parser.add_argument('--csv', help='Directory to export one CSV per section into afterwards')
+    parser.add_argument('--backend', default='lxml', choices=['lxml', 'bs4'], help='HTML parser, see SiteRecord')
+    parser.add_argument('--page-index', default=dedup.DEFAULT_INDEX,
+                        help="Skip the pages `digscraper check daahl` found empty or a template ('' to parse them all)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    skip = dedup.skipped_pages('daahl', args.page_index)
+    if skip:
+        print('Skipping {} empty or template pages'.format(len(skip)))
+
+    stats = {}
+    with profiling.profiled(args) as profiler:
+        with SectionSink(args.out, overwrite=True) as sink:  # Every page is parsed again
+            if profiler is not None:
+                # One page at a time, in this process, and never from the cache, so every page's time is seen
+                sites = profiler.map(
+                    partial(parse_page, backend=args.backend), site_pages(args.pack, skip),
+                    partial(read_page, pack=args.pack),
+                )
+            else:
+                sites = parse_sites(
+                    pack=args.pack, backend=args.backend, workers=args.workers, cache=args.cache or None, stats=stats,
+                    skip=skip,
+                )
+            for i, site in enumerate(sites):
+                # stream the data from every section (if any) out to disk
+                with profiling.stage('write_sections'):
+                    sink.write_sections(site)
+
+                # Progress counter
+                if i and not i % 100:
+                    print(".", end="", flush=True)
+                if i and not i % 10000:
+                    print(i)
+
+        if stats:
+            print('Parsed {misses} pages, {hits} unchanged'.format(**stats))
+        if args.xlsx:
+            print('Save everything as an excel workbook')
+            with profiling.stage('export_xlsx'):
+                export_xlsx(args.out, args.xlsx, [spec.name for spec in SITE_SCHEMA])
+        if args.csv:
+            with profiling.stage('export_csv'):
+                export_csv(args.out, args.csv, [spec.name for spec in SITE_SCHEMA])
+
+
+if __name__ == "__main__":
+    main()
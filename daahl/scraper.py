@@ -1,104 +1,252 @@
-import concurrent
-import os
-import re
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor
-
-import requests
-requests.packages.urllib3.disable_warnings()
-
-import requests
-from lxml import etree
-import csv
-try:
-    from log_db import Attempt, DBSession
-except ImportError:
-    from daahl.log_db import Attempt, DBSession
-
-RE_URL = re.compile(r'href=[\'"]([\w:/=?.]+)[\'"]')
-RE_ID = re.compile(r'SiteNo=(\d+)')
-
-
-session = DBSession()
-
-def parse_kml(filename):
-    """
-    Returns a dict of site name, ID, URL, and coordinates out of the KML file
-    """
-    with open(filename, encoding='UTF-8', errors='replace') as fh:
-        contents = fh.read()
-        xml = etree.fromstring(bytes(contents, encoding='UTF-8'))
-    sites = []
-    for place in xml.xpath('//Placemark'):
-        description = place.xpath('description')[0].text
-        url = RE_URL.search(description).group(1)
-        site_id = RE_ID.search(url).group(1)
-        sites.append({
-            'name': place.xpath('name')[0].text,
-            'coords': place.xpath('Point/coordinates')[0].text,
-            'url': url,
-            'id': site_id,
-         })
-    return sites
-
-
-def extract_site_data(kml_file):
-    """
-    Saves the contents of a KML file as a .csv
-    """
-    sites = parse_kml(kml_file)
-    with open('site_list.csv', 'w') as fh:
-        writer = csv.DictWriter(fh, fieldnames=['id', 'name', 'coords', 'url'])
-        writer.writeheader()
-        [writer.writerow(s) for s in sites]
-    return sites
-
-
-def scrape_details(site_id):
-    """
-    Download the HTML for a given site ID
-    """
-    session = DBSession()
-    url = "http://daahl.ucsd.edu/DAAHL/SitesBrowseView.php?SiteNo={}".format(site_id)
-    r = requests.get(url, verify=False)
-    log_entry = Attempt(
-        site_id=site_id,
-        url=url,
-        status_code=r.status_code,
-    )
-    session.add(log_entry)
-    session.commit()
-    dirname = site_id[-2:]  # Kinda like git -- split the saved files into folders
-    mkdirp(dirname)
-    print((r.status_code, url))
-    with open(os.path.join('results', dirname, "Site_{}.html".format(site_id)), 'w') as fh:
-        fh.write(str(r.content, encoding='UTF-8'))
-        log_entry.saved = True
-        session.add(log_entry)
-        session.commit()
-    return r.status_code, url
-
-
-def download(max_workers=100):
-    """Pull everything from the site"""
-    sites = extract_site_data('results/ucsd.xml')
-    already_tried = [a.site_id for a in session.query(Attempt).filter(Attempt.saved == True).all()]
-    to_scrape = [s for s in sites if int(s['id']) not in already_tried]
-    print("Total {}".format(len(sites)))
-    print("Tried {}".format(len(already_tried)))
-    print("ToDo {}".format(len(to_scrape)))
-    print("Go!")
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(scrape_details, s['id']) for s in to_scrape]
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            print(result)
-
-
-def mkdirp(dirname):
-    if not os.path.exists(dirname):
-        os.mkdir(dirname)
-
-
-if __name__ == "__main__":
-    pass
+import argparse
+import asyncio
+import os
+import re
+from functools import partial
+from itertools import islice
+
+from lxml import etree
+import csv
+from digscraper.attempts import attempt_row, recording, remaining
+from digscraper.fetch import FetchEngine, FetchFailed, Job
+from digscraper.files import CHUNK_SIZE, write_chunks, write_stream
+from digscraper.packstore import shared_writer
+from digscraper.pipeline import Pipeline
+from digscraper import geometry, metrics
+from digscraper.workqueue import DATABASE_URL, WorkQueue, run_queue
+try:
+    import log_db
+    from parser import parse_page
+except ImportError:
+    from daahl import log_db
+    from daahl.parser import parse_page
+
+RE_URL = re.compile(r'href=[\'"]([\w:/=?.]+)[\'"]')
+RE_ID = re.compile(r'SiteNo=(\d+)')
+SITE_URL = "http://daahl.ucsd.edu/DAAHL/SitesBrowseView.php?SiteNo={}"
+
+
+def iter_kml(filename):
+    """
+    Yields a dict of site name, ID, URL, and coordinates for each Placemark in the KML file, as the file is read.
+
+    Each Placemark is cleared once it's been read, along with anything before it, so memory use doesn't grow with the
+    size of the file.
+    """
+    # {*} matches the tag with or without the KML namespace
+    for _, place in etree.iterparse(filename, events=('end',), tag='{*}Placemark', recover=True):
+        url = RE_URL.search(place.findtext('{*}description')).group(1)
+        yield {
+            'name': place.findtext('{*}name'),
+            'coords': place.findtext('{*}Point/{*}coordinates'),
+            'url': url,
+            'id': RE_ID.search(url).group(1),
+        }
+        place.clear()
+        while place.getprevious() is not None:
+            del place.getparent()[0]
+
+
+def parse_kml(filename):
+    """
+    Returns a list of dicts of site name, ID, URL, and coordinates out of the KML file
+    """
+    return list(iter_kml(filename))
+
+
+def kml_coordinates(filename):
+    """
+    (SiteCoordinates, site IDs) for every Placemark in the KML file, parsed in one go
+    """
+    ids = []
+    coords = []
+    for site in iter_kml(filename):
+        ids.append(site['id'])
+        coords.append(site['coords'])
+    return geometry.parse_kml(coords), ids
+
+
+def export_coordinates(kml_file, path='site_coordinates.npz'):
+    """
+    Saves every site's coordinates as NumPy arrays, for loading with SiteCoordinates.load
+    """
+    sites, ids = kml_coordinates(kml_file)
+    sites.save(path, ids=ids)
+    return sites, ids
+
+
+def extract_site_data(kml_file):
+    """
+    Saves the contents of a KML file as a .csv, yielding each site once it's been written
+    """
+    with open('site_list.csv', 'w') as fh:
+        writer = csv.DictWriter(fh, fieldnames=['id', 'name', 'coords', 'url'])
+        writer.writeheader()
+        for site in iter_kml(kml_file):
+            writer.writerow(site)
+            yield site
+
+
+def sites_to_scrape(sites, batch=1000, counts=None):
+    """
+    The sites that have never been saved, checked against the attempts table a batch at a time so the first ones are
+    ready before the rest of the KML has been read. Pass a dict as `counts` to have it filled in with totals.
+    """
+    counts = counts if counts is not None else {}
+    counts.update(total=0, to_do=0)
+    sites = iter(sites)
+    while True:
+        chunk = list(islice(sites, batch))
+        if not chunk:
+            return
+        to_do = set(remaining(log_db.engine(), [s['id'] for s in chunk]))
+        counts['total'] += len(chunk)
+        counts['to_do'] += len(to_do)
+        for site in chunk:
+            if int(site['id']) in to_do:
+                yield site
+
+
+def site_path(site_id):
+    """
+    Where a site's HTML is saved. Kinda like git -- split the saved files into folders by the last two digits.
+    """
+    return os.path.join('results', site_id[-2:], "Site_{}.html".format(site_id))
+
+
+async def handle_details(site_id, response, attempt, store=None, pipeline=None):
+    """
+    FetchEngine handler: stream the body of a site page to disk (or into the pack store) and log the attempt.
+
+    With a `pipeline`, the body is also handed on to be parsed straight away.
+    """
+    url = SITE_URL.format(site_id)
+    fields = dict(status_code=response.status, attempt=attempt.number, started_at=attempt.started_at)
+    with recording(log_db.attempt_log(), site_id, url, **fields) as row:
+        if store is not None or pipeline is not None:
+            content = await response.read()
+            row['bytes'] = len(content)
+            # Both end up in a write and a flush or fsync, which mustn't hold up the event loop
+            if store is not None:
+                await asyncio.get_running_loop().run_in_executor(None, store.put, 'daahl', site_id, 'site', content)
+            else:
+                await asyncio.get_running_loop().run_in_executor(None, write_chunks, site_path(site_id), [content])
+        else:
+            row['bytes'] = await write_stream(site_path(site_id), response.content.iter_chunked(CHUNK_SIZE))
+        row['latency'] = attempt.latency
+    if pipeline is not None and response.status < 400:
+        await pipeline.submit_async(content)
+    return response.status, url
+
+
+def record_failure(failure):
+    """
+    Log a job that the FetchEngine gave up on
+    """
+    url = failure.job.url
+    fields = {'error': type(failure.cause).__name__}
+    if failure.attempt is not None:
+        fields.update(
+            attempt=failure.attempt.number, started_at=failure.attempt.started_at, latency=failure.attempt.latency,
+        )
+    log_db.attempt_log().record(**attempt_row(RE_ID.search(url).group(1), url, **fields))
+
+
+def download(concurrency=1000, per_host=100, store=None, pipeline=None):
+    """
+    Pull everything from the site. Pass a PackWriter as `store` to save pages into a pack store, and a Pipeline as
+    `pipeline` to parse them as they arrive (see crawl_and_parse).
+    """
+    # Fetching starts with the first batch of sites, while the rest of the KML is still being parsed
+    counts = {}
+    to_scrape = sites_to_scrape(extract_site_data('results/ucsd.xml'), counts=counts)
+    print("Go!")
+    fetcher = FetchEngine(concurrency=concurrency, per_host=per_host, source='daahl')
+    jobs = (
+        Job(SITE_URL.format(s['id']), partial(handle_details, s['id'], store=store, pipeline=pipeline))
+        for s in to_scrape
+    )
+    fetched = {'fetched': 0, 'failed': 0}
+
+    def on_result(result):
+        # Each failure is logged as it happens rather than once the whole crawl is over
+        if isinstance(result, FetchFailed):
+            record_failure(result)
+            fetched['failed'] += 1
+        else:
+            fetched['fetched'] += 1
+
+    fetcher.run(jobs, on_result=on_result)
+    log_db.attempt_log().flush()
+    print("Total {}".format(counts['total']))
+    print("Tried {}".format(counts['total'] - counts['to_do']))
+    print("ToDo {}".format(counts['to_do']))
+    print("Fetched {fetched}, failed {failed}".format(**fetched))
+
+
+def download_distributed(database_url=DATABASE_URL, concurrency=1000, per_host=100, store=None, poll=30):
+    """
+    Join a crawl shared between several nodes. Site IDs are claimed in batches from the queue at DIGSCRAPER_DATABASE_URL
+    (the compose `db` service's Postgres, or a local SQLite file when it isn't set) and acked there once saved; a worker
+    that dies has its leases reassigned when they expire.
+    """
+    queue = WorkQueue(database_url, 'daahl')
+    if not queue.stats():
+        # The first node in fills the queue with whatever it hasn't got yet; it's idempotent if two race to do it
+        print("Queued {}".format(queue.put_many(s['id'] for s in sites_to_scrape(extract_site_data('results/ucsd.xml')))))
+    print("Queue {}".format(queue.stats()))
+    fetcher = FetchEngine(concurrency=concurrency, per_host=per_host, source='daahl')
+    counts = run_queue(queue, fetcher, SITE_URL.format, partial(handle_details, store=store), poll=poll)
+    log_db.attempt_log().flush()
+    print(counts)
+
+
+def crawl_and_parse(out='sections', workers=None, concurrency=1000, per_host=100, store=None):
+    """
+    Download everything that's left, parsing each page on a process pool as soon as it has been saved, and streaming
+    the sections into Parquet under `out`. The sections are ready shortly after the last page is.
+    """
+    # pyarrow is slow to import, and only needed when crawling straight into Parquet
+    from digscraper.sink import SectionSink
+
+    sink = SectionSink(out)
+    with Pipeline(partial(parse_page, backend='lxml'), sink, workers=workers) as pipeline:
+        download(concurrency=concurrency, per_host=per_host, store=store, pipeline=pipeline)
+    print(pipeline.counts)
+
+
+def mkdirp(dirname):
+    if not os.path.exists(dirname):
+        os.mkdir(dirname)
+
+
+def main(argv=None):
+    """
+    Crawl the DAAHL site records listed in results/ucsd.xml
+    """
+    parser = argparse.ArgumentParser(description="Crawl the DAAHL site records listed in results/ucsd.xml")
+    parser.add_argument('--distributed', action='store_true',
+                        help="Share the crawl with other nodes through the queue at DIGSCRAPER_DATABASE_URL")
+    parser.add_argument('--parse', action='store_true', help="Parse pages into Parquet under sections/ as they arrive")
+    parser.add_argument('--concurrency', type=int, default=1000, help="Requests in flight at once")
+    parser.add_argument('--per-host', type=int, default=100, help="Requests in flight to the one host at once")
+    parser.add_argument('--metrics-port', type=int, help="Serve crawl metrics for Prometheus on this port")
+    parser.add_argument('--pack', help="Save pages into this pack store instead of one file per site")
+    args = parser.parse_args(argv)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    store = shared_writer(args.pack) if args.pack else None
+    try:
+        if args.distributed:
+            download_distributed(concurrency=args.concurrency, per_host=args.per_host, store=store)
+        elif args.parse:
+            crawl_and_parse(concurrency=args.concurrency, per_host=args.per_host, store=store)
+        else:
+            download(concurrency=args.concurrency, per_host=args.per_host, store=store)
+    finally:
+        if store is not None:
+            store.close()
+
+
+if __name__ == "__main__":
+    main()
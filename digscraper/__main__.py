@@ -0,0 +1,3 @@
+from digscraper.cli import main
+
+main()
@@ -0,0 +1,116 @@
+"""
+Write-behind logging for crawl attempts.
+
+Workers only put a dict on a queue; a single writer thread drains it and inserts the rows in batched transactions, so
+the crawl never waits on the SQLite database lock.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+def enable_wal(engine):
+    """
+    Put every connection from a SQLite engine into WAL mode, so readers (status queries, resume planning) don't block
+    the writer and vice versa.
+    """
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+    return engine
+
+
+class AttemptLog(object):
+    """
+    Queue of rows for `model`'s table, flushed by one background thread.
+
+    A batch is written when `batch_size` rows are waiting, or `flush_interval` seconds after the first of them arrived,
+    whichever comes first. Anything still queued is written when the interpreter exits.
+    """
+    _STOP = object()
+
+    def __init__(self, engine, model, batch_size=500, flush_interval=1.0):
+        self.engine = engine
+        self.table = model.__table__
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def record(self, **row):
+        """
+        Enqueue one row. Returns immediately.
+        """
+        self._start()
+        self._queue.put(row)
+
+    def flush(self):
+        """
+        Block until everything recorded so far has been committed
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """
+        Flush and stop the writer thread
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(self._STOP)
+            thread.join()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='attempt-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = [] if first is self._STOP else [first]
+            stop = first is self._STOP
+            # Gather up a batch: whatever is already waiting, plus anything that arrives within the flush interval of
+            # the first row, however steadily the rows keep coming
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is self._STOP:
+                    stop = True
+                else:
+                    batch.append(row)
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                logger.exception('Dropped a batch of %d attempt rows', len(batch))
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        # Rows can carry different subsets of columns; group them so each executemany has one consistent shape
+        shapes = {}
+        for row in batch:
+            shapes.setdefault(tuple(sorted(row)), []).append(row)
+        with self.engine.begin() as conn:
+            for rows in shapes.values():
+                conn.execute(self.table.insert(), rows)
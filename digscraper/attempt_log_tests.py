@@ -0,0 +1,79 @@
+"""
+The write-behind logger should commit every recorded row, from any number of threads, in a handful of transactions.
+"""
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from sqlalchemy import Boolean, Column, Integer, String, create_engine, event, func, select
+from sqlalchemy.orm import declarative_base
+
+from digscraper.attempt_log import AttemptLog, enable_wal
+
+Base = declarative_base()
+
+
+class Row(Base):
+    __tablename__ = 'rows'
+    id = Column(Integer, primary_key=True)
+    site_id = Column(Integer, nullable=False)
+    url = Column(String(250), nullable=False)
+    saved = Column(Boolean, default=False)
+
+
+class AttemptLogTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.engine = enable_wal(create_engine('sqlite:///' + os.path.join(self.dir.name, 'log.sqlite3')))
+        Base.metadata.create_all(self.engine)
+        self.commits = 0
+
+        @event.listens_for(self.engine, 'commit')
+        def count(conn):
+            self.commits += 1
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.dir.cleanup()
+
+    def count(self):
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(Row.__table__)).scalar()
+
+    def test_batches_rows_from_many_threads(self):
+        log = AttemptLog(self.engine, Row, batch_size=1000, flush_interval=0.5)
+
+        def work(start):
+            for i in range(start, start + 100):
+                log.record(site_id=i, url='http://example.com/{}'.format(i), saved=bool(i % 2))
+
+        threads = [threading.Thread(target=work, args=(n * 100,)) for n in range(20)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        log.flush()
+        self.assertEqual(self.count(), 2000)
+        self.assertLess(self.commits, 10)
+        log.close()
+
+    def test_close_writes_pending_rows(self):
+        log = AttemptLog(self.engine, Row, flush_interval=60)
+        log.record(site_id=1, url='http://example.com/1')
+        log.close()
+        self.assertEqual(self.count(), 1)
+
+    def test_trickle_is_committed_on_time(self):
+        log = AttemptLog(self.engine, Row, flush_interval=0.2)
+        for i in range(20):
+            log.record(site_id=i, url='http://example.com/{}'.format(i))
+            time.sleep(0.05)
+        # A row every 50ms never leaves the writer waiting a whole flush interval, but the first batches are in
+        self.assertGreater(self.count(), 0)
+        log.close()
+        self.assertEqual(self.count(), 20)
+
+    def test_wal_mode(self):
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql('PRAGMA journal_mode').scalar(), 'wal')
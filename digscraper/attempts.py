@@ -0,0 +1,171 @@
+"""
+The attempts table shared by the per-source crawl logs, and the questions we ask of it.
+
+Each source keeps its own database (see */log_db.py), but they all use this schema. Statistics are computed inside SQL,
+so planning a resume or checking crawl health never pulls the whole log into Python.
+"""
+import datetime as dt
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, String, inspect, text
+from sqlalchemy.orm import declarative_base
+
+Base = declarative_base()
+
+
+class Attempt(Base):
+    """
+    One try at fetching one page
+    """
+    __tablename__ = 'attempts'
+    id = Column(Integer, primary_key=True)
+    site_id = Column(Integer, nullable=False)
+    url = Column(String(250), nullable=False)
+    host = Column(String(100))
+    status_code = Column(Integer)  # NULL when the request never got a response
+    saved = Column(Boolean, default=False, nullable=False)
+    attempt = Column(Integer, default=1, nullable=False)  # 1 for the first try, 2 for the first retry, ...
+    error = Column(String(100))  # Exception class name, if the attempt failed
+    latency = Column(Float)  # seconds, request start until the body was read
+    bytes = Column(Integer)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_attempts_site_saved', 'site_id', 'saved'),
+        Index('ix_attempts_host_latency', 'host', 'latency'),
+        Index('ix_attempts_started_status', 'started_at', 'status_code'),
+    )
+
+
+def utcnow():
+    return dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+
+def attempt_row(site_id, url, **fields):
+    """
+    Build a dict for AttemptLog.record(), filling in the host and finish time
+    """
+    row = {'site_id': site_id, 'url': url, 'host': urlsplit(url).netloc, 'finished_at': utcnow()}
+    row.update(fields)
+    return row
+
+
+@contextmanager
+def recording(log, site_id, url, **fields):
+    """
+    Record one attempt in an AttemptLog when the block exits: saved if the block finished and the status code (if
+    any) isn't an error, or not saved with the error class if it raised. An error page that was written out is not
+    saved, so remaining() still lists its site. The block can fill in more columns through the yielded row.
+
+        with recording(attempt_log, site_id, url, status_code=200) as row:
+            row['bytes'] = write_chunks(path, chunks)
+    """
+    row = attempt_row(site_id, url, saved=False, **fields)
+    try:
+        yield row
+        row['saved'] = row.get('status_code') is None or row['status_code'] < 400
+    except Exception as exc:
+        row['error'] = type(exc).__name__
+        raise
+    finally:
+        row['finished_at'] = utcnow()
+        log.record(**row)
+
+
+def create_schema(engine):
+    """
+    Create the attempts table and its indexes, carrying over rows from the old `person` table the first time
+    """
+    Base.metadata.create_all(engine)
+    if inspect(engine).has_table('person'):
+        with engine.begin() as conn:
+            empty = conn.execute(text('SELECT NOT EXISTS (SELECT 1 FROM attempts)')).scalar()
+            if empty:
+                conn.execute(text(
+                    'INSERT INTO attempts (site_id, url, host, status_code, saved, attempt) '
+                    'SELECT site_id, url, NULL, status_code, COALESCE(saved, 0), 1 FROM person'
+                ))
+
+
+def saved_ids(engine):
+    """
+    Set of every site ID that has been saved at least once
+    """
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text('SELECT DISTINCT site_id FROM attempts WHERE saved'))}
+
+
+def remaining(engine, site_ids):
+    """
+    Which of the given site IDs have never been saved, in the order given.
+
+    The candidates go into a temporary table and are anti-joined against the (site_id, saved) index.
+    """
+    site_ids = [int(s) for s in site_ids]
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TEMP TABLE IF NOT EXISTS candidates (pos INTEGER PRIMARY KEY, site_id INTEGER)'))
+        conn.execute(text('DELETE FROM candidates'))
+        conn.execute(
+            text('INSERT INTO candidates (pos, site_id) VALUES (:pos, :site_id)'),
+            [{'pos': pos, 'site_id': site_id} for pos, site_id in enumerate(site_ids)],
+        )
+        rows = conn.execute(text(
+            'SELECT c.site_id FROM candidates c '
+            'WHERE NOT EXISTS (SELECT 1 FROM attempts a WHERE a.site_id = c.site_id AND a.saved) '
+            'ORDER BY c.pos'
+        ))
+        return [row[0] for row in rows]
+
+
+def summary(engine):
+    """
+    {'attempts': n, 'sites_saved': n, 'unsaved': n, 'last_finished': time or None} over the whole log
+    """
+    with engine.connect() as conn:
+        row = conn.execute(text(
+            'SELECT COUNT(*), COUNT(DISTINCT CASE WHEN saved THEN site_id END),'
+            '  COALESCE(SUM(CASE WHEN saved THEN 0 ELSE 1 END), 0), MAX(finished_at) '
+            'FROM attempts'
+        )).one()
+    return dict(zip(['attempts', 'sites_saved', 'unsaved', 'last_finished'], row))
+
+
+def latency_by_host(engine, percentiles=(0.5, 0.95)):
+    """
+    {host: {'count': n, 0.5: p50, 0.95: p95, ...}} of request latency, in seconds.
+
+    Nearest-rank percentiles: rows are numbered by latency within each host, and the p-th percentile is the first
+    latency whose rank reaches p * count.
+    """
+    columns = ', '.join(
+        'MIN(CASE WHEN rn >= :p{0} * total THEN latency END) AS p{0}'.format(i) for i in range(len(percentiles))
+    )
+    query = text(
+        'SELECT host, COUNT(*) AS total, {} FROM ('
+        '  SELECT host, latency,'
+        '    ROW_NUMBER() OVER (PARTITION BY host ORDER BY latency) AS rn,'
+        '    COUNT(*) OVER (PARTITION BY host) AS total'
+        '  FROM attempts WHERE latency IS NOT NULL'
+        ') GROUP BY host ORDER BY host'.format(columns)
+    )
+    params = {'p{}'.format(i): p for i, p in enumerate(percentiles)}
+    stats = {}
+    with engine.connect() as conn:
+        for row in conn.execute(query, params):
+            stats[row[0]] = dict(zip(percentiles, row[2:]), count=row[1])
+    return stats
+
+
+def error_rate_by_hour(engine):
+    """
+    List of (hour, attempts, errors, error rate) tuples. An error is an exception or a status code of 400 or above.
+    """
+    query = text(
+        "SELECT strftime('%Y-%m-%d %H:00', started_at) AS hour, COUNT(*) AS total,"
+        "  SUM(CASE WHEN error IS NOT NULL OR status_code >= 400 THEN 1 ELSE 0 END) AS errors "
+        "FROM attempts WHERE started_at IS NOT NULL GROUP BY hour ORDER BY hour"
+    )
+    with engine.connect() as conn:
+        return [(hour, total, errors, float(errors) / total) for hour, total, errors in conn.execute(query)]
@@ -0,0 +1,73 @@
+"""
+Crawl statistics computed in SQL should match what we'd work out by hand.
+"""
+import datetime as dt
+from unittest import TestCase
+
+from sqlalchemy import create_engine, text
+
+from digscraper import attempts
+
+
+class AttemptsQueryTest(TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        attempts.create_schema(self.engine)
+        hour = dt.datetime(2020, 1, 1, 10, 15)
+        rows = []
+        for i in range(1, 101):
+            rows.append(attempts.attempt_row(
+                i, 'http://a.example/{}'.format(i), status_code=200, saved=True, latency=i / 100.0, started_at=hour,
+            ))
+        for i in range(1, 21):
+            rows.append(attempts.attempt_row(
+                200 + i, 'http://b.example/{}'.format(i), status_code=500 if i % 2 else 200, saved=not i % 2,
+                latency=1.0, started_at=hour + dt.timedelta(hours=1),
+            ))
+        with self.engine.begin() as conn:
+            conn.execute(attempts.Attempt.__table__.insert(), rows)
+
+    def test_remaining_keeps_order(self):
+        self.assertEqual(attempts.remaining(self.engine, [250, 5, 201, 202, 1000, 3]), [250, 201, 1000])
+
+    def test_error_pages_are_not_saved(self):
+        engine = self.engine
+
+        class Log(object):
+            def record(self, **row):
+                with engine.begin() as conn:
+                    conn.execute(attempts.Attempt.__table__.insert(), [row])
+
+        with attempts.recording(Log(), 3000, 'http://a.example/3000', status_code=503):
+            pass
+        with attempts.recording(Log(), 3001, 'http://a.example/3001', status_code=200):
+            pass
+        self.assertEqual(attempts.remaining(self.engine, [3000, 3001]), [3000])
+
+    def test_latency_percentiles(self):
+        stats = attempts.latency_by_host(self.engine)
+        self.assertEqual(stats['a.example'], {'count': 100, 0.5: 0.5, 0.95: 0.95})
+        self.assertEqual(stats['b.example'][0.95], 1.0)
+
+    def test_error_rate_by_hour(self):
+        self.assertEqual(attempts.error_rate_by_hour(self.engine), [
+            ('2020-01-01 10:00', 100, 0, 0.0),
+            ('2020-01-01 11:00', 20, 10, 0.5),
+        ])
+
+    def test_migrates_legacy_table(self):
+        engine = create_engine('sqlite://')
+        with engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE person (id INTEGER PRIMARY KEY, site_id INTEGER, url VARCHAR(250), '
+                'status_code INTEGER, saved BOOLEAN)'
+            ))
+            conn.execute(text("INSERT INTO person (site_id, url, status_code, saved) VALUES (7, 'u', 200, 1)"))
+        attempts.create_schema(engine)
+        self.assertEqual(attempts.saved_ids(engine), {7})
+
+    def test_summary(self):
+        summary = attempts.summary(self.engine)
+        self.assertEqual((summary['attempts'], summary['sites_saved'], summary['unsaved']), (120, 110, 10))
+        self.assertIsNotNone(summary['last_finished'])
@@ -0,0 +1,113 @@
+"""
+A small benchmark runner: time named functions, save the timings as a baseline, and compare later runs against it.
+
+    BENCHMARKS = {'parse page': lambda: parse(page), ...}
+    if __name__ == '__main__':
+        bench.main(BENCHMARKS, 'bench_baseline.json')
+
+Each benchmark is timed like timeit does it: enough calls per round to take a fair fraction of a second, several rounds,
+and the fastest round kept, since anything slower than that is noise from the rest of the machine. Baselines are JSON
+of {name: seconds per call}, so they're easy to diff and to keep per machine.
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+
+def measure(function, repeat=5, min_time=0.2):
+    """
+    {'seconds': best seconds per call, 'calls': calls per round} for `function()`
+    """
+    timer = timeit.Timer(function)
+    calls, taken = timer.autorange()
+    if taken < min_time:
+        calls = max(int(calls * min_time / max(taken, 1e-9)), 1)
+    rounds = timer.repeat(repeat=repeat, number=calls)
+    return {'seconds': min(rounds) / calls, 'calls': calls}
+
+
+def run(benchmarks, repeat=5, only=None, min_time=0.2):
+    """
+    {name: measure(...)} for each benchmark (or just the ones whose names contain `only`)
+    """
+    results = {}
+    for name, function in benchmarks.items():
+        if only and only not in name:
+            continue
+        results[name] = measure(function, repeat, min_time)
+    return results
+
+
+def save_baseline(results, path, previous=None):
+    """
+    Write the timings to `path`, on top of the `previous` baseline's timings for anything that wasn't run
+    """
+    seconds = dict(previous or {})
+    seconds.update((name, result['seconds']) for name, result in results.items())
+    baseline = {'python': platform.python_version(), 'machine': platform.machine(), 'seconds': seconds}
+    with open(path, 'w') as fh:
+        json.dump(baseline, fh, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as fh:
+        return json.load(fh)['seconds']
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    [(name, seconds, baseline seconds or None, ratio or None, regressed)] for each result, where regressed means more
+    than `tolerance` slower than the baseline
+    """
+    rows = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        ratio = result['seconds'] / before if before else None
+        rows.append((name, result['seconds'], before, ratio, ratio is not None and ratio > 1 + tolerance))
+    return rows
+
+
+def human(seconds):
+    for unit, scale in [('s', 1), ('ms', 1e-3), ('us', 1e-6)]:
+        if seconds >= scale:
+            return '{:.3g} {}'.format(seconds / scale, unit)
+    return '{:.3g} ns'.format(seconds / 1e-9)
+
+
+def report(rows, out=sys.stdout):
+    width = max([len(row[0]) for row in rows] + [9])
+    print('{:<{}}  {:>10}  {:>10}  {:>7}'.format('benchmark', width, 'time', 'baseline', 'change'), file=out)
+    for name, seconds, before, ratio, regressed in rows:
+        print('{:<{}}  {:>10}  {:>10}  {:>7}{}'.format(
+            name, width, human(seconds), human(before) if before else '-',
+            '{:+.0%}'.format(ratio - 1) if ratio is not None else '-', '  SLOWER' if regressed else '',
+        ), file=out)
+
+
+def main(benchmarks, baseline, description='Run the benchmarks and compare them with the saved baseline'):
+    """
+    Command line entry point for a module of benchmarks. Exits with status 1 if anything is slower than the baseline
+    by more than the tolerance.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--baseline', default=baseline, help='Baseline file to compare against or save to')
+    parser.add_argument('--save', action='store_true', help='Save these timings as the new baseline')
+    parser.add_argument('--only', help='Only run benchmarks whose names contain this')
+    parser.add_argument('--repeat', type=int, default=5, help='Rounds per benchmark; the fastest is kept')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='How much slower counts as a regression')
+    args = parser.parse_args()
+
+    results = run(benchmarks, args.repeat, args.only)
+    try:
+        before = load_baseline(args.baseline)
+    except FileNotFoundError:
+        before = {}
+    rows = compare(results, before, args.tolerance)
+    report(rows)
+    if args.save:
+        save_baseline(results, args.baseline, before)
+        print('Saved the baseline to {}'.format(args.baseline))
+    elif any(row[4] for row in rows):
+        sys.exit(1)
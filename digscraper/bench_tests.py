@@ -0,0 +1,29 @@
+"""
+Baselines should round-trip, and only real slowdowns should count as regressions.
+"""
+import os
+import tempfile
+from unittest import TestCase
+
+from digscraper import bench
+
+
+class BenchTest(TestCase):
+
+    def test_measure(self):
+        result = bench.measure(lambda: sum(range(100)), repeat=2, min_time=0.01)
+        self.assertGreater(result['calls'], 1)
+        self.assertGreater(result['seconds'], 0)
+
+    def test_baseline_and_compare(self):
+        path = os.path.join(tempfile.mkdtemp(), 'baseline.json')
+        bench.save_baseline({'a': {'seconds': 1.0}, 'b': {'seconds': 2.0}}, path)
+        # Saving some of the benchmarks keeps the others' timings
+        bench.save_baseline({'b': {'seconds': 3.0}}, path, bench.load_baseline(path))
+        baseline = bench.load_baseline(path)
+        self.assertEqual(baseline, {'a': 1.0, 'b': 3.0})
+
+        rows = bench.compare({'a': {'seconds': 1.2}, 'b': {'seconds': 4.0}, 'c': {'seconds': 1.0}}, baseline, 0.25)
+        self.assertEqual([(name, regressed) for name, _, _, _, regressed in rows], [
+            ('a', False), ('b', True), ('c', False),
+        ])
@@ -0,0 +1,185 @@
+"""
+One command for every source:
+
+    python -m digscraper crawl daahl --per-host 50 --metrics-port 8000
+    python -m digscraper parse megajordan --profile
+    python -m digscraper export --xlsx daahl.xlsx --csv csv
+    python -m digscraper check megajordan --link
+    python -m digscraper status
+
+`crawl` and `parse` hand the rest of their arguments to the source's own command line (`crawl daahl --help` lists
+them), and run from the current directory just like the scripts do. Every subcommand imports only what it needs, so
+`status` never loads aiohttp, pandas or pyarrow, and no database is opened or created until a subcommand asks for it.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+# The module whose main() runs each source's crawl, and its parse
+CRAWLERS = {'daahl': 'daahl.scraper', 'ademnes': 'ADEMNES.scraper', 'megajordan': 'megajordan.main'}
+PARSERS = {'daahl': 'daahl.parser', 'megajordan': 'megajordan.parsers'}
+# Where the sources that log their attempts keep them
+LOG_DBS = {'daahl': 'daahl.log_db', 'ademnes': 'ADEMNES.log_db'}
+# Where each source saves its pages when it isn't writing to a pack store
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = {
+    'daahl': 'results', 'ademnes': os.path.join(REPO, 'ADEMNES', 'results'),
+    'megajordan': os.path.join(REPO, 'megajordan', 'results'),
+}
+
+
+def run_main(module, prog, argv):
+    sys.argv[0] = prog  # For the usage line of the module's own help and errors
+    return importlib.import_module(module).main(argv)
+
+
+def crawl(args):
+    run_main(CRAWLERS[args.source], 'digscraper crawl {}'.format(args.source), args.args)
+
+
+def parse(args):
+    run_main(PARSERS[args.source], 'digscraper parse {}'.format(args.source), args.args)
+
+
+def export(args):
+    from digscraper.sink import export_csv, export_xlsx
+
+    if args.xlsx:
+        export_xlsx(args.root, args.xlsx, args.sections)
+        print('Wrote {}'.format(args.xlsx))
+    if args.csv:
+        export_csv(args.root, args.csv, args.sections)
+        print('Wrote {}'.format(args.csv))
+
+
+def check(args, out=sys.stdout):
+    from digscraper import dedup
+
+    if args.pack:
+        pages, read = dedup.pack_pages(args.pack, args.source)
+        path = args.index or dedup.DEFAULT_INDEX
+    else:
+        root = args.results or RESULTS[args.source]
+        pages, read = dedup.file_pages(root)
+        # Next to the results, where the parser runs from
+        path = args.index or os.path.join(os.path.dirname(os.path.abspath(root)), dedup.DEFAULT_INDEX)
+    rows = dedup.check(
+        pages, read, min_words=args.min_words, min_cluster=args.min_cluster, max_distance=args.max_distance,
+    )
+    index = dedup.PageIndex(path)
+    index.replace(args.source, rows)
+
+    stats = index.stats(args.source)
+    print('Checked {} {} pages into {}'.format(len(rows), args.source, path), file=out)
+    for kind in (dedup.OK, dedup.EMPTY, dedup.TEMPLATE, 'duplicate'):
+        n, size = stats.get(kind, (0, 0))
+        print('  {:<10} {:>8} pages {:>12} bytes'.format(kind, n, size), file=out)
+    for n, page in index.templates(args.source):
+        print('  template of {} pages, like {}'.format(n, page), file=out)
+    if args.link and not args.pack:
+        linked, freed = dedup.link_duplicates(root, rows)
+        print('Linked {} duplicate files, freeing {} bytes'.format(linked, freed), file=out)
+
+
+def attempt_status(source):
+    """
+    Lines about a source's attempts log, if it has one yet
+    """
+    log_db = importlib.import_module(LOG_DBS[source])
+    if not os.path.exists(log_db.DATABASE_PATH):
+        yield 'Attempts:          none yet (no {})'.format(log_db.DATABASE_PATH)
+        return
+    from digscraper import attempts
+
+    engine = log_db.engine()
+    summary = attempts.summary(engine)
+    yield 'Attempts:          {attempts}, {unsaved} unsaved, last at {last_finished}'.format(**summary)
+    yield 'Sites saved:       {}'.format(summary['sites_saved'])
+    for host, stats in attempts.latency_by_host(engine).items():
+        yield 'Latency:           {} p50 {:.3f}s, p95 {:.3f}s over {} requests'.format(
+            host, stats[0.5], stats[0.95], stats['count'],
+        )
+
+
+def queue_status(name):
+    """
+    Lines about a source's distributed queue, when there's one configured or a local one has been started
+    """
+    from digscraper.workqueue import DATABASE_URL, WorkQueue
+
+    if DATABASE_URL.startswith('sqlite:///') and not os.path.exists(DATABASE_URL[len('sqlite:///'):]):
+        return
+    yield 'Queue:             {}'.format(WorkQueue(DATABASE_URL, name).stats())
+
+
+def megajordan_status():
+    from megajordan import main
+
+    if main.QUEUE_URL.startswith('sqlite:///') and not os.path.exists(main.QUEUE_URL[len('sqlite:///'):]):
+        yield 'Queue:             none yet (no {})'.format(main.QUEUE_URL[len('sqlite:///'):])
+        return
+    yield 'Pages saved:       {}'.format(main.completion_index().count())
+    yield 'Queue:             {}'.format(main.work_queue().stats())
+
+
+def status(args, out=sys.stdout):
+    for source in args.sources or sorted(CRAWLERS):
+        print('{}:'.format(source), file=out)
+        if source == 'megajordan':
+            lines = megajordan_status()
+        else:
+            lines = list(attempt_status(source)) + list(queue_status(source))
+        for line in lines:
+            print('  {}'.format(line), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='digscraper', description='Crawl, parse and export the archaeological sites')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('crawl', help="Crawl a source (the rest of the arguments are the crawler's own)")
+    command.add_argument('source', choices=sorted(CRAWLERS))
+    command.add_argument('args', nargs=argparse.REMAINDER, help='Arguments for the crawler')
+    command.set_defaults(run=crawl)
+
+    command = commands.add_parser('parse', help="Parse a source's saved pages (the rest of the arguments are the "
+                                                "parser's own)")
+    command.add_argument('source', choices=sorted(PARSERS))
+    command.add_argument('args', nargs=argparse.REMAINDER, help='Arguments for the parser')
+    command.set_defaults(run=parse)
+
+    command = commands.add_parser('export', help='Export parsed Parquet sections as a workbook and/or CSVs')
+    command.add_argument('--root', default='sections', help='Directory of Parquet sections, one folder per section')
+    command.add_argument('--xlsx', help='Workbook to write, with a sheet per section')
+    command.add_argument('--csv', help='Directory to write one CSV per section into')
+    command.add_argument('--sections', nargs='+', help='Only these sections, in this order (all of them by default)')
+    command.set_defaults(run=export)
+
+    command = commands.add_parser('check', help="Hash a source's saved pages, and mark the empty and template ones for "
+                                                 "the parsers to skip")
+    command.add_argument('source', choices=sorted(RESULTS))
+    command.add_argument('--pack', help='Check the pages in this pack store instead of the results directory')
+    command.add_argument('--results', help="Results directory to check instead of the source's own")
+    command.add_argument('--index', help="Page index to write (by default the one the parser reads, next to the "
+                                         "results directory, or in this directory for a pack)")
+    command.add_argument('--link', action='store_true', help='Replace duplicate result files with hard links')
+    command.add_argument('--min-words', type=int, default=5, help='Fewer words than this of its own and a page is empty')
+    command.add_argument('--min-cluster', type=int, default=10,
+                         help='Near-duplicate pages it takes to make a template')
+    command.add_argument('--max-distance', type=int, default=3, help='Bits simhashes of near-duplicates differ by')
+    command.set_defaults(run=check)
+
+    command = commands.add_parser('status', help='How far each crawl has got')
+    command.add_argument('sources', nargs='*', help='Sources to report on: {} (all of them by default)'.format(
+        ', '.join(sorted(CRAWLERS))))
+    command.set_defaults(run=status)
+
+    args = parser.parse_args(argv)
+    if args.command == 'export' and not (args.xlsx or args.csv):
+        parser.error('Nothing to export to: give --xlsx and/or --csv')
+    if args.command == 'status':
+        unknown = set(args.sources) - set(CRAWLERS)
+        if unknown:
+            parser.error('No source called {}'.format(', '.join(sorted(unknown))))
+    args.run(args)
@@ -0,0 +1,70 @@
+"""
+The command line should report on crawls and export sections without side effects or heavy imports it doesn't need.
+"""
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+
+from digscraper import cli
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, cwd):
+    env = dict(os.environ, PYTHONPATH=REPO)
+    env.pop('DIGSCRAPER_DATABASE_URL', None)
+    return subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, capture_output=True, text=True, check=True)
+
+
+class CliTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_imports_are_lazy(self):
+        results = os.path.join(REPO, 'megajordan', 'results')
+        existed = os.path.exists(results)
+        output = run_python(
+            'import sys, daahl.scraper, ADEMNES.scraper, megajordan.main, megajordan.parsers, digscraper.cli\n'
+            'print(sorted(m for m in ["pandas", "bs4"] if m in sys.modules))', self.tmp.name,
+        )
+        self.assertEqual(output.stdout.strip(), "['bs4']")  # Only for daahl.parser's BeautifulSoup backend
+        self.assertEqual(os.listdir(self.tmp.name), [])  # No databases or results directories
+        self.assertEqual(os.path.exists(results), existed)
+
+        output = run_python(
+            'import sys\nfrom digscraper import cli\ncli.main(["status", "daahl", "ademnes"])\n'
+            'print(sorted(m for m in ["aiohttp", "pandas", "pyarrow"] if m in sys.modules))', self.tmp.name,
+        )
+        self.assertIn('none yet', output.stdout)
+        self.assertEqual(output.stdout.splitlines()[-1], '[]')
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_status_and_export(self):
+        from ADEMNES import log_db
+        from digscraper.attempts import attempt_row
+        from digscraper.sink import SectionSink
+
+        log = log_db.attempt_log()
+        log.record(**attempt_row(7, 'http://www.ademnes.de/db/site.php?s=7', status_code=200, saved=True, latency=0.5))
+        log.flush()
+        out = io.StringIO()
+        cli.status(SimpleNamespace(sources=['ademnes']), out)
+        self.assertIn('Sites saved:       1', out.getvalue())
+        self.assertIn('www.ademnes.de p50 0.500s', out.getvalue())
+
+        with SectionSink('sections') as sink:
+            sink.write_sections({'basic_data': [{'site_id': '7', 'NAME': 'Tall Hisban'}]})
+        cli.main(['export', '--csv', 'csv'])
+        with open(os.path.join('csv', 'basic_data.csv')) as fh:
+            self.assertEqual(fh.read().splitlines(), ['site_id,NAME', '7,Tall Hisban'])
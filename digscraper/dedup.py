@@ -0,0 +1,326 @@
+"""
+Find the stored pages that aren't worth keeping or parsing: exact duplicates, near-duplicates of a template (like the
+"no such site" page every probe of a missing ID gets back), and pages with nothing of their own on them.
+
+    pages, read = file_pages('results')
+    rows = check(pages, read)
+    PageIndex('pages.sqlite3').replace('megajordan', rows)
+    skipped_pages('megajordan')  # {page, ...} for the parsers to leave out
+
+A page's own content is its visible text without the source's boilerplate: the lines on at least half of a sample of
+its pages (menus, footers), with every run of digits counted alike so "Site 12" and "Site 13" are the same line. Pages
+with fewer than `min_words` words of their own are `empty`. A page is a `template` when its simhash (64 bits, over pairs
+of neighbouring words of its own content) is within `max_distance` bits of at least `min_cluster` - 1 other pages:
+that many near-identical pages only differ by the ID they were asked for. Both kinds are skipped by the parsers.
+
+Exact duplicates are recorded against the first page with the same body. PackWriter already stores each body once;
+link_duplicates does the same for one-file-per-page results, with hard links.
+"""
+import hashlib
+import os
+import random
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+from lxml import etree
+from sqlalchemy import create_engine, text
+
+from digscraper.attempt_log import enable_wal
+from digscraper.packstore import PackReader
+from digscraper.sections import parse_html
+
+DEFAULT_INDEX = os.environ.get('DIGSCRAPER_PAGE_INDEX', 'pages.sqlite3')
+
+OK, EMPTY, TEMPLATE = 'ok', 'empty', 'template'
+SKIPPED = (EMPTY, TEMPLATE)
+
+VISIBLE_TEXT = etree.XPath('//body//text()[not(ancestor::script or ancestor::style)]')
+DIGITS = re.compile(r'\d+')
+WORD = re.compile(r'\w+')
+
+_BITS = np.arange(64, dtype=np.uint64)
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def text_lines(data):
+    """
+    The visible text of a page's bytes: one line per text node, whitespace collapsed and digit runs replaced by 0
+    """
+    root = parse_html(data.decode('UTF-8', 'replace'))
+    if root is None:
+        return []
+    lines = []
+    for node in VISIBLE_TEXT(root):
+        line = DIGITS.sub('0', ' '.join(node.split()))
+        if line:
+            lines.append(line)
+    return lines
+
+
+def boilerplate(pages_lines, share=0.5, min_pages=5):
+    """
+    The lines found on at least `share` of the pages (and on at least `min_pages` of them)
+    """
+    counts = Counter()
+    for lines in pages_lines:
+        counts.update(set(lines))
+    needed = max(share * len(pages_lines), min_pages)
+    return {line for line, n in counts.items() if n >= needed}
+
+
+def _mix(x):
+    """
+    The splitmix64 finaliser, to spread 32-bit word hashes over 64 bits
+    """
+    x = (x ^ (x >> np.uint64(30))) * _M1
+    x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+
+def simhash(words):
+    """
+    64-bit simhash of a list of words, with each pair of neighbouring words (or the word, if it's alone) as a feature.
+    Similar lists of words get hashes that differ in few bits.
+    """
+    if not words:
+        return 0
+    hashes = _mix(np.fromiter((zlib.crc32(w.encode('UTF-8')) for w in words), np.uint64, len(words)))
+    features = _mix(hashes[:-1] ^ (hashes[1:] * _M1)) if len(hashes) > 1 else hashes
+    votes = ((features[:, None] >> _BITS) & np.uint64(1)).sum(axis=0, dtype=np.int64) * 2 - len(features)
+    return int(((votes > 0).astype(np.uint64) << _BITS).sum())
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def popcount(values):
+    """
+    The number of bits set in each of an array of uint64s
+    """
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+
+def _roots(labels, nodes):
+    """
+    The group each of `nodes` is in, pointing them straight at it
+    """
+    roots = labels[nodes]
+    while True:
+        up = labels[roots]
+        if (up == roots).all():
+            labels[nodes] = roots
+            return roots
+        roots = up
+
+
+def _join(labels, values, members, max_distance, block):
+    """
+    Merge the groups of every pair of `members` whose `values` are within `max_distance` bits, comparing `block` of
+    them with the rest at a time. Groups point at their lowest member; passes repeat until no close pair is left in two
+    groups.
+    """
+    merged = True
+    while merged:
+        merged = False
+        for start in range(0, len(members), block):
+            rows, cols = np.nonzero(popcount(values[start:start + block, None] ^ values[None, :]) <= max_distance)
+            a, b = _roots(labels, members[start + rows]), _roots(labels, members[cols])
+            apart = a != b
+            if apart.any():
+                a, b = a[apart], b[apart]
+                low = np.minimum(a, b)
+                np.minimum.at(labels, a, low)
+                np.minimum.at(labels, b, low)
+                merged = True
+
+
+def near_duplicate_groups(hashes, max_distance=3, block=256):
+    """
+    A group number for each simhash, shared by hashes within `max_distance` bits of each other (transitively).
+
+    Hashes that close agree on at least one of `max_distance` + 1 bands of their bits, so only hashes sharing a band are
+    compared. Identical hashes are compared once, and a bucket of hashes sharing a band is compared `block` rows at a
+    time, so a site's thousands of template pages never need a thousands-by-thousands matrix.
+    """
+    unique, inverse = np.unique(np.asarray(hashes, dtype=np.uint64), return_inverse=True)
+    labels = np.arange(len(unique))
+    bands = max_distance + 1
+    width = 64 // bands
+    for band in range(bands):
+        low = band * width
+        bits = 64 - low if band == bands - 1 else width
+        keys = (unique >> np.uint64(low)) & np.uint64((1 << bits) - 1)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        ends = np.concatenate([starts[1:], [len(keys)]])
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            members = order[start:end]
+            _join(labels, unique[members], members, max_distance, block)
+    return _roots(labels, np.arange(len(unique)))[inverse.ravel()]
+
+
+def check(pages, read, sample=2000, min_words=5, min_cluster=10, max_distance=3, seed=0):
+    """
+    A row for each (page, location) in `pages`, with `read(location)` giving the page's bytes: the page, its sha1
+    digest, size, simhash, words of its own content, kind (ok, empty or template), near-duplicate group, and the page it
+    is an exact copy of, if any.
+    """
+    pages = list(pages)
+    sampled = random.Random(seed).sample(pages, min(sample, len(pages)))
+    common = boilerplate([text_lines(read(location)) for _, location in sampled])
+    rows = []
+    first = {}
+    for page, location in pages:
+        data = read(location)
+        digest = hashlib.sha1(data).hexdigest()
+        words = [word.lower() for line in text_lines(data) if line not in common for word in WORD.findall(line)]
+        original = first.setdefault(digest, page)
+        rows.append({
+            'page': page, 'digest': digest, 'bytes': len(data), 'simhash': simhash(words), 'words': len(words),
+            'duplicate_of': original if original != page else None,
+        })
+    groups = near_duplicate_groups([row['simhash'] for row in rows], max_distance)
+    sizes = np.bincount(groups) if len(groups) else []
+    for row, group in zip(rows, groups):
+        row['group'] = int(group)
+        if row['words'] < min_words:
+            row['kind'] = EMPTY
+        elif sizes[group] >= min_cluster:
+            row['kind'] = TEMPLATE
+        else:
+            row['kind'] = OK
+    return rows
+
+
+def file_pages(root):
+    """
+    ([(page, path)], read) for the pages saved as files under `root`, where the page is the path relative to `root`.
+    Unfinished downloads and the failure directory are left out.
+    """
+    pages = []
+    for directory, dirnames, files in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != 'failure']
+        for f in files:
+            if f.endswith('.html') and not f.startswith('.'):
+                path = os.path.join(directory, f)
+                pages.append((os.path.relpath(path, root), path))
+
+    def read(path):
+        with open(path, 'rb') as fh:
+            return fh.read()
+    return sorted(pages), read
+
+
+def pack_pages(pack, source):
+    """
+    ([(page, location)], read) for a source's pages in a pack store, where the page is "<id>/<resource>"
+    """
+    reader = PackReader(pack)
+    pages = [('{}/{}'.format(site_id, resource), location) for (_, site_id, resource), location
+             in reader.locations(source)]
+    return pages, lambda location: reader.read(*location)
+
+
+def link_duplicates(root, rows):
+    """
+    Replace every file that's an exact copy of another with a hard link to it. Returns (files linked, bytes freed).
+    """
+    linked, freed = 0, 0
+    for row in rows:
+        if row['duplicate_of'] is None:
+            continue
+        path, original = os.path.join(root, row['page']), os.path.join(root, row['duplicate_of'])
+        if os.path.samefile(path, original):
+            continue
+        tmp = os.path.join(os.path.dirname(path), '.{}.link'.format(os.path.basename(path)))
+        os.link(original, tmp)
+        os.replace(tmp, path)
+        linked += 1
+        freed += row['bytes']
+    return linked, freed
+
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class PageIndex(object):
+    """
+    (source, page) -> what check() found about it, in a SQLite file
+    """
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self.engine = create_engine('sqlite:///{}'.format(path), connect_args={'timeout': 60})
+        enable_wal(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                '  source VARCHAR(50) NOT NULL, page VARCHAR(250) NOT NULL, digest CHAR(40) NOT NULL,'
+                '  bytes INTEGER NOT NULL, simhash INTEGER NOT NULL, words INTEGER NOT NULL, kind VARCHAR(10) NOT NULL,'
+                '  near_group INTEGER, duplicate_of VARCHAR(250), PRIMARY KEY (source, page))'
+            ))
+
+    def replace(self, source, rows):
+        """
+        Make `rows` (from check) everything the index knows about the source's pages
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text('DELETE FROM pages WHERE source = :source'), {'source': source})
+            if rows:
+                conn.execute(text(
+                    'INSERT INTO pages (source, page, digest, bytes, simhash, words, kind, near_group, duplicate_of) '
+                    'VALUES (:source, :page, :digest, :bytes, :simhash, :words, :kind, :group, :duplicate_of)'
+                ), [dict(row, source=source, simhash=_signed(row['simhash'])) for row in rows])
+
+    def skipped(self, source):
+        """
+        The source's pages that are empty or a template
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                'SELECT page FROM pages WHERE source = :source AND kind IN (:empty, :template)'
+            ), {'source': source, 'empty': EMPTY, 'template': TEMPLATE})
+            return {row[0] for row in rows}
+
+    def stats(self, source):
+        """
+        {kind: (pages, bytes)}, plus 'duplicate' for exact copies of other pages
+        """
+        with self.engine.connect() as conn:
+            stats = {kind: (n, size) for kind, n, size in conn.execute(text(
+                'SELECT kind, COUNT(*), SUM(bytes) FROM pages WHERE source = :source GROUP BY kind'
+            ), {'source': source})}
+            n, size = conn.execute(text(
+                'SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM pages WHERE source = :source AND duplicate_of IS NOT NULL'
+            ), {'source': source}).one()
+        stats['duplicate'] = (n, size)
+        return stats
+
+    def templates(self, source, n=5):
+        """
+        [(pages, an example page)] for the biggest near-duplicate groups of template pages
+        """
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(text(
+                'SELECT COUNT(*) AS pages, MIN(page) FROM pages WHERE source = :source AND kind = :template '
+                'GROUP BY near_group ORDER BY pages DESC LIMIT :n'
+            ), {'source': source, 'template': TEMPLATE, 'n': n})]
+
+
+def skipped_pages(source, path=DEFAULT_INDEX):
+    """
+    The pages the parsers should leave out, or none if the pages haven't been checked
+    """
+    if not path or not os.path.exists(path):
+        return set()
+    return PageIndex(path).skipped(source)
@@ -0,0 +1,125 @@
+"""
+The checker should find exact copies, the "no such site" pages every missing ID gets back, and pages with nothing of
+their own, without mistaking real sites that share a layout for any of them.
+"""
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from digscraper import dedup
+
+LAYOUT = (
+    '<html><head><title>Site {id}</title><script>var site = {id};</script></head><body>'
+    '<div class="menu"><a href="/">Home</a> <a href="/db/">Database</a> <a href="/about">About the project</a></div>'
+    '<h1>Site {id}</h1>{content}'
+    '<div class="footer">Archaeological Database of the Near East, all rights reserved</div></body></html>'
+)
+WORDS = ('tell wadi khirbet jebel ain qasr bir umm rujm hisban dhiban madaba karak tafila mound wall tower cistern '
+         'tomb cave village road terrace pottery flint mosaic church mosque fort camp quarry press kiln').split()
+
+
+def page(site_id, content):
+    return LAYOUT.format(id=site_id, content=content).encode('UTF-8')
+
+
+def site_page(site_id, rng):
+    rows = ''.join('<tr><td>{}</td><td>{}</td></tr>'.format(rng.choice(WORDS), ' '.join(rng.sample(WORDS, 6)))
+                   for _ in range(8))
+    return page(site_id, '<table>{}</table>'.format(rows))
+
+
+def missing_page(site_id):
+    return page(site_id, '<p>There is no site with the number {} in the database. It may have been merged into another '
+                         'record or withdrawn, please search again or contact the editors.</p>'.format(site_id))
+
+
+class DedupTest(TestCase):
+
+    def test_simhash(self):
+        rng = random.Random(1)
+        words = [rng.choice(WORDS) for _ in range(200)]
+        near = list(words)
+        near[100] = 'different'
+        far = [rng.choice(WORDS) for _ in range(200)]
+        self.assertEqual(dedup.simhash(words), dedup.simhash(list(words)))
+        self.assertLessEqual(dedup.hamming(dedup.simhash(words), dedup.simhash(near)), 6)
+        self.assertGreater(dedup.hamming(dedup.simhash(words), dedup.simhash(far)), 12)
+        self.assertEqual(dedup.simhash([]), 0)
+
+    def test_groups_match_brute_force(self):
+        rng = random.Random(2)
+        hashes = []
+        for _ in range(40):
+            h = rng.getrandbits(64)
+            hashes.append(h)
+            for _ in range(rng.randrange(4)):
+                for bit in rng.sample(range(64), rng.randrange(4)):
+                    h ^= 1 << bit
+                hashes.append(h)
+        groups = dedup.near_duplicate_groups(hashes, max_distance=3)
+
+        # Union every pair within 3 bits of each other
+        expected = list(range(len(hashes)))
+        for i in range(len(hashes)):
+            for j in range(i):
+                if dedup.hamming(hashes[i], hashes[j]) <= 3:
+                    old, new = expected[i], expected[j]
+                    expected = [new if g == old else g for g in expected]
+        same = lambda labels: {(i, j) for i in range(len(labels)) for j in range(i) if labels[i] == labels[j]}
+        self.assertEqual(same(list(groups)), same(expected))
+
+    def test_one_large_bucket(self):
+        # Over a thousand near-identical templates and a thousand unrelated pages, all sharing their lowest 16 bits
+        rng = random.Random(4)
+        base = rng.getrandbits(64)
+        cluster = [base] + [base ^ (1 << i) for i in range(16, 64)]
+        cluster += [base ^ (1 << i) ^ (1 << j) for i in range(16, 64) for j in range(16, i)]
+        others = [(rng.getrandbits(48) << 16) | (base & 0xFFFF) for _ in range(1000)]
+        hashes = cluster + cluster[:50] + others
+        groups = dedup.near_duplicate_groups(hashes, max_distance=3, block=64)
+
+        self.assertEqual(len(set(groups[:len(cluster) + 50])), 1)
+        values = np.array(others, dtype=np.uint64)
+        close = dedup.popcount(values[:, None] ^ values[None, :]) <= 3
+        self.assertEqual(close.sum(), len(others))  # The others are only close to themselves...
+        self.assertEqual(len(set(groups[len(cluster) + 50:]) - {groups[0]}), len(others))  # ...and to no template
+
+    def test_check_and_skip(self):
+        rng = random.Random(3)
+        bodies = {'{}.html'.format(i): site_page(i, rng) for i in range(100, 140)}
+        bodies.update({'{}.html'.format(i): missing_page(i) for i in range(900, 915)})
+        bodies.update({'{}.html'.format(i): page(i, '<p>Pending</p>') for i in range(950, 953)})
+        bodies['copy.html'] = bodies['100.html']
+
+        with tempfile.TemporaryDirectory() as tmp:
+            root = os.path.join(tmp, 'results')
+            os.makedirs(os.path.join(root, 'failure'))
+            for name, body in bodies.items():
+                with open(os.path.join(root, name), 'wb') as fh:
+                    fh.write(body)
+            with open(os.path.join(root, 'failure', '404-1.html'), 'wb') as fh:
+                fh.write(b'Not found')
+
+            pages, read = dedup.file_pages(root)
+            self.assertEqual(len(pages), len(bodies))
+            rows = {row['page']: row for row in dedup.check(pages, read)}
+            kinds = {name: row['kind'] for name, row in rows.items()}
+            self.assertEqual({name for name, kind in kinds.items() if kind == dedup.TEMPLATE},
+                             {'{}.html'.format(i) for i in range(900, 915)})
+            self.assertEqual({name for name, kind in kinds.items() if kind == dedup.EMPTY},
+                             {'{}.html'.format(i) for i in range(950, 953)})
+            self.assertEqual(rows['copy.html']['duplicate_of'], '100.html')
+            self.assertIsNone(rows['100.html']['duplicate_of'])
+
+            index = os.path.join(tmp, 'pages.sqlite3')
+            self.assertEqual(dedup.skipped_pages('ademnes', index), set())
+            dedup.PageIndex(index).replace('ademnes', list(rows.values()))
+            self.assertEqual(len(dedup.skipped_pages('ademnes', index)), 18)
+            self.assertEqual(dedup.PageIndex(index).stats('ademnes')['duplicate'], (1, len(bodies['copy.html'])))
+
+            self.assertEqual(dedup.link_duplicates(root, rows.values()), (1, len(bodies['copy.html'])))
+            self.assertTrue(os.path.samefile(os.path.join(root, 'copy.html'), os.path.join(root, '100.html')))
+            self.assertEqual(dedup.link_duplicates(root, rows.values()), (0, 0))
@@ -0,0 +1,178 @@
+"""
+One asyncio fetch engine shared by all of the scrapers.
+
+A single event loop keeps thousands of requests in flight, with a cap on how many may hit any one host at once.
+"""
+import asyncio
+import datetime as dt
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from digscraper import metrics
+
+# A unit of work: the URL to GET, and a coroutine function `handle(response, attempt)` that consumes the response
+# while the connection is still open. Whatever `handle` returns is the result of the job.
+Job = namedtuple('Job', ['url', 'handle'])
+
+
+class FetchAttempt(object):
+    """
+    Bookkeeping for one try at a job: which try it is, and when it started
+    """
+    def __init__(self, number):
+        self.number = number
+        self.started_at = dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+        self._started = time.perf_counter()
+        self._finished = None
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    @property
+    def latency(self):
+        """
+        Seconds from the start of the request until it finished, or until now if it hasn't
+        """
+        return (self._finished or time.perf_counter()) - self._started
+
+
+class FetchFailed(Exception):
+    """
+    A job that still failed after every retry
+    """
+    def __init__(self, job, cause, attempt=None):
+        super().__init__('{} failed: {!r}'.format(job.url, cause))
+        self.job = job
+        self.cause = cause
+        self.attempt = attempt
+
+
+class FetchEngine(object):
+    """
+    Drive an iterable of Jobs through one aiohttp session.
+
+    Jobs are pulled lazily, so the iterable can be a generator that is still being produced while fetching starts. It
+    can also be an async iterable, for jobs that have to be waited for without holding up the requests in flight.
+    Every request is recorded in the crawl metrics (see digscraper.metrics) under the `source` label.
+    """
+    RETRY_STATUSES = (429, 503)
+
+    def __init__(self, concurrency=1000, per_host=100, timeout=60, retries=3, backoff=1, max_backoff=60 * 60,
+                 keepalive=30, source='crawl'):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.keepalive = keepalive
+        self.source = source
+        self._host_limits = {}
+
+    def run(self, jobs, on_result=None):
+        """
+        Fetch every job and return the list of results, in completion order.
+
+        Jobs that still fail after all retries contribute a FetchFailed instead of a result. With `on_result`, each
+        result is passed to it as soon as its job finishes instead, and none are kept; it's called in the event loop,
+        so it shouldn't block.
+        """
+        return asyncio.run(self.crawl(jobs, on_result))
+
+    async def crawl(self, jobs, on_result=None):
+        next_job = self._job_source(jobs)
+        results = []
+        report = on_result if on_result is not None else results.append
+        # Idle connections stay open for `keepalive` seconds, so each host's pool is reused across jobs
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, limit_per_host=self.per_host, keepalive_timeout=self.keepalive, ssl=False,
+        )
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            # Every worker pulls from the same iterator; that's safe because they all live on one thread.
+            workers = [self._worker(session, next_job, report) for _ in range(self.concurrency)]
+            await asyncio.gather(*workers)
+        return results
+
+    @staticmethod
+    def _job_source(jobs):
+        """
+        A coroutine function giving the next job, or None once there are no more
+        """
+        if hasattr(jobs, '__aiter__'):
+            jobs = jobs.__aiter__()
+            # An async generator can't be resumed by one worker while another is waiting on it
+            lock = asyncio.Lock()
+
+            async def next_job():
+                async with lock:
+                    try:
+                        return await jobs.__anext__()
+                    except StopAsyncIteration:
+                        return None
+        else:
+            jobs = iter(jobs)
+
+            async def next_job():
+                return next(jobs, None)
+        return next_job
+
+    async def _worker(self, session, next_job, report):
+        while True:
+            job = await next_job()
+            if job is None:
+                return
+            try:
+                result = await self.fetch(session, job)
+            except FetchFailed as exc:
+                metrics.FAILED.inc(source=self.source, host=urlsplit(job.url).netloc)
+                result = exc
+            except Exception as exc:
+                metrics.FAILED.inc(source=self.source, host=urlsplit(job.url).netloc)
+                result = FetchFailed(job, exc)
+            report(result)
+
+    def host_limit(self, url):
+        """
+        The semaphore shared by every request to the host of the given URL
+        """
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def fetch(self, session, job):
+        """
+        GET one URL, backing off exponentially on connection errors and "slow down" statuses
+        """
+        host = urlsplit(job.url).netloc
+        labels = dict(source=self.source, host=host)
+        for number in range(1, self.retries + 2):
+            last_try = number == self.retries + 1
+            try:
+                async with self.host_limit(job.url):
+                    attempt = FetchAttempt(number)
+                    metrics.IN_FLIGHT.inc(source=self.source)
+                    try:
+                        async with session.get(job.url) as response:
+                            metrics.REQUESTS.inc(status=response.status, **labels)
+                            if response.status not in self.RETRY_STATUSES or last_try:
+                                result = await job.handle(response, attempt)
+                                metrics.REQUEST_SECONDS.observe(attempt.latency, **labels)
+                                metrics.RESPONSE_BYTES.observe(response.content.total_bytes, **labels)
+                                return result
+                            reason = response.status
+                    finally:
+                        metrics.IN_FLIGHT.dec(source=self.source)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                attempt.finish()
+                reason = type(exc).__name__
+                metrics.ERRORS.inc(error=reason, **labels)
+                if last_try:
+                    raise FetchFailed(job, exc, attempt)
+            metrics.RETRIES.inc(reason=reason, **labels)
+            # Sleep outside of the host limit, so other requests can use the slot in the meantime
+            await asyncio.sleep(min(self.backoff * 2 ** (number - 1), self.max_backoff))
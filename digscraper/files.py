@@ -0,0 +1,77 @@
+"""
+Crash-safe page files: bodies are streamed to a temporary file next to the destination, fsync'd, and renamed into
+place, so a page that exists on disk is always complete.
+"""
+import asyncio
+import os
+import tempfile
+from functools import partial
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AtomicFile(object):
+    """
+    Binary file handle that only appears at `path` if the `with` block finishes without an exception
+
+        with AtomicFile('results/10/Site_353002210.html') as fh:
+            fh.write(body)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp = None
+        self.fh = None
+
+    def __enter__(self):
+        dirname, basename = os.path.split(self.path)
+        os.makedirs(dirname or '.', exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=dirname or '.', prefix='.{}.'.format(basename), suffix='.tmp')
+        self.fh = os.fdopen(fd, 'wb')
+        return self.fh
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.fh.flush()
+                os.fsync(self.fh.fileno())
+            self.fh.close()
+            if exc_type is None:
+                os.replace(self.tmp, self.path)
+        finally:
+            if os.path.exists(self.tmp):
+                os.unlink(self.tmp)
+
+
+def write_chunks(path, chunks):
+    """
+    Atomically write an iterable of byte chunks to `path`. Returns the number of bytes written.
+    """
+    size = 0
+    with AtomicFile(path) as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+            size += len(chunk)
+    return size
+
+
+async def write_stream(path, chunks):
+    """
+    Atomically write an async iterable of byte chunks (e.g. `response.content.iter_chunked(CHUNK_SIZE)`) to `path`.
+    Returns the number of bytes written.
+
+    The file is opened, written, fsync'd and renamed on the default executor, so the event loop only waits for chunks.
+    """
+    run = partial(asyncio.get_running_loop().run_in_executor, None)
+    atomic = AtomicFile(path)
+    fh = await run(atomic.__enter__)
+    size = 0
+    try:
+        async for chunk in chunks:
+            await run(fh.write, chunk)
+            size += len(chunk)
+    except BaseException as exc:
+        await run(atomic.__exit__, type(exc), exc, exc.__traceback__)
+        raise
+    await run(atomic.__exit__, None, None, None)
+    return size
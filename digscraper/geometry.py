@@ -0,0 +1,235 @@
+"""
+Site geometry in bulk: every site's coordinate string parsed into one NumPy array, and the per-site statistics computed
+for all sites at once instead of in a Python loop per site.
+
+The points of all sites are stacked into one (M, 2) array, and `offsets` marks where each site's points start, so site
+i is points[offsets[i]:offsets[i + 1]]. A site without coordinates has no points, and NaN statistics.
+
+    sites = parse_mega(df['Coordinates'])
+    sites.centroids()  # (n, 2)
+    sites.medians()    # (n, 2) geometric medians
+    sites.bounds()     # (n, 4) min x, min y, max x, max y
+    sites.areas()      # (n,) polygon areas
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371008.8  # metres
+
+
+def _float_array(tokens):
+    return np.array(tokens, dtype=np.float64) if tokens else np.empty(0)
+
+
+class SiteCoordinates(object):
+    """
+    The coordinates of many sites, as one ragged array
+    """
+
+    def __init__(self, points, offsets):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_point_lists(cls, sites):
+        """
+        From a list of [(x, y), ...] per site
+        """
+        counts = [len(points) for points in sites]
+        points = [point for site in sites for point in site]
+        return cls(np.array(points, dtype=np.float64).reshape(-1, 2), np.concatenate([[0], np.cumsum(counts)]))
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def site(self, i):
+        return self.points[self.offsets[i]:self.offsets[i + 1]]
+
+    def site_index(self):
+        """
+        Which site each point belongs to
+        """
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    def _reduce(self, ufunc, values, empty=np.nan):
+        """
+        ufunc.reduceat over each site's rows of `values`, with `empty` for sites that have no points
+        """
+        counts = self.counts
+        shape = (len(self),) + values.shape[1:]
+        out = np.full(shape, empty, dtype=np.float64)
+        has_points = counts > 0
+        if values.shape[0]:
+            out[has_points] = ufunc.reduceat(values, self.offsets[:-1][has_points], axis=0)
+        return out
+
+    def centroids(self):
+        """
+        (n, 2) mean point of each site
+        """
+        return self._reduce(np.add, self.points) / self.counts[:, None]
+
+    def medians(self, tolerance=1e-9, max_iterations=200, check_every=10):
+        """
+        (n, 2) geometric median of each site: the point with the least total distance to the site's points.
+
+        Weiszfeld's algorithm, run for every site at once and starting from the centroids. Each round only touches the
+        points of sites whose estimate still moved by more than `tolerance` in the last one. Weiszfeld crawls when the
+        median is one of the site's own points, so every `check_every` rounds a site whose nearest point is its median
+        is snapped to that point and stops.
+        """
+        n = len(self)
+        site = self.site_index()
+        estimate = self.centroids()
+        active = np.isfinite(estimate[:, 0]) & (self.counts > 1)
+        for iteration in range(1, max_iterations + 1):
+            in_play = active[site]
+            if not in_play.any():
+                break
+            points, owner = self.points[in_play], site[in_play]
+            distances = np.linalg.norm(points - estimate[owner], axis=1)
+            if iteration % check_every == 0 or iteration == max_iterations:
+                snapped = self._snap_to_points(estimate, points, owner, distances)
+                active[snapped] = False
+                continue
+            # A point sitting right on the estimate would get infinite weight
+            weights = 1.0 / np.maximum(distances, tolerance)
+            total = np.bincount(owner, weights, minlength=n)
+            moved = np.column_stack([
+                np.bincount(owner, points[:, 0] * weights, minlength=n),
+                np.bincount(owner, points[:, 1] * weights, minlength=n),
+            ])[active] / total[active, None]
+            shift = np.linalg.norm(moved - estimate[active], axis=1)
+            estimate[active] = moved
+            active[active] = shift > tolerance
+        return estimate
+
+    def _snap_to_points(self, estimate, points, owner, distances, tolerance=1e-12):
+        """
+        Move each site's estimate to its nearest point if that point is the site's median: it is when the unit vectors
+        from it to the site's other points add up to no more than the number of points on top of it. `points` are the
+        points of some of the sites, grouped by site as `owner` says, and `distances` are their distances to the
+        estimates. Returns the sites that were snapped.
+        """
+        n = len(self)
+        order = np.lexsort((distances, owner))
+        sites, first = np.unique(owner[order], return_index=True)
+        candidate = np.full((n, 2), np.nan)
+        candidate[sites] = points[order[first]]
+        offset = points - candidate[owner]
+        length = np.linalg.norm(offset, axis=1)
+        apart = length > tolerance
+        unit = offset[apart] / length[apart, None]
+        pull = np.hypot(
+            np.bincount(owner[apart], unit[:, 0], minlength=n),
+            np.bincount(owner[apart], unit[:, 1], minlength=n),
+        )
+        on_top = np.bincount(owner[~apart], minlength=n)
+        snap = sites[pull[sites] <= on_top[sites]]
+        estimate[snap] = candidate[snap]
+        return snap
+
+    def bounds(self):
+        """
+        (n, 4) bounding box of each site: min x, min y, max x, max y
+        """
+        return np.hstack([self._reduce(np.minimum, self.points), self._reduce(np.maximum, self.points)])
+
+    def areas(self, metres=False):
+        """
+        (n,) area of each site's points taken as a polygon (shoelace formula); zero for fewer than three points.
+
+        In squared coordinate units, or in square metres with `metres`, for (longitude, latitude) points in degrees,
+        projected around each site's centroid.
+        """
+        points = self.points
+        if metres:
+            centroids = self.centroids()
+            radians = np.radians(points - centroids[self.site_index()])
+            cos_lat = np.cos(np.radians(centroids[:, 1]))[self.site_index()]
+            points = EARTH_RADIUS * np.column_stack([radians[:, 0] * cos_lat, radians[:, 1]])
+        # Each point's successor within its own site, wrapping round to the site's first point
+        following = np.arange(len(points)) + 1
+        ends = self.offsets[1:][self.counts > 0]
+        following[ends - 1] = self.offsets[:-1][self.counts > 0]
+        cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+        areas = np.abs(self._reduce(np.add, cross, empty=0.0)) / 2
+        areas[self.counts < 3] = 0.0
+        return areas
+
+    def save(self, path, ids=None):
+        """
+        Write the arrays (and the site IDs, if given) to a compressed .npz file
+        """
+        arrays = {'points': self.points, 'offsets': self.offsets}
+        if ids is not None:
+            arrays['ids'] = np.asarray(ids)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        (SiteCoordinates, ids or None) from a file written by `save`
+        """
+        with np.load(path) as data:
+            ids = data['ids'] if 'ids' in data else None
+            return cls(data['points'], data['offsets']), ids
+
+
+def _parse(strings, points_of):
+    """
+    Bulk-parse coordinate strings with `points_of(string) -> list of x, y tokens`; a site whose coordinates don't parse
+    gets none.
+    """
+    counts = []
+    tokens = []
+    for string in strings:
+        found = points_of(string) if isinstance(string, str) else []
+        counts.append(len(found) // 2)
+        tokens.extend(found[:len(found) // 2 * 2])
+    try:
+        points = _float_array(tokens)
+    except ValueError:
+        # Only convert site by site if something's wrong with one of them
+        points = []
+        start = 0
+        for i, count in enumerate(counts):
+            site = tokens[start:start + 2 * count]
+            start += 2 * count
+            try:
+                # All of the site or none of it, so a bad token can't leave a stray coordinate behind
+                points.extend([float(t) for t in site])
+            except ValueError:
+                counts[i] = 0
+        points = _float_array(points)
+    return SiteCoordinates(points, np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]))
+
+
+def _mega_points(string):
+    # "x y, x y, ..."
+    return string.replace(',', ' ').split()
+
+
+def _kml_points(string):
+    # "x,y[,z] x,y[,z] ..."
+    tokens = []
+    for point in string.split():
+        tokens.extend(point.split(',')[:2])
+    return tokens
+
+
+def parse_mega(strings):
+    """
+    SiteCoordinates from MEGA Jordan "Coordinates" strings, one per site
+    """
+    return _parse(strings, _mega_points)
+
+
+def parse_kml(strings):
+    """
+    SiteCoordinates from KML <coordinates> strings (longitude, latitude, optional altitude), one per site
+    """
+    return _parse(strings, _kml_points)
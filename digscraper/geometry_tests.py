@@ -0,0 +1,60 @@
+"""
+Batch geometry should agree with working each site out on its own.
+"""
+from unittest import TestCase
+
+import numpy as np
+
+from digscraper import geometry
+
+
+class GeometryTest(TestCase):
+
+    def setUp(self):
+        self.sites = geometry.parse_mega([
+            '0 0, 1 0, 1 1, 0 1',  # unit square
+            '0 0, 1 0, 10 0',  # the median is the middle point, not the mean
+            None,
+            '35.5 31.5',
+        ])
+
+    def test_parse(self):
+        self.assertEqual(self.sites.counts.tolist(), [4, 3, 0, 1])
+        kml = geometry.parse_kml(['35.1,31.2,0 35.3,31.4,0', '', '36,32'])
+        self.assertEqual(kml.counts.tolist(), [2, 0, 1])
+        np.testing.assert_allclose(kml.site(0), [[35.1, 31.2], [35.3, 31.4]])
+
+    def test_bad_site_gets_no_points(self):
+        sites = geometry.parse_mega(['1 2', 'north 2', '3 4'])
+        self.assertEqual(sites.counts.tolist(), [1, 0, 1])
+        np.testing.assert_allclose(sites.points, [[1, 2], [3, 4]])
+
+    def test_bad_token_after_good_ones(self):
+        sites = geometry.parse_mega(['1 2, 3 4', '5 6, x 8', '10 20, 30 40'])
+        self.assertEqual(sites.counts.tolist(), [2, 0, 2])
+        self.assertEqual(sites.centroids()[2].tolist(), [20, 30])
+        sites = geometry.parse_mega(['1 2', '5 x', '10 20'])
+        self.assertEqual(sites.points.tolist(), [[1, 2], [10, 20]])
+
+    def test_centroids_and_medians(self):
+        np.testing.assert_allclose(self.sites.centroids()[[0, 1, 3]], [[0.5, 0.5], [11 / 3.0, 0], [35.5, 31.5]])
+        medians = self.sites.medians()
+        np.testing.assert_allclose(medians[[0, 1, 3]], [[0.5, 0.5], [1, 0], [35.5, 31.5]], atol=1e-6)
+        self.assertTrue(np.isnan(medians[2]).all())
+        # Snapped to the middle point exactly, rather than crawling towards it
+        self.assertEqual(medians[1].tolist(), [1, 0])
+
+    def test_median_minimises_total_distance(self):
+        rng = np.random.RandomState(0)
+        points = rng.rand(30, 2)
+        median = geometry.SiteCoordinates(points, [0, 30]).medians()[0]
+        total = lambda p: np.linalg.norm(points - p, axis=1).sum()
+        for step in rng.randn(20, 2) * 1e-3:
+            self.assertLessEqual(total(median), total(median + step))
+
+    def test_bounds_and_areas(self):
+        np.testing.assert_allclose(self.sites.bounds()[0], [0, 0, 1, 1])
+        np.testing.assert_allclose(self.sites.areas()[[0, 1, 2, 3]], [1, 0, 0, 0])
+        # A 0.01 degree square at the equator is about 1.11 km on a side
+        square = geometry.parse_kml(['0,0 0.01,0 0.01,0.01 0,0.01'])
+        self.assertAlmostEqual(square.areas(metres=True)[0] / 1e6, 1.236, places=2)
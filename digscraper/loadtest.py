@@ -0,0 +1,162 @@
+"""
+Load test the crawlers against the mock origin (see digscraper.mockorigin), to tune concurrency and compare fetch
+settings without hitting the real sites.
+
+    python -m digscraper.loadtest daahl ademnes megajordan --sites 2000 --latency 0.05 --error-rate 0.01 \\
+        --burst-every 10 --burst-length 1 --trickle-rate 0.05 --concurrency 200 --per-host 100
+
+Each crawl runs in a child process of its own, in a scratch directory with a fresh attempts database, work queue and
+pack store, and with its URLs pointed at the mock origin. Throughput and request latency come from the origin's side;
+CPU time and peak RSS are the child's own, from the kernel.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from digscraper import synthetic
+from digscraper.mockorigin import MockOrigin, Profile
+from digscraper.packstore import PackWriter
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The path prefix each crawler's requests have at the origin
+PREFIXES = {'daahl': '/DAAHL/', 'ademnes': '/db/', 'megajordan': '/Reports/'}
+
+
+def crawl_daahl(origin, sites, concurrency, per_host, store):
+    os.makedirs('results', exist_ok=True)
+    site_url = origin + '/DAAHL/SitesBrowseView.php?SiteNo={}'
+    with open(os.path.join('results', 'ucsd.xml'), 'w', encoding='UTF-8') as fh:
+        fh.write(synthetic.daahl_kml(sites, site_url=site_url))
+    from daahl import scraper
+    scraper.SITE_URL = site_url
+    scraper.download(concurrency=concurrency, per_host=per_host, store=store)
+
+
+def crawl_ademnes(origin, sites, concurrency, per_host, store):
+    from ADEMNES import scraper
+    scraper.SITE_URL = origin + '/db/site.php?s={}'
+    scraper.download(concurrency=concurrency, per_host=per_host, store=store, site_ids=range(sites))
+
+
+def crawl_megajordan(origin, sites, concurrency, per_host, store):
+    # The queue URL is read when megajordan.main is imported
+    os.environ['DIGSCRAPER_DATABASE_URL'] = 'sqlite:///{}'.format(os.path.abspath('queue.sqlite3'))
+    from megajordan import main
+    main.SiteInfo.BASE_URL = origin + '/Reports/'
+    main.SiteInfo.RESULTS_DIR = os.path.abspath('results')
+    main.SiteInfo.FAILURE_DIR = os.path.join(main.SiteInfo.RESULTS_DIR, 'failure')
+    os.makedirs(main.SiteInfo.FAILURE_DIR, exist_ok=True)
+    main.SiteInfo.STORE = store
+    queue = main.plan(0, sites)
+    with open('finished.txt', 'a+') as fh:
+        main.crawl(queue, fh, per_host=per_host)
+
+
+CRAWLS = {'daahl': crawl_daahl, 'ademnes': crawl_ademnes, 'megajordan': crawl_megajordan}
+
+
+def run_child(target, origin, sites, concurrency, per_host):
+    """
+    The child process: crawl `target` from the origin into a pack store in the current directory
+    """
+    with PackWriter('pack') as store:
+        CRAWLS[target](origin, sites, concurrency, per_host, store)
+
+
+def measure(target, origin, sites, concurrency, per_host, workdir):
+    """
+    Crawl `target` in a child process, and return how it went
+    """
+    os.makedirs(workdir)
+    origin.reset()
+    command = [
+        sys.executable, '-m', 'digscraper.loadtest', '--child', target, '--origin', origin.url, '--sites', str(sites),
+        '--concurrency', str(concurrency), '--per-host', str(per_host),
+    ]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO, os.environ.get('PYTHONPATH')])))
+    started = time.perf_counter()
+    with open(os.path.join(workdir, 'crawl.log'), 'w') as log:
+        child = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - started
+    summary = origin.summary(PREFIXES[target])
+    pages = summary['statuses'].get(200, 0)
+    return dict(
+        summary, target=target, exit=child.returncode, seconds=seconds, pages=pages, pages_per_second=pages / seconds,
+        cpu_seconds=usage.ru_utime + usage.ru_stime, max_rss_mb=usage.ru_maxrss / 1024.0, log=log.name,
+    )
+
+
+def report(results, out=sys.stdout):
+    print('{:<11} {:>7} {:>8} {:>9} {:>9} {:>9} {:>8} {:>8}  {}'.format(
+        'target', 'pages', 'pages/s', 'p50 ms', 'p99 ms', 'CPU s', 'RSS MB', 'wall s', 'statuses',
+    ), file=out)
+    for r in results:
+        ms = lambda seconds: '{:.1f}'.format(seconds * 1000) if seconds is not None else '-'
+        print('{:<11} {:>7} {:>8.1f} {:>9} {:>9} {:>9.2f} {:>8.1f} {:>8.2f}  {}{}'.format(
+            r['target'], r['pages'], r['pages_per_second'], ms(r['p50']), ms(r['p99']), r['cpu_seconds'],
+            r['max_rss_mb'], r['seconds'], r['statuses'], '  (exit {}, see {})'.format(r['exit'], r['log']) if r['exit']
+            else '',
+        ), file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the crawlers against a local mock origin')
+    parser.add_argument('targets', nargs='*', help='Crawlers to run: {} (all of them by default)'.format(
+        ', '.join(sorted(CRAWLS))))
+    parser.add_argument('--sites', type=int, default=1000, help='Sites to crawl (six pages each for megajordan)')
+    parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once')
+    parser.add_argument('--per-host', type=int, default=100, help='Requests in flight to the one host at once')
+    parser.add_argument('--latency', type=float, default=0.0, help='Median seconds before the origin responds')
+    parser.add_argument('--sigma', type=float, default=0.5, help='Spread of the log-normal latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that get a 500')
+    parser.add_argument('--burst-every', type=float, default=0.0, help='Seconds between throttling bursts')
+    parser.add_argument('--burst-length', type=float, default=0.0, help='Seconds each throttling burst lasts')
+    parser.add_argument('--burst-status', type=int, default=429, choices=[429, 503], help='Status during bursts')
+    parser.add_argument('--trickle-rate', type=float, default=0.0, help='Fraction of bodies sent slowly')
+    parser.add_argument('--trickle-delay', type=float, default=0.05, help='Seconds between trickled chunks')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the origin, so runs can be repeated')
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--keep', action='store_true', help="Keep the crawls' scratch directories")
+    parser.add_argument('--child', choices=sorted(CRAWLS), help=argparse.SUPPRESS)
+    parser.add_argument('--origin', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = set(args.targets) - set(CRAWLS)
+    if unknown:
+        parser.error('No crawler called {}'.format(', '.join(sorted(unknown))))
+    if args.child:
+        run_child(args.child, args.origin, args.sites, args.concurrency, args.per_host)
+        return
+
+    profile = Profile(
+        latency=args.latency, sigma=args.sigma, error_rate=args.error_rate, burst_every=args.burst_every,
+        burst_length=args.burst_length, burst_status=args.burst_status, trickle_rate=args.trickle_rate,
+        trickle_delay=args.trickle_delay, seed=args.seed,
+    )
+    scratch = tempfile.mkdtemp(prefix='loadtest-')
+    results = []
+    with MockOrigin(profile) as origin:
+        for target in args.targets or sorted(CRAWLS):
+            results.append(measure(
+                target, origin, args.sites, args.concurrency, args.per_host, os.path.join(scratch, target),
+            ))
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if args.keep:
+        print('Scratch directories are under {}'.format(scratch))
+    else:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    main()
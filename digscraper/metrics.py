@@ -0,0 +1,241 @@
+"""
+In-process crawl metrics: counters, gauges and histograms with labels, served over HTTP in the Prometheus text format.
+
+    requests = metrics.counter('digscraper_requests_total', 'Responses received', ['source', 'host', 'status'])
+    requests.inc(source='daahl', host='daahl.ucsd.edu', status=200)
+
+    metrics.serve(8000)  # then: curl localhost:8000/metrics
+
+The FetchEngine and the synchronous session pool record the standard crawl metrics below, so a scraper only has to
+call `serve` to be watched live. Everything is thread-safe, and cheap enough to record on every request.
+"""
+import bisect
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Request times from a fast local origin up to a very slow real one
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Body sizes from an empty error page up to a huge site record
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    """
+    A metric family: one value (or set of values) per combination of label values
+    """
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError('{} has labels {}, not {}'.format(self.name, self.labels, tuple(sorted(labels))))
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _selector(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in pairs) + '}'
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def samples(self):
+        """
+        Yields (name suffix, label key, extra labels, value) for every sample
+        """
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield '', key, (), value
+
+    def exposition(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.kind)]
+        for suffix, key, extra, value in self.samples():
+            lines.append('{}{}{} {}'.format(self.name, suffix, self._selector(key, extra), number(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Counts of observations at or below each bucket's upper bound, plus their sum and count
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def value(self, **labels):
+        """
+        (cumulative count per bucket, sum), or None
+        """
+        with self._lock:
+            found = self._values.get(self._key(labels))
+        if found is None:
+            return None
+        counts, total = found
+        cumulative = []
+        for count in counts:
+            cumulative.append(count + (cumulative[-1] if cumulative else 0))
+        return cumulative, total
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                yield '_bucket', key, (('le', number(float(bound))),), running
+            yield '_sum', key, (), total
+            yield '_count', key, (), running
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+                raise ValueError('{} is already registered as a different metric'.format(name))
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def exposition(self):
+        """
+        Every metric in the Prometheus text format
+        """
+        with self._lock:
+            metrics = sorted(self.metrics.values(), key=lambda m: m.name)
+        return ''.join(metric.exposition() + '\n' for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help, labels=()):
+    return REGISTRY.counter(name, help, labels)
+
+
+def gauge(name, help, labels=()):
+    return REGISTRY.gauge(name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.histogram(name, help, labels, buckets)
+
+
+# The standard crawl metrics, recorded by FetchEngine and the session pool
+REQUESTS = counter('digscraper_requests_total', 'Responses received, by status', ['source', 'host', 'status'])
+REQUEST_SECONDS = histogram(
+    'digscraper_request_seconds', 'Time from sending a request until its response was handled', ['source', 'host'],
+)
+RESPONSE_BYTES = histogram(
+    'digscraper_response_bytes', 'Size of response bodies', ['source', 'host'], buckets=SIZE_BUCKETS,
+)
+ERRORS = counter(
+    'digscraper_request_errors_total', 'Requests that raised instead of getting a response', ['source', 'host', 'error'],
+)
+RETRIES = counter('digscraper_retries_total', 'Requests tried again, by why', ['source', 'host', 'reason'])
+FAILED = counter('digscraper_jobs_failed_total', 'Jobs given up on after every retry', ['source', 'host'])
+IN_FLIGHT = gauge('digscraper_requests_in_flight', 'Requests sent and not yet handled', ['source'])
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode('UTF-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would drown out the crawl's own output
+
+
+def serve(port=8000, host='0.0.0.0', registry=REGISTRY):
+    """
+    Serve the metrics at http://host:port/metrics from a background thread. Returns the server; `.shutdown()` it to
+    stop.
+    """
+    handler = type('Handler', (MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -0,0 +1,62 @@
+"""
+Metrics should add up, come out in the Prometheus text format, and be recorded by the fetch engine.
+"""
+from unittest import TestCase
+from urllib.request import urlopen
+
+from digscraper import metrics
+from digscraper.fetch import FetchEngine, Job
+from digscraper.mockorigin import MockOrigin, Profile
+
+
+class MetricsTest(TestCase):
+
+    def test_exposition(self):
+        registry = metrics.Registry()
+        requests = registry.counter('requests_total', 'Requests', ['host', 'status'])
+        requests.inc(host='a.example', status=200)
+        requests.inc(2, host='a.example', status=200)
+        seconds = registry.histogram('request_seconds', 'Request time', ['host'], buckets=[0.1, 1])
+        for value in [0.05, 0.5, 0.5, 3]:
+            seconds.observe(value, host='a"b')
+        self.assertEqual(requests.value(host='a.example', status='200'), 3)
+        self.assertEqual(seconds.value(host='a"b'), ([1, 3, 4], 4.05))
+        self.assertEqual(registry.exposition(), '\n'.join([
+            '# HELP request_seconds Request time',
+            '# TYPE request_seconds histogram',
+            'request_seconds_bucket{host="a\\"b",le="0.1"} 1',
+            'request_seconds_bucket{host="a\\"b",le="1"} 3',
+            'request_seconds_bucket{host="a\\"b",le="+Inf"} 4',
+            'request_seconds_sum{host="a\\"b"} 4.05',
+            'request_seconds_count{host="a\\"b"} 4',
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{host="a.example",status="200"} 3',
+            '',
+        ]))
+        with self.assertRaises(ValueError):
+            requests.inc(host='a.example')
+        with self.assertRaises(ValueError):
+            registry.gauge('requests_total', 'Not a counter')
+
+    def test_fetch_engine_and_serve(self):
+        async def handle(response, attempt):
+            return await response.read()
+
+        labels = dict(source='metrics-test', host=None)
+        with MockOrigin(Profile(burst_every=3600, burst_length=3600, burst_status=503)) as origin:
+            labels['host'] = origin.url.split('//')[1]
+            FetchEngine(backoff=0, retries=1, source='metrics-test').run([Job(origin.url + '/db/site.php?s=1', handle)])
+        self.assertEqual(metrics.REQUESTS.value(status=503, **labels), 2)
+        self.assertEqual(metrics.RETRIES.value(reason=503, **labels), 1)
+        self.assertEqual(metrics.REQUEST_SECONDS.value(**labels)[0][-1], 1)
+        self.assertEqual(metrics.IN_FLIGHT.value(source='metrics-test'), 0)
+
+        server = metrics.serve(0, host='127.0.0.1')
+        try:
+            with urlopen('http://127.0.0.1:{}/metrics'.format(server.server_address[1])) as response:
+                body = response.read().decode('UTF-8')
+        finally:
+            server.shutdown()
+        self.assertIn('digscraper_requests_total{{source="metrics-test",host="{}",status="503"}} 2'.format(
+            labels['host']), body)
@@ -0,0 +1,193 @@
+"""
+A local stand-in for the DAAHL, ADEMNES and MEGA Jordan sites, serving synthetic pages (see digscraper.synthetic) at
+the same paths the scrapers ask for, so crawls can be load tested without touching the real servers:
+
+    /DAAHL/SitesBrowseView.php?SiteNo=<id>
+    /db/site.php?s=<id>
+    /Reports/<Resource>?gid=<gid>
+
+How the origin misbehaves is set by a Profile: how long responses take (log-normally distributed, like real servers),
+how many fail with a 500, regular bursts during which every request gets a 429 or 503, and how many bodies trickle out
+slowly a chunk at a time.
+
+    with MockOrigin(Profile(latency=0.05, error_rate=0.01)) as origin:
+        daahl.scraper.SITE_URL = origin.url + '/DAAHL/SitesBrowseView.php?SiteNo={}'
+        ...
+        origin.summary()
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from digscraper import synthetic
+
+
+class Profile(object):
+    """
+    How the mock origin behaves.
+
+    `latency` is the median seconds before a response starts, and `sigma` the spread of its log-normal distribution
+    (0 for always exactly `latency`). `error_rate` is the fraction of requests answered with a 500. Every
+    `burst_every` seconds, for `burst_length` seconds, every request is answered with `burst_status`. `trickle_rate` is
+    the fraction of bodies sent in `trickle_chunks` pieces with `trickle_delay` seconds between them.
+    """
+
+    def __init__(self, latency=0.0, sigma=0.5, error_rate=0.0, burst_every=0.0, burst_length=0.0, burst_status=429,
+                 trickle_rate=0.0, trickle_chunks=8, trickle_delay=0.05, seed=None):
+        self.latency = latency
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.burst_status = burst_status
+        self.trickle_rate = trickle_rate
+        self.trickle_chunks = trickle_chunks
+        self.trickle_delay = trickle_delay
+        self.seed = seed
+
+    def delay(self, rng):
+        if not self.latency:
+            return 0.0
+        return self.latency * math.exp(self.sigma * rng.gauss(0, 1))
+
+    def in_burst(self, elapsed):
+        return bool(self.burst_every) and elapsed % self.burst_every < self.burst_length
+
+
+def page_for(path, query):
+    """
+    The synthetic page for a request path and its query parameters, or None for anything the real sites don't serve
+    """
+    try:
+        if path.endswith('/SitesBrowseView.php'):
+            return synthetic.daahl_page(int(query['SiteNo']))
+        if path.endswith('/db/site.php'):
+            return synthetic.ademnes_page(int(query['s']))
+        if '/Reports/' in path:
+            return synthetic.mega_report_page(int(query['gid']), path.rsplit('/', 1)[-1])
+    except (KeyError, ValueError):
+        return None
+    return None
+
+
+class MockOrigin(object):
+    """
+    The mock origin, running on its own event loop in a background thread. `url` is where it's listening.
+
+    Each request is recorded as (path, status, seconds from receiving it to finishing the body) in `requests`.
+    """
+
+    def __init__(self, profile=None, host='127.0.0.1', port=0):
+        self.profile = profile or Profile()
+        self.host = host
+        self.port = port
+        self.requests = []
+        self.rng = random.Random(self.profile.seed)
+        self._started = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def reset(self):
+        """
+        Forget the recorded requests, and start the burst schedule again
+        """
+        self.requests = []
+        self._started = time.monotonic()
+
+    async def handle(self, request):
+        received = time.perf_counter()
+        profile = self.profile
+        status = 200
+        try:
+            await asyncio.sleep(profile.delay(self.rng))
+            if profile.in_burst(time.monotonic() - self._started):
+                status = profile.burst_status
+                return web.Response(status=status, text='Slow down', headers={'Retry-After': '1'})
+            if self.rng.random() < profile.error_rate:
+                status = 500
+                return web.Response(status=status, text='Internal Server Error')
+            page = page_for(request.path, request.query)
+            if page is None:
+                status = 404
+                return web.Response(status=status, text='Not Found')
+            body = page.encode('UTF-8')
+            if self.rng.random() >= profile.trickle_rate:
+                return web.Response(body=body, content_type='text/html', charset='utf-8')
+            response = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+            response.content_length = len(body)
+            await response.prepare(request)
+            size = max(len(body) // profile.trickle_chunks, 1)
+            for start in range(0, len(body), size):
+                await response.write(body[start:start + size])
+                await asyncio.sleep(profile.trickle_delay)
+            await response.write_eof()
+            return response
+        finally:
+            self.requests.append((request.path, status, time.perf_counter() - received))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name='mock-origin', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_route('GET', '/{tail:.*}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port, backlog=4096)
+        self._loop.run_until_complete(site.start())
+        self.port = self._runner.addresses[0][1]
+        self.reset()
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def summary(self, prefix=''):
+        """
+        Counts by status, and request time percentiles in seconds, for the requests whose paths start with `prefix`
+        """
+        requests = [r for r in list(self.requests) if r[0].startswith(prefix)]
+        times = sorted(r[2] for r in requests)
+        return {
+            'requests': len(requests),
+            'statuses': dict(Counter(r[1] for r in requests)),
+            'p50': percentile(times, 50),
+            'p99': percentile(times, 99),
+        }
+
+
+def percentile(ordered, p):
+    """
+    The p-th percentile of an already sorted list (nearest rank), or None if it's empty
+    """
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(int(math.ceil(p / 100.0 * len(ordered))) - 1, 0))]
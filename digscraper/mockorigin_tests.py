@@ -0,0 +1,64 @@
+"""
+The mock origin should serve what the scrapers expect, and misbehave exactly as much as it's told to.
+"""
+import time
+from unittest import TestCase
+
+from digscraper import synthetic
+from digscraper.fetch import FetchEngine, Job
+from digscraper.mockorigin import MockOrigin, Profile, percentile
+
+
+def fetch_all(origin, paths, **engine):
+    async def handle(response, attempt):
+        return response.status, await response.text()
+
+    fetcher = FetchEngine(concurrency=10, per_host=10, backoff=0, **engine)
+    return fetcher.run(Job(origin.url + path, handle) for path in paths)
+
+
+class MockOriginTest(TestCase):
+
+    def test_pages(self):
+        with MockOrigin() as origin:
+            results = dict(fetch_all(origin, [
+                '/DAAHL/SitesBrowseView.php?SiteNo=353102710', '/db/site.php?s=12', '/Reports/SiteGeneral?gid=2431',
+            ]))
+            self.assertEqual(sorted(results), [200])
+            self.assertEqual(fetch_all(origin, ['/db/site.php?s=12'])[0][1], synthetic.ademnes_page(12))
+            self.assertEqual(fetch_all(origin, ['/nowhere'])[0][0], 404)
+            summary = origin.summary('/db/')
+            self.assertEqual((summary['requests'], summary['statuses']), (2, {200: 2}))
+
+    def test_misbehaviour(self):
+        with MockOrigin(Profile(error_rate=1.0)) as origin:
+            self.assertEqual(fetch_all(origin, ['/db/site.php?s=1'])[0][0], 500)
+        # Throttled the whole time: the engine retries, then hands over the last response
+        with MockOrigin(Profile(burst_every=3600, burst_length=3600, burst_status=503)) as origin:
+            self.assertEqual(fetch_all(origin, ['/db/site.php?s=1'], retries=2)[0][0], 503)
+            self.assertEqual(origin.summary()['statuses'], {503: 3})
+        # A trickled body arrives whole, just later
+        with MockOrigin(Profile(trickle_rate=1.0, trickle_chunks=4, trickle_delay=0.01)) as origin:
+            started = time.perf_counter()
+            status, body = fetch_all(origin, ['/Reports/SiteGeneral?gid=7'])[0]
+            self.assertGreaterEqual(time.perf_counter() - started, 0.03)
+            self.assertEqual((status, body), (200, synthetic.mega_report_page(7, 'SiteGeneral')))
+
+    def test_results_as_they_finish(self):
+        async def handle(response, attempt):
+            return response.url.path, time.perf_counter()
+
+        # Each result is reported when its job finishes, not when the slowest one does
+        with MockOrigin(Profile(latency=0.1, sigma=1.0, seed=1)) as origin:
+            seen = []
+            fetcher = FetchEngine(concurrency=10, per_host=10, backoff=0)
+            jobs = [Job(origin.url + '/db/site.php?s={}'.format(i), handle) for i in range(10)]
+            self.assertEqual(fetcher.run(jobs, on_result=lambda result: seen.append((result, time.perf_counter()))), [])
+        self.assertEqual(len(seen), 10)
+        self.assertTrue(all(reported - finished < 0.05 for (_, finished), reported in seen))
+        self.assertGreater(seen[-1][1] - seen[0][1], 0.1)
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+        self.assertEqual(percentile([5], 50), 5)
+        self.assertIsNone(percentile([], 50))
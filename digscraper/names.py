@@ -0,0 +1,271 @@
+"""
+Fuzzy matching of site names across sources, without scoring every name against every other one.
+
+Names are normalised (accents, case, the `'ʿʾ of transliteration and generic words like Khirbat dropped) and broken
+into trigrams, and the index keeps, for every trigram, the names that contain it. Two names' score is the Jaccard
+similarity of their trigram sets, and only names that share a trigram ever get compared. A batch of queries is joined
+against the index all at once with NumPy, so blocking a whole corpus costs about the number of shared trigrams rather
+than the number of pairs.
+
+    index = NameIndex([(site_id, name) for site_id, name in daahl_names])
+    index.lookup('Khirbet Jubeil Naqqar', k=5)  # [(site_id, score, name), ...], best first
+    match_names({'daahl': daahl_names, 'mega': mega_names}, threshold=0.5)
+
+A key can have any number of names (a site's name and its alternates); results give each key once, with its best name.
+"""
+import re
+import unicodedata
+
+import numpy as np
+
+# Apostrophes, ayins and hamzas, which transliterations put in or leave out as they please
+MARKS = re.compile("[`'‘’ʻʼʾʿ]")
+NOT_WORDS = re.compile(r'[\W_]+')
+# Words for the kind of place, which would otherwise make every Khirbat look like every other Khirbat
+GENERIC_WORDS = frozenset([
+    'ain', 'al', 'ayn', 'bir', 'el', 'h', 'horbat', 'jabal', 'jebel', 'kh', 'khirbat', 'khirbet', 'nn', 'qasr', 'site',
+    'tall', 'tel', 'tell', 'umm', 'wadi',
+])
+
+
+def normalize_name(name):
+    """
+    Lower case, with no accents or transliteration marks, and words separated by single spaces
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = MARKS.sub('', name.lower())
+    return NOT_WORDS.sub(' ', name).strip()
+
+
+def name_words(name):
+    """
+    The normalised name without its generic words, unless that would leave nothing
+    """
+    words = name.split()
+    specific = [w for w in words if w not in GENERIC_WORDS]
+    return ' '.join(specific or words)
+
+
+def trigrams(name):
+    """
+    The set of trigrams of a normalised name, padded so that the start and end of each word count
+    """
+    if not name:
+        return set()
+    padded = '  {} '.format(name)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex(object):
+    """
+    (key, name) entries, and for each trigram the entries that contain it
+    """
+
+    # Rows of the trigram join to hold in memory at once
+    max_pairs = 4000000
+
+    def __init__(self, names=()):
+        self.keys = []
+        self.names = []
+        self.grams = []
+        self._frozen = None
+        for key, name in names:
+            self.add(key, name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, key, name):
+        """
+        Index one of the key's names; blank names are ignored
+        """
+        if not name:
+            return
+        grams = trigrams(name_words(normalize_name(name)))
+        if not grams:
+            return
+        self.keys.append(key)
+        self.names.append(name)
+        self.grams.append(grams)
+        self._frozen = None
+
+    def _freeze(self):
+        """
+        The postings as arrays: every entry index sorted by trigram, and where each trigram's run of them starts
+        """
+        if self._frozen is None:
+            vocabulary = {}
+            gram_ids = []
+            entries = []
+            for entry, grams in enumerate(self.grams):
+                for gram in grams:
+                    gram_ids.append(vocabulary.setdefault(gram, len(vocabulary)))
+                    entries.append(entry)
+            gram_ids = np.array(gram_ids, dtype=np.int64)
+            order = np.argsort(gram_ids, kind='stable')
+            starts = np.concatenate([[0], np.cumsum(np.bincount(gram_ids, minlength=len(vocabulary)))])
+            key_numbers = {}
+            key_ids = np.array([key_numbers.setdefault(key, len(key_numbers)) for key in self.keys], dtype=np.int64)
+            sizes = np.array([len(grams) for grams in self.grams], dtype=np.int64)
+            # Which entry has which trigram, as sorted entry * vocabulary size + trigram
+            has = np.sort(np.array(entries, dtype=np.int64) * len(vocabulary) + gram_ids)
+            self._frozen = vocabulary, starts, np.array(entries, dtype=np.int64)[order], sizes, key_ids, has
+        return self._frozen
+
+    def scores(self, names, threshold=0.0, max_postings=None):
+        """
+        Every (query index, entry index, score) with a score of at least `threshold` (and above zero), as three arrays.
+
+        With a threshold, each query is only joined on its rarest trigrams: a name scoring `threshold` has to share at
+        least that fraction of the query's trigrams, so it must share one of the rest. The candidates that finds are
+        then scored in full. Trigrams found in more than `max_postings` entries are left out of the join altogether,
+        which makes blocking on common trigrams cheaper still, but can miss pairs.
+        """
+        vocabulary, starts = self._freeze()[:2]
+        empty = np.empty(0, dtype=np.int64)
+        query_sizes = []
+        query_of = []
+        gram_of = []
+        for q, name in enumerate(names):
+            grams = trigrams(name_words(normalize_name(name or '')))
+            query_sizes.append(len(grams))
+            known = [vocabulary[g] for g in grams if g in vocabulary]
+            query_of.extend([q] * len(known))
+            gram_of.extend(known)
+        if not query_of:
+            return empty, empty, np.empty(0)
+        query_sizes = np.array(query_sizes, dtype=np.int64)
+        query_of = np.array(query_of, dtype=np.int64)
+        gram_of = np.array(gram_of, dtype=np.int64)
+        lengths = starts[gram_of + 1] - starts[gram_of]
+        all_query_of, all_gram_of = query_of, gram_of
+        if threshold > 0:
+            # Rarest first within each query, then just the prefix. Trigrams the index doesn't have are the rarest of
+            # all, and count towards the prefix without costing anything.
+            order = np.lexsort((lengths, query_of))
+            query_of, gram_of, lengths = query_of[order], gram_of[order], lengths[order]
+            known = np.bincount(query_of, minlength=len(query_sizes))
+            rank = np.arange(len(query_of)) - np.repeat(np.cumsum(known) - known, known)
+            prefix = query_sizes - np.ceil(threshold * query_sizes - 1e-9).astype(np.int64) + 1
+            prefix -= query_sizes - known
+            first = rank < prefix[query_of]
+            query_of, gram_of, lengths = query_of[first], gram_of[first], lengths[first]
+        if max_postings is not None:
+            common = lengths > max_postings
+            query_of, gram_of, lengths = query_of[~common], gram_of[~common], lengths[~common]
+
+        # Join a group of whole queries at a time, so memory stays bounded however common their trigrams are
+        known = np.bincount(all_query_of, minlength=len(query_sizes))
+        query_grams = (np.cumsum(known) - known, known, all_gram_of)
+        bounds = np.flatnonzero(np.diff(query_of)) + 1
+        total = np.cumsum(lengths)
+        found = [(empty, empty, np.empty(0))]
+        start = 0
+        while start < len(query_of):
+            end = np.searchsorted(total, (total[start - 1] if start else 0) + self.max_pairs, side='right')
+            if end < len(query_of):
+                # Back to the start of the query that doesn't fit, unless that means no queries at all
+                before = bounds[:np.searchsorted(bounds, end, side='right')]
+                after = bounds[np.searchsorted(bounds, start, side='right'):]
+                if len(before) and before[-1] > start:
+                    end = before[-1]
+                else:
+                    end = after[0] if len(after) else len(query_of)
+            found.append(self._join(
+                query_of[start:end], gram_of[start:end], lengths[start:end], query_sizes, query_grams, threshold,
+            ))
+            start = end
+        return tuple(np.concatenate(arrays) for arrays in zip(*found))
+
+    def _join(self, query_of, gram_of, lengths, query_sizes, query_grams, threshold):
+        vocabulary, starts, postings, sizes, _, has = self._freeze()
+        # Every entry sharing each of the queries' trigrams: the trigram's start, plus 0, 1, ... up to its length
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entries = postings[np.repeat(starts[gram_of], lengths) + within]
+        pairs, shared = np.unique(np.repeat(query_of, lengths) * len(self) + entries, return_counts=True)
+        queries, entries = pairs // len(self), pairs % len(self)
+        if threshold > 0:
+            # Names too much longer or shorter than the query can't reach the threshold
+            fits = (sizes[entries] >= threshold * query_sizes[queries] - 1e-9)
+            fits &= (threshold * sizes[entries] <= query_sizes[queries] + 1e-9)
+            queries, entries = queries[fits], entries[fits]
+            shared = self._shared(queries, entries, query_grams, len(vocabulary), has)
+        scores = shared / (query_sizes[queries] + sizes[entries] - shared)
+        keep = (scores >= threshold) & (scores > 0)
+        return queries[keep], entries[keep], scores[keep]
+
+    @staticmethod
+    def _shared(queries, entries, query_grams, vocabulary_size, has):
+        """
+        How many trigrams each (query, entry) pair has in common. `query_grams` is where each query's known trigrams
+        start and how many there are, and then all of them.
+        """
+        firsts, counts, grams = query_grams
+        lengths = counts[queries]
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        wanted = np.repeat(entries, lengths) * vocabulary_size + grams[np.repeat(firsts[queries], lengths) + within]
+        at = np.minimum(np.searchsorted(has, wanted), len(has) - 1)
+        return np.bincount(np.repeat(np.arange(len(queries)), lengths), has[at] == wanted, minlength=len(queries))
+
+    def best_per_key(self, queries, entries, scores):
+        """
+        Of (query, entry, score) arrays, just the best entry for each (query, key), ordered by query and then score
+        """
+        key_ids = self._freeze()[4]
+        order = np.lexsort((-scores, key_ids[entries], queries))
+        queries, entries, scores = queries[order], entries[order], scores[order]
+        first = np.ones(len(queries), dtype=bool)
+        first[1:] = (queries[1:] != queries[:-1]) | (key_ids[entries[1:]] != key_ids[entries[:-1]])
+        queries, entries, scores = queries[first], entries[first], scores[first]
+        order = np.lexsort((-scores, queries))
+        return queries[order], entries[order], scores[order]
+
+    def lookup_many(self, names, k=5, threshold=0.0):
+        """
+        For each name, up to `k` [(key, score, matched name), ...], best first
+        """
+        names = list(names)
+        results = [[] for _ in names]
+        if not len(self):
+            return results
+        for q, entry, score in zip(*(a.tolist() for a in self.best_per_key(*self.scores(names, threshold)))):
+            if len(results[q]) < k:
+                results[q].append((self.keys[entry], score, self.names[entry]))
+        return results
+
+    def lookup(self, name, k=5, threshold=0.0):
+        """
+        Up to `k` [(key, score, matched name), ...] for the name, best first
+        """
+        return self.lookup_many([name], k, threshold)[0]
+
+
+def match_names(sources, threshold=0.5, batch=5000, max_postings=None):
+    """
+    Candidate pairs of sites from two different sources whose names score at least `threshold`, as dicts of source_a,
+    id_a, name_a, source_b, id_b, name_b and score, one per pair of sites (with their best-matching names).
+
+    `sources` maps a source name to (id, name) pairs; a site can appear in several pairs, once for each of its names.
+    Each pair of sources is matched once, in the order they're given, a `batch` of names at a time.
+    """
+    names = list(sources)
+    sources = {name: [(key, n) for key, n in sources[name] if n] for name in names}
+    matches = []
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            index = NameIndex(sources[b])
+            best = {}
+            for start in range(0, len(sources[a]), batch):
+                chunk = sources[a][start:start + batch]
+                found = index.scores([n for _, n in chunk], threshold, max_postings)
+                for q, entry, score in zip(*(x.tolist() for x in index.best_per_key(*found))):
+                    pair = (chunk[q][0], index.keys[entry])
+                    if pair not in best or score > best[pair]['score']:
+                        best[pair] = {
+                            'source_a': a, 'id_a': pair[0], 'name_a': chunk[q][1],
+                            'source_b': b, 'id_b': pair[1], 'name_b': index.names[entry],
+                            'score': score,
+                        }
+            matches.extend(sorted(best.values(), key=lambda m: -m['score']))
+    return matches
@@ -0,0 +1,58 @@
+"""
+The trigram index should score names exactly as comparing their trigram sets directly does.
+"""
+import random
+from unittest import TestCase
+
+from digscraper import names
+
+
+def jaccard(a, b):
+    a, b = (names.trigrams(names.name_words(names.normalize_name(n))) for n in (a, b))
+    return len(a & b) / float(len(a | b))
+
+
+class NamesTest(TestCase):
+
+    def setUp(self):
+        self.index = names.NameIndex([
+            ('353102710', "Horbat `Adullam"),
+            ('353102710', 'Khirbat Jubeil Naqqar'),
+            ('353102710', 'Horbat Nakar'),
+            ('353002210', 'Khirbat Id al Minya'),
+            ('1', 'Tall Ḥisbān'),
+            ('2', ''),
+        ])
+
+    def test_normalize_name(self):
+        self.assertEqual(names.normalize_name("Horbat `Adullam"), 'horbat adullam')
+        self.assertEqual(names.normalize_name('Tall  Ḥisbān (North)'), 'tall hisban north')
+        self.assertEqual(names.name_words('tall hisban north'), 'hisban north')
+        self.assertEqual(names.name_words('tall'), 'tall')
+
+    def test_lookup(self):
+        self.assertEqual(len(self.index), 5)
+        found = self.index.lookup('Khirbet Jubeil Naqar', k=5)
+        # Each key once, with its best name; sharing "Khirbat" alone doesn't make a match
+        self.assertEqual([key for key, _, _ in found], ['353102710'])
+        self.assertEqual(found[0][2], 'Khirbat Jubeil Naqqar')
+        self.assertAlmostEqual(found[0][1], jaccard('Khirbet Jubeil Naqar', 'Khirbat Jubeil Naqqar'))
+        self.assertEqual(self.index.lookup('Tell Hisban', k=1)[0][0], '1')
+        self.assertEqual(self.index.lookup('zzzz'), [])
+
+    def test_match_names_is_brute_force(self):
+        rng = random.Random(0)
+        syllables = ['kh', 'ir', 'bat', 'tal', 'um', 'ra', 'jab', 'al', 'ain', 'sh', 'ams', 'el', 'qas', 'ir']
+        word = lambda: ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        a = [(i, '{} {}'.format(word(), word())) for i in range(150)]
+        b = [(i, '{} {}'.format(word(), word())) for i in range(150)]
+        matches = names.match_names({'a': a, 'b': b}, threshold=0.3, batch=40)
+        expected = {}
+        for id_a, name_a in a:
+            for id_b, name_b in b:
+                score = jaccard(name_a, name_b)
+                if score >= 0.3:
+                    expected[id_a, id_b] = max(score, expected.get((id_a, id_b), 0))
+        self.assertEqual(len(matches), len(expected))
+        for m in matches:
+            self.assertAlmostEqual(m['score'], expected[m['id_a'], m['id_b']])
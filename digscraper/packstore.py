@@ -0,0 +1,304 @@
+"""
+Compressed, content-addressed pack files for crawled pages.
+
+Instead of one small HTML file per page, every scraper appends pages to a shared store:
+
+    <root>/seg-00000.pack   append-only segments of zlib-compressed page bodies. Identical bodies are stored once.
+    <root>/journal.tsv      append-only log of "source, id, resource -> body digest, segment, offset, length"
+    <root>/index.bin        open-addressing hash table built from the journal, memory-mapped by readers for O(1) lookups
+
+Lookups go through index.bin, plus a small in-memory overlay of any journal entries written since the index was last
+rebuilt, so readers never need to wait for a writer to close. The index only holds a 64-bit hash of each key, so a hit
+is checked against the key on its journal line. Each journal line is written out as soon as its page is stored.
+
+A store has a single writer: only one PackWriter, in one process, may write to it at a time.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+DEFAULT_ROOT = os.environ.get('DIGSCRAPER_PACKS', 'packs')
+JOURNAL = 'journal.tsv'
+INDEX = 'index.bin'
+SEGMENT = 'seg-{:05d}.pack'
+
+BLOB_HEADER = struct.Struct('>20sI')  # sha1 of the raw body, compressed length
+INDEX_HEADER = struct.Struct('<8sQQ')  # magic, slot count, journal bytes covered by the index
+INDEX_SLOT = struct.Struct('<QIQIQ')  # key hash (0 means empty), segment, offset, length, journal line position
+INDEX_MAGIC = b'DIGPACK2'
+
+
+def key_hash(source, site_id, resource):
+    """
+    64-bit hash of a page key. Zero is reserved for empty index slots.
+    """
+    key = '{}\0{}\0{}'.format(source, site_id, resource).encode('UTF-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+
+def read_journal(root, start=0, positions=False):
+    """
+    Yields (source, id, resource, digest, segment, offset, length) for each complete journal line after `start` bytes,
+    then returns the byte position reached. A torn final line (from a crash) is ignored. With `positions`, each entry
+    ends with the position of its line too.
+    """
+    path = os.path.join(root, JOURNAL)
+    if not os.path.exists(path):
+        return start
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        for line in fh:
+            if not line.endswith(b'\n'):
+                break
+            source, site_id, resource, digest, segment, offset, length = line.decode('UTF-8').rstrip('\n').split('\t')
+            entry = (source, site_id, resource, digest, int(segment), int(offset), int(length))
+            yield entry + (start,) if positions else entry
+            start += len(line)
+    return start
+
+
+class PackWriter(object):
+    """
+    Appends pages to a pack store. Safe to share between threads; use `shared_writer` to share one between scrapers.
+    It must be the store's only writer.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, segment_size=256 * 1024 * 1024, level=6):
+        self.root = root
+        self.segment_size = segment_size
+        self.level = level
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # Digest -> location of every body already stored, so duplicates are only written once
+        self._blobs = {}
+        for _, _, _, digest, segment, offset, length in read_journal(root):
+            self._blobs[digest] = (segment, offset, length)
+        segments = sorted(f for f in os.listdir(root) if f.startswith('seg-'))
+        self._segment = int(segments[-1][4:9]) if segments else 0
+        self._pack = open(os.path.join(root, SEGMENT.format(self._segment)), 'ab')
+        self._journal = open(os.path.join(root, JOURNAL), 'ab')
+
+    def put(self, source, site_id, resource, data):
+        """
+        Store one page body (bytes) under (source, id, resource). Returns the hex digest of the body.
+
+        The journal line is flushed before returning, so readers opened from then on see the page, and a crash doesn't
+        lose the entries for bodies already in the pack.
+        """
+        digest = hashlib.sha1(data)
+        hexdigest = digest.hexdigest()
+        with self._lock:
+            if hexdigest not in self._blobs:
+                self._blobs[hexdigest] = self._append(digest.digest(), zlib.compress(data, self.level))
+            segment, offset, length = self._blobs[hexdigest]
+            self._journal.write('{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(
+                source, site_id, resource, hexdigest, segment, offset, length
+            ).encode('UTF-8'))
+            self._journal.flush()
+        return hexdigest
+
+    def _append(self, digest, compressed):
+        if self._pack.tell() >= self.segment_size:
+            self._pack.close()
+            self._segment += 1
+            self._pack = open(os.path.join(self.root, SEGMENT.format(self._segment)), 'ab')
+        self._pack.write(BLOB_HEADER.pack(digest, len(compressed)))
+        offset = self._pack.tell()
+        self._pack.write(compressed)
+        # The journal entry must never point at bytes that aren't in the segment yet
+        self._pack.flush()
+        return self._segment, offset, len(compressed)
+
+    def flush(self):
+        with self._lock:
+            self._pack.flush()
+            self._journal.flush()
+
+    def close(self):
+        """
+        Flush everything, and rebuild the index so readers don't need a journal overlay
+        """
+        with self._lock:
+            self._pack.close()
+            self._journal.close()
+        build_index(self.root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_writer(root=DEFAULT_ROOT):
+    """
+    The one PackWriter for `root` in this process
+    """
+    root = os.path.abspath(root)
+    with _shared_lock:
+        if root not in _shared:
+            _shared[root] = PackWriter(root)
+        return _shared[root]
+
+
+def build_index(root):
+    """
+    Rebuild index.bin from the journal. Later journal entries for the same key win.
+    """
+    entries = {}
+    journal = read_journal(root, positions=True)
+    while True:
+        try:
+            source, site_id, resource, _, segment, offset, length, line = next(journal)
+        except StopIteration as done:
+            covered = done.value
+            break
+        entries[source, site_id, resource] = (segment, offset, length, line)
+    slots = 16
+    while slots < 2 * len(entries):
+        slots *= 2
+    table = bytearray(INDEX_HEADER.size + slots * INDEX_SLOT.size)
+    INDEX_HEADER.pack_into(table, 0, INDEX_MAGIC, slots, covered)
+    for key, (segment, offset, length, line) in entries.items():
+        h = key_hash(*key)
+        slot = h & (slots - 1)
+        while INDEX_SLOT.unpack_from(table, INDEX_HEADER.size + slot * INDEX_SLOT.size)[0]:
+            slot = (slot + 1) & (slots - 1)
+        INDEX_SLOT.pack_into(table, INDEX_HEADER.size + slot * INDEX_SLOT.size, h, segment, offset, length, line)
+    tmp = os.path.join(root, INDEX + '.tmp')
+    with open(tmp, 'wb') as fh:
+        fh.write(table)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, os.path.join(root, INDEX))
+
+
+class PackReader(object):
+    """
+    Random and sequential access to a pack store.
+
+        reader = PackReader('packs')
+        html = reader.get('daahl', '353002210', 'site')
+        for source, site_id, resource, data in reader.iter_pages('megajordan'):
+            ...
+    """
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self._segments = {}
+        self._index = None
+        self._journal = None
+        self._slots = 0
+        covered = 0
+        path = os.path.join(root, INDEX)
+        if os.path.exists(path):
+            with open(path, 'rb') as fh:
+                index = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, slots, covered = INDEX_HEADER.unpack_from(index, 0)
+            if magic == INDEX_MAGIC:
+                self._index, self._slots = index, slots
+            elif magic.startswith(INDEX_MAGIC[:-1]):
+                # An index from before slots pointed at their journal lines: use the journal until it's rebuilt
+                index.close()
+                covered = 0
+            else:
+                raise ValueError('{} is not a pack index'.format(path))
+        if covered:
+            # The part of the journal the index covers never changes, so the keys of index hits are checked in place
+            with open(os.path.join(root, JOURNAL), 'rb') as fh:
+                self._journal = mmap.mmap(fh.fileno(), covered, access=mmap.ACCESS_READ)
+        # Anything written since the index was built
+        self._overlay = {}
+        for source, site_id, resource, _, segment, offset, length in read_journal(root, covered):
+            self._overlay[source, site_id, resource] = (segment, offset, length)
+
+    def locate(self, source, site_id, resource):
+        """
+        (segment, offset, length) of a page, or None
+        """
+        key = (source, str(site_id), resource)
+        if key in self._overlay:
+            return self._overlay[key]
+        if not self._slots:
+            return None
+        h = key_hash(*key)
+        slot = h & (self._slots - 1)
+        while True:
+            found, segment, offset, length, line = INDEX_SLOT.unpack_from(
+                self._index, INDEX_HEADER.size + slot * INDEX_SLOT.size
+            )
+            if found == h and self._journal_key(line) == key:
+                return segment, offset, length
+            if not found:
+                return None
+            slot = (slot + 1) & (self._slots - 1)
+
+    def _journal_key(self, line):
+        """
+        (source, id, resource) of the journal line starting at `line`
+        """
+        end = self._journal.find(b'\n', line)
+        return tuple(self._journal[line:end].decode('UTF-8').split('\t', 3)[:3])
+
+    def get(self, source, site_id, resource, default=None):
+        location = self.locate(source, site_id, resource)
+        if location is None:
+            return default
+        return self.read(*location)
+
+    def __contains__(self, key):
+        return self.locate(*key) is not None
+
+    def read(self, segment, offset, length):
+        data = self._segment(segment)
+        if offset + length > len(data):
+            # The segment has grown since we mapped it
+            self._segments.pop(segment).close()
+            data = self._segment(segment)
+            if offset + length > len(data):
+                raise ValueError('{} is {} bytes, too short for a page at {}+{}: it has been truncated'.format(
+                    SEGMENT.format(segment), len(data), offset, length,
+                ))
+        return zlib.decompress(data[offset:offset + length])
+
+    def _segment(self, segment):
+        """
+        The mapping of a segment, mapped on first use
+        """
+        if segment not in self._segments:
+            with open(os.path.join(self.root, SEGMENT.format(segment)), 'rb') as fh:
+                self._segments[segment] = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._segments[segment]
+
+    def locations(self, source=None):
+        """
+        ((source, id, resource), (segment, offset, length)) for the latest copy of every page, in segment order
+        """
+        latest = {}
+        for entry in read_journal(self.root):
+            if source is None or entry[0] == source:
+                latest[entry[:3]] = entry[4:]
+        return sorted(latest.items(), key=lambda item: item[1])
+
+    def iter_pages(self, source=None):
+        """
+        Yields (source, id, resource, body) for the latest copy of every page, in segment order so the packs are read
+        sequentially.
+        """
+        for key, location in self.locations(source):
+            yield key + (self.read(*location),)
+
+    def close(self):
+        for data in list(self._segments.values()) + [self._index, self._journal]:
+            if data is not None:
+                data.close()
+        self._segments = {}
+        self._index = self._journal = None
+        self._slots = 0
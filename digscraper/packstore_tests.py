@@ -0,0 +1,99 @@
+"""
+Pages written to a pack store should come back byte-for-byte, with or without a rebuilt index.
+"""
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from digscraper import packstore
+from digscraper.packstore import PackReader, PackWriter
+
+
+class PackStoreTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = self.dir.name
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def pages(self, n):
+        return {('daahl', str(i), 'site'): '<html>site {}</html>'.format(i).encode('UTF-8') * 50 for i in range(n)}
+
+    def test_round_trip_through_index(self):
+        pages = self.pages(500)
+        with PackWriter(self.root) as writer:
+            for key, data in pages.items():
+                writer.put(*key, data)
+        reader = PackReader(self.root)
+        for key, data in pages.items():
+            self.assertEqual(reader.get(*key), data)
+        self.assertIsNone(reader.get('daahl', 'missing', 'site'))
+        self.assertEqual({p[:3]: p[3] for p in reader.iter_pages('daahl')}, pages)
+
+    def test_reads_journal_tail_without_close(self):
+        with PackWriter(self.root) as writer:
+            writer.put('daahl', '1', 'site', b'first')
+        writer = PackWriter(self.root)
+        writer.put('megajordan', '102', 'SiteGeneral', b'second')
+        writer.put('daahl', '1', 'site', b'replaced')
+        writer.flush()
+        reader = PackReader(self.root)
+        self.assertEqual(reader.get('megajordan', '102', 'SiteGeneral'), b'second')
+        self.assertEqual(reader.get('daahl', '1', 'site'), b'replaced')
+        self.assertEqual([p[3] for p in reader.iter_pages('daahl')], [b'replaced'])
+        writer.close()
+
+    def test_identical_bodies_stored_once(self):
+        with PackWriter(self.root) as writer:
+            for i in range(100):
+                writer.put('ademnes', str(i), 'site', b'<html>No such site</html>' * 100)
+        size = sum(os.path.getsize(os.path.join(self.root, f)) for f in os.listdir(self.root) if f.endswith('.pack'))
+        self.assertLess(size, 200)
+        self.assertEqual(PackReader(self.root).get('ademnes', '42', 'site'), b'<html>No such site</html>' * 100)
+
+    def test_segments_roll_over(self):
+        pages = {('daahl', str(i), 'site'): os.urandom(1000) for i in range(50)}
+        with PackWriter(self.root, segment_size=10000) as writer:
+            for key, data in pages.items():
+                writer.put(*key, data)
+        self.assertGreater(len([f for f in os.listdir(self.root) if f.endswith('.pack')]), 1)
+        reader = PackReader(self.root)
+        self.assertEqual({p[:3]: p[3] for p in reader.iter_pages()}, pages)
+
+    def test_pages_are_visible_without_flush(self):
+        writer = PackWriter(self.root)
+        writer.put('daahl', '1', 'site', b'first')
+        self.assertEqual(PackReader(self.root).get('daahl', '1', 'site'), b'first')
+        writer.close()
+
+    def test_keys_with_the_same_hash(self):
+        pages = self.pages(20)
+        with mock.patch.object(packstore, 'key_hash', lambda *key: 7):
+            with PackWriter(self.root) as writer:
+                for key, data in pages.items():
+                    writer.put(*key, data)
+            writer = PackWriter(self.root)
+            writer.put('ademnes', '1', 'site', b'unindexed')
+            writer.flush()
+            reader = PackReader(self.root)
+            for key, data in pages.items():
+                self.assertEqual(reader.get(*key), data)
+            self.assertEqual(reader.get('ademnes', '1', 'site'), b'unindexed')
+            self.assertIsNone(reader.get('daahl', '20', 'site'))
+            writer.close()
+
+    def test_truncated_segment(self):
+        pages = self.pages(20)
+        with PackWriter(self.root) as writer:
+            for key, data in pages.items():
+                writer.put(*key, data)
+        with open(os.path.join(self.root, packstore.SEGMENT.format(0)), 'r+b') as fh:
+            fh.truncate(os.path.getsize(fh.name) // 2)
+        reader = PackReader(self.root)
+        self.assertEqual(reader.get('daahl', '0', 'site'), pages['daahl', '0', 'site'])
+        with self.assertRaises(ValueError):
+            reader.get('daahl', '19', 'site')
+        reader.close()
+        reader.close()
@@ -0,0 +1,49 @@
+"""
+Spread a parse over every core: items go to a process pool in chunks, and the results come back in input order.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+def chunked(items, size):
+    """
+    Lists of up to `size` items at a time
+    """
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _apply(function, chunk):
+    return [function(item) for item in chunk]
+
+
+def parallel_map(function, items, workers=None, chunk_size=64):
+    """
+    Yields function(item) for each item, in the same order as `items`, computed by `workers` processes (all the cores
+    by default). With one worker everything runs in this process.
+
+    `function` must be picklable (a module-level function, or a functools.partial of one), and so must its results;
+    return plain rows rather than parse trees. Items are read lazily, and only a couple of chunks per worker are in
+    flight at once, so `items` can be a generator over more data than fits in memory.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for item in items:
+            yield function(item)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunked(items, chunk_size):
+            pending.append(pool.submit(_apply, function, chunk))
+            if len(pending) >= 2 * workers:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
@@ -0,0 +1,19 @@
+"""
+Parallel results should come back complete and in input order, however the chunks are split up.
+"""
+from unittest import TestCase
+
+from digscraper.parallel import chunked, parallel_map
+
+
+class ParallelMapTest(TestCase):
+
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+
+    def test_order_is_kept(self):
+        items = (-i for i in range(1000))
+        self.assertEqual(list(parallel_map(abs, items, workers=3, chunk_size=7)), list(range(1000)))
+
+    def test_single_worker_runs_in_process(self):
+        self.assertEqual(list(parallel_map(lambda x: x * 2, [1, 2, 3], workers=1)), [2, 4, 6])
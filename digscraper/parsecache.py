@@ -0,0 +1,129 @@
+"""
+A persistent cache of parse results, so re-parsing a corpus only does the work for pages that have changed.
+
+Results are keyed by the sha1 of the page's bytes and a parser version. The version is a hash of the source of the
+modules that do the parsing (see source_version), so editing the parser invalidates every cached result without anyone
+having to remember to clear anything.
+"""
+import hashlib
+import os
+import pickle
+from functools import partial
+
+from sqlalchemy import create_engine, text
+
+from digscraper.attempt_log import enable_wal
+from digscraper.parallel import parallel_map
+
+
+def source_version(*paths):
+    """
+    A short hash of the given source files, e.g. `source_version(__file__)`
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as fh:
+            digest.update(fh.read())
+    return digest.hexdigest()[:16]
+
+
+class ParseCache(object):
+    """
+    (page digest, parser version) -> whatever the parser returned for the page, in a SQLite file
+    """
+
+    def __init__(self, path, version):
+        self.version = version
+        self.engine = create_engine('sqlite:///{}'.format(path), connect_args={'timeout': 60})
+        enable_wal(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE IF NOT EXISTS parse_cache ('
+                '  digest CHAR(40) NOT NULL, version VARCHAR(50) NOT NULL, result BLOB NOT NULL,'
+                '  PRIMARY KEY (digest, version))'
+            ))
+
+    def get(self, digest):
+        """
+        The cached result for a page, or None
+        """
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                'SELECT result FROM parse_cache WHERE digest = :digest AND version = :version'
+            ), {'digest': digest, 'version': self.version}).first()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def put_many(self, results):
+        """
+        Cache (digest, result) pairs
+        """
+        rows = [
+            {'digest': digest, 'version': self.version, 'result': pickle.dumps(result, pickle.HIGHEST_PROTOCOL)}
+            for digest, result in results
+        ]
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                'INSERT OR REPLACE INTO parse_cache (digest, version, result) VALUES (:digest, :version, :result)'
+            ), rows)
+
+    def prune(self):
+        """
+        Drop results from every other parser version. Returns how many were dropped.
+        """
+        with self.engine.begin() as conn:
+            return conn.execute(text(
+                'DELETE FROM parse_cache WHERE version != :version'
+            ), {'version': self.version}).rowcount
+
+
+_caches = {}
+
+
+def worker_cache(path, version):
+    """
+    This process's own connection to the cache
+    """
+    key = (os.getpid(), path, version)
+    if key not in _caches:
+        _caches[key] = ParseCache(path, version)
+    return _caches[key]
+
+
+def _cached_call(function, read, path, version, item):
+    data = read(item)
+    digest = hashlib.sha1(data).hexdigest()
+    result = worker_cache(path, version).get(digest)
+    if result is not None:
+        return digest, result, True
+    return digest, function(data), False
+
+
+def cached_map(function, read, items, path, version, workers=None, batch=500, stats=None):
+    """
+    Yields function(read(item)) for each item, in order, like parallel_map. `read` turns an item into the page's
+    bytes, and `function` parses them; both must be picklable.
+
+    Pages whose bytes have already been parsed by this `version` of the parser are answered from the cache at `path`
+    instead, and new results are added to it as they come in. Pass a dict as `stats` to have it filled in with counts
+    of cache hits and misses.
+    """
+    stats = stats if stats is not None else {}
+    stats.update(hits=0, misses=0)
+    cache = ParseCache(path, version)
+    new = []
+    try:
+        for digest, result, hit in parallel_map(partial(_cached_call, function, read, path, version), items, workers):
+            if hit:
+                stats['hits'] += 1
+            else:
+                stats['misses'] += 1
+                new.append((digest, result))
+                if len(new) >= batch:
+                    cache.put_many(new)
+                    new = []
+            yield result
+    finally:
+        # Even if the caller stops early, keep what's been parsed
+        cache.put_many(new)
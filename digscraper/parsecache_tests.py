@@ -0,0 +1,47 @@
+"""
+The parse cache should only call the parser for pages it hasn't seen under the current parser version.
+"""
+import os
+import tempfile
+from unittest import TestCase
+
+from digscraper.parsecache import cached_map
+
+
+class ParseCacheTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'cache.sqlite3')
+        self.calls = []
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def parse(self, data):
+        self.calls.append(data)
+        return {'length': len(data)}
+
+    def run_parse(self, pages, version='v1'):
+        stats = {}
+        results = list(cached_map(self.parse, str.encode, pages, self.path, version, workers=1, stats=stats))
+        return results, stats
+
+    def test_only_changed_pages_are_parsed(self):
+        self.run_parse(['a', 'bb', 'ccc'])
+        self.calls = []
+        results, stats = self.run_parse(['a', 'bbbb', 'ccc'])
+        self.assertEqual(results, [{'length': 1}, {'length': 4}, {'length': 3}])
+        self.assertEqual(self.calls, [b'bbbb'])
+        self.assertEqual(stats, {'hits': 2, 'misses': 1})
+
+    def test_new_parser_version_parses_everything(self):
+        self.run_parse(['a', 'bb'])
+        _, stats = self.run_parse(['a', 'bb'], version='v2')
+        self.assertEqual(stats, {'hits': 0, 'misses': 2})
+
+    def test_stopping_early_keeps_results(self):
+        for _ in cached_map(self.parse, str.encode, ['a', 'bb', 'ccc'], self.path, 'v1', workers=1):
+            break
+        _, stats = self.run_parse(['a'])
+        self.assertEqual(stats, {'hits': 1, 'misses': 0})
@@ -0,0 +1,101 @@
+"""
+Parse pages while the crawl is still running, instead of reading them all back off disk afterwards.
+
+    fetch -> store -> [pages queue] -> parse (process pool) -> [results queue] -> sink
+
+The fetch handlers store each page as usual and then hand its bytes to the pipeline, so a page is only ever read once.
+Both queues are bounded: when parsing falls behind, `submit` blocks, which holds up the fetch handlers, which stops the
+FetchEngine from starting new requests. Parsed sections reach the sink in the order the pages were submitted.
+
+    with Pipeline(parse_page, SectionSink('sections')) as pipeline:
+        fetcher.run(jobs)  # handlers call `await pipeline.submit_async(body)`
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Pipeline(object):
+    """
+    Runs `parse(page bytes)` on `workers` processes and writes each result to `sink.write_sections`.
+
+    `parse` must be picklable. At most `queue_size` pages wait to be parsed, and at most 2 * `workers` are being parsed
+    or waiting for the sink at once.
+    """
+
+    def __init__(self, parse, sink, workers=None, queue_size=1000):
+        self.parse = parse
+        self.sink = sink
+        self.workers = workers or os.cpu_count() or 1
+        self.pages = queue.Queue(queue_size)
+        self.results = queue.Queue()
+        self._in_flight = threading.BoundedSemaphore(2 * self.workers)
+        self.counts = {'submitted': 0, 'parsed': 0, 'failed': 0}
+        self._pool = ProcessPoolExecutor(self.workers)
+        self._dispatcher = threading.Thread(target=self._dispatch, name='pipeline-parse', daemon=True)
+        self._writer = threading.Thread(target=self._write, name='pipeline-sink', daemon=True)
+        self._dispatcher.start()
+        self._writer.start()
+
+    def submit(self, data):
+        """
+        Queue a page's bytes to be parsed, waiting for room if the queue is full
+        """
+        self.counts['submitted'] += 1
+        self.pages.put(data)
+
+    async def submit_async(self, data):
+        """
+        `submit` for FetchEngine handlers: waits for room without blocking the event loop
+        """
+        self.counts['submitted'] += 1
+        try:
+            self.pages.put_nowait(data)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, self.pages.put, data)
+
+    def _dispatch(self):
+        while True:
+            data = self.pages.get()
+            if data is _DONE:
+                self.results.put(_DONE)
+                return
+            self._in_flight.acquire()
+            self.results.put(self._pool.submit(self.parse, data))
+
+    def _write(self):
+        while True:
+            future = self.results.get()
+            if future is _DONE:
+                return
+            try:
+                self.sink.write_sections(future.result())
+                self.counts['parsed'] += 1
+            except Exception:
+                self.counts['failed'] += 1
+                logger.exception('Failed to parse a page')
+            finally:
+                self._in_flight.release()
+
+    def close(self):
+        """
+        Parse and sink everything submitted so far, then shut down
+        """
+        self.pages.put(_DONE)
+        self._dispatcher.join()
+        self._writer.join()
+        self._pool.shutdown()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
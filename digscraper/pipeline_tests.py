@@ -0,0 +1,50 @@
+"""
+Everything submitted to the pipeline should be parsed and reach the sink, in order, even with tiny queues.
+"""
+import asyncio
+from unittest import TestCase
+
+from digscraper.pipeline import Pipeline
+
+
+def parse(data):
+    if data == b'bad':
+        raise ValueError(data)
+    return {'pages': [{'length': len(data)}]}
+
+
+class ListSink(object):
+
+    def __init__(self):
+        self.rows = []
+        self.closed = False
+
+    def write_sections(self, sections):
+        self.rows.extend(sections['pages'])
+
+    def close(self):
+        self.closed = True
+
+
+class PipelineTest(TestCase):
+
+    def test_everything_reaches_the_sink_in_order(self):
+        sink = ListSink()
+        with Pipeline(parse, sink, workers=2, queue_size=2) as pipeline:
+            for n in range(50):
+                pipeline.submit(b'x' * n)
+        self.assertEqual(sink.rows, [{'length': n} for n in range(50)])
+        self.assertEqual(pipeline.counts, {'submitted': 50, 'parsed': 50, 'failed': 0})
+        self.assertTrue(sink.closed)
+
+    def test_async_submit_and_failures(self):
+        sink = ListSink()
+
+        async def fetch(pipeline):
+            for data in [b'a', b'bad', b'ccc'] * 5:
+                await pipeline.submit_async(data)
+
+        with Pipeline(parse, sink, workers=2, queue_size=1) as pipeline:
+            asyncio.run(fetch(pipeline))
+        self.assertEqual(sink.rows, [{'length': 1}, {'length': 3}] * 5)
+        self.assertEqual(pipeline.counts, {'submitted': 15, 'parsed': 10, 'failed': 5})
@@ -0,0 +1,279 @@
+"""
+Opt-in profiling of the parsers: wall and CPU time for each stage of parsing a page, the slowest pages, and sampled
+stacks in the collapsed format flame graph tools read.
+
+The parsers mark their stages with `profiling.stage`, which costs next to nothing unless a Profiler is active:
+
+    with profiling.stage('soup'):
+        self.soup = Soup(html_text, 'lxml')
+
+Stages nest, and are reported by their path ('references/multidict'). Each page is timed as a whole too:
+
+    with Profiler(top=20) as profiler:
+        for result in profiler.map(parse_page, pages, read_page):
+            ...
+    profiler.report()
+
+A StackSampler records what the profiled thread is doing every few milliseconds, with the current stages at the root of
+each stack, for `flamegraph.pl stacks.txt > parse.svg` or https://www.speedscope.app.
+"""
+import collections
+import contextlib
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+
+_active = None
+_NULL = contextlib.nullcontext()
+
+
+class _Stage(object):
+    __slots__ = ('profiler', 'name', 'wall', 'cpu')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._enter(self.name)
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def __exit__(self, *exc_info):
+        self.profiler._exit(time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+
+
+def stage(name):
+    """
+    A context manager that times a stage under the active Profiler, if there is one
+    """
+    if _active is None:
+        return _NULL
+    return _Stage(_active, name)
+
+
+class Profiler(object):
+    """
+    Totals the time spent in each stage, and keeps the `top` slowest pages with their own breakdowns. Times are
+    wall-clock and this thread's CPU seconds; CPU well below wall means waiting, on the disk or the sampler.
+    """
+
+    def __init__(self, top=20):
+        self.top = top
+        self.stages = {}  # path: [calls, wall, cpu], in the order they were first entered
+        self.pages = 0
+        self.page_wall = 0.0
+        self.page_cpu = 0.0
+        self.slowest = []  # a heap of (wall, n, cpu, page, {path: wall})
+        self._stack = []
+        self._page = None
+        self._count = itertools.count()
+        self._started = None
+        self._finished = None
+
+    def __enter__(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError('Another profiler is already active')
+        _active = self
+        self._started = time.perf_counter()
+        self._finished = None
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = None
+        self._finished = time.perf_counter()
+
+    @property
+    def wall(self):
+        """
+        Seconds the profiler has been active
+        """
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.perf_counter()) - self._started
+
+    def current_stages(self):
+        return list(self._stack)
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def _enter(self, name):
+        self._stack.append(name)
+        self.stages.setdefault('/'.join(self._stack), [0, 0.0, 0.0])
+
+    def _exit(self, wall, cpu):
+        path = '/'.join(self._stack)
+        self._stack.pop()
+        totals = self.stages[path]
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += cpu
+        if self._page is not None:
+            self._page[path] = self._page.get(path, 0.0) + wall
+
+    @contextlib.contextmanager
+    def page(self, page):
+        """
+        Time everything inside as the parse of one page
+        """
+        self._page = {}
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            self.pages += 1
+            self.page_wall += wall
+            self.page_cpu += cpu
+            record = (wall, next(self._count), cpu, page, self._page)
+            if len(self.slowest) < self.top:
+                heapq.heappush(self.slowest, record)
+            elif self.top:
+                heapq.heappushpop(self.slowest, record)
+            self._page = None
+
+    def map(self, function, pages, read=None):
+        """
+        Yields `function(read(page))` for each page in turn (or `function(page)` without `read`), timing each as a page
+        """
+        for page in pages:
+            with self.page(page):
+                if read is None:
+                    data = page
+                else:
+                    with self.stage('read'):
+                        data = read(page)
+                result = function(data)
+            yield result
+
+    def slowest_pages(self):
+        """
+        [(wall, cpu, page, {stage path: wall})] for the slowest pages, slowest first
+        """
+        return [(wall, cpu, page, stages) for wall, _, cpu, page, stages in sorted(self.slowest, reverse=True)]
+
+    def report(self, out=sys.stdout):
+        ms = lambda seconds: '{:.3f}'.format(seconds * 1000)
+        total = self.wall or 1.0
+        pages = self.pages or 1
+        print('Profiled {} pages in {:.2f}s ({:.2f}s in pages, {:.2f}s CPU)'.format(
+            self.pages, self.wall, self.page_wall, self.page_cpu), file=out)
+        width = max([len(path) + 2 * path.count('/') for path in self.stages] + [5])
+        print('{:<{}}  {:>9}  {:>9}  {:>9}  {:>12}  {:>6}'.format(
+            'stage', width, 'calls', 'wall s', 'CPU s', 'ms per page', 'share'), file=out)
+        for path, (calls, wall, cpu) in self.stages.items():
+            depth = path.count('/')
+            name = '  ' * depth + path.rsplit('/', 1)[-1]
+            print('{:<{}}  {:>9}  {:>9.3f}  {:>9.3f}  {:>12}  {:>6.1%}'.format(
+                name, width, calls, wall, cpu, ms(wall / pages), wall / total), file=out)
+        slowest = self.slowest_pages()
+        if slowest:
+            print('Slowest pages (ms wall, ms CPU, page, slowest stages):', file=out)
+        for wall, cpu, page, stages in slowest:
+            worst = sorted(stages.items(), key=lambda item: -item[1])[:3]
+            print('  {:>9} {:>9}  {}  {}'.format(ms(wall), ms(cpu), page, ', '.join(
+                '{} {}'.format(path, ms(seconds)) for path, seconds in worst)), file=out)
+
+
+class StackSampler(object):
+    """
+    Samples a thread's Python stack every `interval` seconds from a background thread, counting each distinct stack.
+    With a `profiler`, the stages it's in are the first frames of each stack.
+    """
+
+    def __init__(self, interval=0.005, profiler=None, thread_id=None):
+        self.interval = interval
+        self.profiler = profiler
+        self.thread_id = thread_id
+        self.counts = collections.Counter()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def collapse(self, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        names.reverse()
+        if self.profiler is not None:
+            names = ['[{}]'.format(name) for name in self.profiler.current_stages()] + names
+        return ';'.join(name.replace(';', ':') for name in names)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[self.collapse(frame)] += 1
+
+    def start(self):
+        """
+        Start sampling the calling thread, unless another was given
+        """
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def write(self, path):
+        """
+        Save the stacks in the collapsed format: one "frame;frame;frame count" line per distinct stack
+        """
+        with open(path, 'w', encoding='UTF-8') as fh:
+            for stack, count in self.counts.most_common():
+                fh.write('{} {}\n'.format(stack, count))
+
+
+def add_arguments(parser):
+    """
+    The --profile options, for a parser's command line
+    """
+    parser.add_argument('--profile', action='store_true',
+                        help='Parse one page at a time in this process, and report where the time went')
+    parser.add_argument('--profile-top', type=int, default=20, help='Slowest pages to list in the profile')
+    parser.add_argument('--stacks', help='With --profile, also sample stacks into this file, in the collapsed format')
+    parser.add_argument('--stack-interval', type=float, default=0.005, help='Seconds between stack samples')
+
+
+@contextlib.contextmanager
+def profiled(args, out=sys.stdout):
+    """
+    A Profiler (and StackSampler) set up from the add_arguments options, reported on the way out, or None without
+    --profile
+    """
+    if not args.profile:
+        yield None
+        return
+    with Profiler(args.profile_top) as profiler:
+        sampler = StackSampler(args.stack_interval, profiler) if args.stacks else None
+        if sampler is not None:
+            sampler.start()
+        try:
+            yield profiler
+        finally:
+            if sampler is not None:
+                sampler.stop()
+                sampler.write(args.stacks)
+    profiler.report(out)
+    if sampler is not None:
+        print('Wrote {} samples to {}'.format(sum(sampler.counts.values()), args.stacks), file=out)
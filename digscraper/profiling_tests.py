@@ -0,0 +1,55 @@
+"""
+The profiler should add up stage times by path, keep the slowest pages, and sample stacks under their stages.
+"""
+import io
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from digscraper import profiling
+from digscraper.profiling import Profiler, StackSampler
+
+
+def parse(seconds):
+    with profiling.stage('soup'):
+        time.sleep(seconds)
+    with profiling.stage('references'):
+        with profiling.stage('multidict'):
+            sum(range(1000))
+    return seconds
+
+
+class ProfilerTest(TestCase):
+
+    def test_stages_and_slowest_pages(self):
+        self.assertIs(profiling.stage('soup'), profiling.stage('anything'))  # Nothing to time without a profiler
+        with Profiler(top=2) as profiler:
+            results = list(profiler.map(parse, ['a', 'b', 'c'], {'a': 0.001, 'b': 0.02, 'c': 0.01}.get))
+        self.assertEqual(results, [0.001, 0.02, 0.01])
+        self.assertEqual(list(profiler.stages), ['read', 'soup', 'references', 'references/multidict'])
+        self.assertEqual(profiler.stages['references/multidict'][0], 3)
+        self.assertGreaterEqual(profiler.stages['soup'][1], 0.031)
+        self.assertLess(profiler.stages['soup'][2], 0.02)  # Sleeping isn't CPU time
+        self.assertEqual([page for _, _, page, _ in profiler.slowest_pages()], ['b', 'c'])
+        self.assertGreaterEqual(profiler.slowest_pages()[0][3]['soup'], 0.02)
+        self.assertEqual(profiler.pages, 3)
+
+        out = io.StringIO()
+        profiler.report(out)
+        self.assertIn('\n  multidict ', out.getvalue())
+        self.assertIn('Slowest pages', out.getvalue())
+        self.assertIs(profiling.stage('soup'), profiling.stage('anything'))
+
+    def test_stack_sampler(self):
+        with Profiler() as profiler, StackSampler(0.001, profiler) as sampler:
+            parse(0.05)
+        self.assertTrue(any(
+            stack.startswith('[soup];') and 'parse (profiling_tests.py:' in stack for stack in sampler.counts
+        ))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'stacks.txt')
+            sampler.write(path)
+            with open(path) as fh:
+                lines = fh.read().splitlines()
+        self.assertEqual(sum(int(line.rsplit(' ', 1)[1]) for line in lines), sum(sampler.counts.values()))
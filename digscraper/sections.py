@@ -0,0 +1,220 @@
+"""
+Declarative extraction of the table sections these sites' pages are made of.
+
+A page is described by a list of SectionSpecs: the text of the cell that anchors each section, what kind of table the
+section is, and how far up from the anchor cell the table is. A SectionExtractor compiled from the specs finds every
+anchor in one pass over the page and reads all of the sections together:
+
+    extractor = SectionExtractor([
+        SectionSpec('basic_data', 'DAAHL SITE #:', 'kv'),
+        SectionSpec('references', 'REFERENCE:', 'multi-kv'),
+    ])
+    extractor.extract(parse_html(html))  # {'basic_data': [{...}], 'references': [{...}, ...]}
+
+Table kinds:
+    kv        rows of two cells, "KEY: value"; one dict
+    multi-kv  rows of two cells where a repeated key starts a new record; a list of dicts
+    titled    a header row then data rows; a list of dicts
+    cells     every <td> on the page taken in key, value pairs (no anchor); one dict
+"""
+from collections import namedtuple
+
+import lxml.html
+from lxml import etree
+
+from digscraper import profiling
+
+SectionSpec = namedtuple('SectionSpec', ['name', 'anchor', 'kind', 'climb'])
+SectionSpec.__new__.__defaults__ = (3,)  # anchor <td> -> <tr> -> the table-like container
+
+# Characters str.strip() removes that XPath's normalize-space() doesn't
+UNICODE_SPACES = '\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+
+# One pass over the text nodes: those that could be a whole anchor, in document order
+ANCHOR_TEXT = etree.XPath(
+    "//text()[contains($anchors, concat('|', normalize-space(translate(., $unicode, $ascii)), '|'))]"
+)
+# Slow path: every element whose text contains the value, ancestors first
+CONTAINS = etree.XPath('//*[contains(., $value)]')
+
+
+def parse_html(html_text):
+    """
+    An lxml.html document for the page, or None if it's empty
+    """
+    try:
+        return lxml.html.document_fromstring(html_text.encode('UTF-8'), parser=lxml.html.HTMLParser(encoding='UTF-8'))
+    except etree.ParserError:
+        return None
+
+
+def is_anchor(node, value):
+    return node.text_content().strip() == value
+
+
+def outermost(node, value):
+    """
+    The highest ancestor-or-self of the node whose whole text is still just the value
+    """
+    parent = node.getparent()
+    while parent is not None and is_anchor(parent, value):
+        node, parent = parent, parent.getparent()
+    return node
+
+
+def find_anchor(root, value):
+    """
+    The first element, in document order, whose stripped text is the value
+    """
+    if root is None:
+        return None
+    for node in CONTAINS(root, value=value):
+        if is_anchor(node, value):
+            return node
+
+
+def find_anchors(root, values):
+    """
+    {value: anchor element} for each of the values found on the page, exactly as find_anchor would find them.
+
+    A single XPath pass picks out the text nodes that could be a whole anchor, and each anchor is its owner's outermost
+    ancestor with the same text. That's only the first match if every copy of the value on the page is one of those
+    nodes; values also split over several nodes (e.g. half of it in <b>) are looked up one at a time with find_anchor.
+    """
+    found = {}
+    if root is None:
+        return found
+    wanted = set(values)
+    candidates = ANCHOR_TEXT(
+        root, anchors='|{}|'.format('|'.join(wanted)), unicode=UNICODE_SPACES, ascii=' ' * len(UNICODE_SPACES),
+    )
+    whole = dict.fromkeys(wanted, 0)
+    for text in candidates:
+        value = text.strip()
+        if value not in wanted:
+            continue
+        whole[value] += 1
+        if value in found:
+            continue
+        owner = text.getparent()
+        if text.is_tail or not isinstance(owner.tag, str):
+            owner = owner.getparent()
+        if owner is not None and is_anchor(owner, value):
+            found[value] = outermost(owner, value)
+    page_text = root.text_content()
+    for value in wanted:
+        if page_text.count(value) > whole[value]:
+            node = find_anchor(root, value)
+            if node is not None:
+                found[value] = node
+            else:
+                found.pop(value, None)
+    return found
+
+
+def climb(node, levels):
+    for _ in range(levels):
+        if node is None:
+            break
+        node = node.getparent()
+    return node
+
+
+def string(node):
+    """
+    BeautifulSoup's `.string`: the text of an element with nothing else in it (recursing through lone children), or None
+    """
+    children = list(node)
+    if not children:
+        return node.text
+    if len(children) == 1 and not node.text and not children[0].tail:
+        child = children[0]
+        return child.text if not isinstance(child.tag, str) else string(child)
+    return None
+
+
+def descendants(node, *tags):
+    if node is None:
+        return []
+    return list(node.iterdescendants(*tags))
+
+
+def kv_pairs(node):
+    """
+    (key, value) for each two-cell row, with the colon dropped from the key
+    """
+    for row in descendants(node, 'tr'):
+        cells = descendants(row, 'td')
+        if len(cells) == 2:
+            yield cells[0].text_content().strip().rstrip(':'), cells[1].text_content().strip()
+
+
+def read_kv(node):
+    return [dict(kv_pairs(node))]
+
+
+def read_multi_kv(node):
+    records = []
+    for k, v in kv_pairs(node):
+        if not records or k in records[-1]:
+            records.append({})
+        records[-1][k] = v
+    return records
+
+
+def read_titled(node):
+    rows = []
+    for row in descendants(node, 'tr'):
+        data = [cell.text_content().strip() for cell in descendants(row, 'th', 'td')]
+        if len(data) > 1:
+            rows.append(data)
+    if not rows:
+        return []
+    return [dict(zip(rows[0], data)) for data in rows[1:]]
+
+
+def read_cells(node):
+    data = {}
+    cells = descendants(node, 'td')
+    for key, value in zip(cells[::2], cells[1::2]):
+        key, value = string(key), string(value)
+        if key is not None and value is not None:
+            data[key.strip()] = value.strip()
+    return [data]
+
+
+READERS = {
+    'kv': read_kv,
+    'multi-kv': read_multi_kv,
+    'titled': read_titled,
+    'cells': read_cells,
+}
+
+
+class SectionExtractor(object):
+    """
+    Reads every section in a schema (a list of SectionSpecs) out of a page in one go
+    """
+
+    def __init__(self, specs):
+        self.specs = list(specs)
+        for spec in self.specs:
+            if spec.kind not in READERS:
+                raise ValueError('Unknown section kind {!r} for {}'.format(spec.kind, spec.name))
+        self.anchors = {spec.anchor for spec in self.specs if spec.anchor is not None}
+
+    def extract(self, root):
+        """
+        {section name: list of dicts} for an lxml document (see parse_html). Missing sections come out empty.
+        """
+        with profiling.stage('find_anchors'):
+            anchors = find_anchors(root, self.anchors)
+        sections = {}
+        for spec in self.specs:
+            if spec.anchor is None:
+                node = root
+            else:
+                node = climb(anchors.get(spec.anchor), spec.climb) if spec.anchor in anchors else None
+            with profiling.stage(spec.name):
+                sections[spec.name] = READERS[spec.kind](node)
+        return sections
@@ -0,0 +1,64 @@
+"""
+The single-pass section extractor should find the same tables as looking each anchor up on its own.
+"""
+from unittest import TestCase
+
+from digscraper.sections import SectionExtractor, SectionSpec, find_anchor, find_anchors, parse_html
+
+PAGE = """
+<html><body><div>
+  <table>
+    <tr><td class=fldname> <b>SITE #:</b>&nbsp;</td><td class=data>42 </td></tr>
+    <tr><td class=fldname>NAME:</td><td class=data>Tell <i>X</i></td></tr>
+  </table>
+  <table>
+    <tr><td><b>REF</b>ERENCE:</td><td>one</td></tr>
+    <tr><td>TITLE:</td><td>First</td></tr>
+    <tr><td>REFERENCE:</td><td>two</td></tr>
+  </table>
+  <table>
+    <tr><th>PERIOD</th><th>FEATURE</th></tr>
+    <tr><td>Iron</td><td>Tower</td></tr>
+  </table>
+</div></body></html>
+"""
+
+
+class SectionExtractorTest(TestCase):
+
+    def setUp(self):
+        self.root = parse_html(PAGE)
+
+    def test_anchors_match_one_at_a_time_lookup(self):
+        values = ['SITE #:', 'REFERENCE:', 'PERIOD', 'MISSING:']
+        found = find_anchors(self.root, values)
+        self.assertEqual(sorted(found), ['PERIOD', 'REFERENCE:', 'SITE #:'])
+        for value in values:
+            self.assertIs(found.get(value), find_anchor(self.root, value))
+        # The anchor is the whole cell, not the <b> inside it
+        self.assertEqual(found['SITE #:'].tag, 'td')
+
+    def test_extract(self):
+        extractor = SectionExtractor([
+            SectionSpec('basic', 'SITE #:', 'kv', climb=2),
+            SectionSpec('references', 'REFERENCE:', 'multi-kv', climb=2),
+            SectionSpec('features', 'PERIOD', 'titled', climb=2),
+            SectionSpec('contributor', 'CONTRIBUTOR:', 'kv', climb=2),
+            SectionSpec('tags', 'TAG', 'titled', climb=2),
+        ])
+        self.assertEqual(extractor.extract(self.root), {
+            'basic': [{'SITE #': '42', 'NAME': 'Tell X'}],
+            'references': [{'REFERENCE': 'one', 'TITLE': 'First'}, {'REFERENCE': 'two'}],
+            'features': [{'PERIOD': 'Iron', 'FEATURE': 'Tower'}],
+            'contributor': [{}],
+            'tags': [],
+        })
+
+    def test_cells(self):
+        extractor = SectionExtractor([SectionSpec('cells', None, 'cells')])
+        # Only cells holding nothing but text count, like BeautifulSoup's .string
+        self.assertEqual(extractor.extract(self.root)['cells'], [{'TITLE:': 'First', 'REFERENCE:': 'two', 'Iron': 'Tower'}])
+
+    def test_empty_page(self):
+        extractor = SectionExtractor([SectionSpec('basic', 'SITE #:', 'kv', climb=2)])
+        self.assertEqual(extractor.extract(parse_html('  ')), {'basic': [{}]})
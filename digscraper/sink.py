@@ -0,0 +1,211 @@
+"""
+Stream parsed section rows to Parquet as they're produced, instead of holding the whole corpus in memory.
+
+Each section is a directory of part files, written a row group at a time:
+
+    <root>/basic_data/part-20240501T101500-3f2a9c1e-00000.parquet
+    <root>/basic_data/part-20240501T101500-3f2a9c1e-00001.parquet
+    <root>/references/part-20240501T101500-3f2a9c1e-00000.parquet
+    ...
+
+The part names start with the run that wrote them, so a resumed crawl adds its pages beside the ones parsed by earlier
+runs rather than replacing them. A full re-parse passes `overwrite=True` to start again from nothing.
+
+Rows are dicts, and pages don't all have the same keys. When a row group brings in a key the section hasn't seen before,
+the current part is closed and a new one is started with the wider schema; readers unify the parts' schemas, so rows
+from older parts just have nulls in the new columns. Every column is a string.
+
+Once the sink is closed, `export_csv` and `export_xlsx` turn the Parquet into the old spreadsheet outputs, again one
+batch at a time.
+"""
+import csv
+import os
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+PART = 'part-{}-{:05d}.parquet'
+
+
+def run_id():
+    """
+    A name for this run's parts that sorts after earlier runs' and won't clash with a concurrent one's
+    """
+    return '{}-{}'.format(time.strftime('%Y%m%dT%H%M%S'), uuid.uuid4().hex[:8])
+
+
+def cell(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+class SectionWriter(object):
+    """
+    The Parquet parts of one section
+    """
+
+    def __init__(self, directory, row_group_size, run=None, overwrite=False):
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.run = run or run_id()
+        self.columns = []  # Every key seen so far, in the order they were first seen
+        self.rows = []
+        self.writer = None
+        self.parts = 0
+        os.makedirs(directory, exist_ok=True)
+        if overwrite:
+            for f in os.listdir(directory):
+                if f.endswith('.parquet'):
+                    os.unlink(os.path.join(directory, f))  # From an earlier run
+
+    def write(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        seen = set(self.columns)
+        new = []
+        for row in self.rows:
+            for k in row:
+                if k not in seen:
+                    seen.add(k)
+                    new.append(k)
+        if new or self.writer is None:
+            self.columns.extend(new)
+            self._roll()
+        table = pa.table(
+            {k: pa.array([cell(row.get(k)) for row in self.rows], pa.string()) for k in self.columns},
+            schema=self.writer.schema,
+        )
+        self.writer.write_table(table)
+        self.rows = []
+
+    def _roll(self):
+        """
+        Start a new part with the current columns
+        """
+        if self.writer is not None:
+            self.writer.close()
+        schema = pa.schema([(k, pa.string()) for k in self.columns])
+        self.writer = pq.ParquetWriter(os.path.join(self.directory, PART.format(self.run, self.parts)), schema)
+        self.parts += 1
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class SectionSink(object):
+    """
+    Streams {section: rows} to Parquet under `root`, flushing each section every `row_group_size` rows
+
+        with SectionSink('results/sections', overwrite=True) as sink:
+            for sections in parse_sites():
+                sink.write_sections(sections)
+
+    Sections already under `root` are kept and added to, unless `overwrite` is set, when each section's old parts are
+    deleted as the sink first writes to it.
+    """
+
+    def __init__(self, root, row_group_size=10000, overwrite=False):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.overwrite = overwrite
+        self.run = run_id()
+        self.sections = {}
+
+    def write(self, section, rows):
+        if section not in self.sections:
+            self.sections[section] = SectionWriter(
+                os.path.join(self.root, section), self.row_group_size, self.run, self.overwrite,
+            )
+        self.sections[section].write(rows)
+
+    def write_sections(self, sections):
+        for section, rows in sections.items():
+            self.write(section, rows)
+
+    def close(self):
+        for writer in self.sections.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def section_names(root):
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+
+
+def section_dataset(root, section):
+    """
+    A pyarrow dataset over all of a section's parts, with their schemas unified
+    """
+    directory = os.path.join(root, section)
+    paths = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.parquet'))
+    schema = pa.unify_schemas([pq.read_schema(path) for path in paths]) if paths else pa.schema([])
+    return ds.dataset(paths, schema=schema, format='parquet')
+
+
+def read_section(root, section):
+    """
+    The whole of one section as a pyarrow Table
+    """
+    return section_dataset(root, section).to_table()
+
+
+def section_rows(root, section, first=('site_id',)):
+    """
+    The section's header, then a generator of its rows as lists, a batch at a time. Columns named in `first` lead.
+    """
+    dataset = section_dataset(root, section)
+    names = dataset.schema.names
+    header = [k for k in first if k in names] + [k for k in names if k not in first]
+
+    def rows():
+        for batch in dataset.to_batches(columns=header):
+            columns = [column.to_pylist() for column in batch.columns]
+            for row in zip(*columns):
+                yield list(row)
+
+    return header, rows()
+
+
+def export_csv(root, directory, sections=None):
+    """
+    One <section>.csv per section (all of them, or the ones named)
+    """
+    os.makedirs(directory, exist_ok=True)
+    for section in sections or section_names(root):
+        header, rows = section_rows(root, section)
+        with open(os.path.join(directory, '{}.csv'.format(section)), 'w', encoding='UTF-8', newline='') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def export_xlsx(root, path, sections=None):
+    """
+    One workbook with a sheet per section (all of them, or the ones named, in that order), written in openpyxl's
+    streaming mode
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for section in sections or section_names(root):
+        sheet = workbook.create_sheet(section)
+        header, rows = section_rows(root, section)
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
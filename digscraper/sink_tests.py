@@ -0,0 +1,53 @@
+"""
+Rows streamed through the sink should come back out complete, whatever order their keys turned up in.
+"""
+import csv
+import os
+import tempfile
+from unittest import TestCase
+
+from digscraper.sink import SectionSink, export_csv, read_section
+
+
+class SectionSinkTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.dir.name, 'sections')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_new_keys_start_a_new_part(self):
+        with SectionSink(self.root, row_group_size=2) as sink:
+            sink.write('basic', [{'site_id': '1', 'NAME': 'a'}, {'site_id': '2', 'NAME': 'b'}])
+            sink.write('basic', [{'site_id': '3', 'SIZE': 18}])
+            sink.write('basic', [{'site_id': '4', 'NAME': 'd'}])
+            sink.write('tags', [])
+        parts = sorted(os.listdir(os.path.join(self.root, 'basic')))
+        self.assertEqual([part[-13:] for part in parts], ['00000.parquet', '00001.parquet'])
+        self.assertEqual(read_section(self.root, 'basic').to_pylist(), [
+            {'site_id': '1', 'NAME': 'a', 'SIZE': None},
+            {'site_id': '2', 'NAME': 'b', 'SIZE': None},
+            {'site_id': '3', 'NAME': None, 'SIZE': '18'},
+            {'site_id': '4', 'NAME': 'd', 'SIZE': None},
+        ])
+
+    def test_runs_add_to_earlier_ones(self):
+        with SectionSink(self.root) as sink:
+            sink.write('basic', [{'site_id': '1'}])
+        with SectionSink(self.root) as sink:
+            sink.write('basic', [{'site_id': '2', 'NAME': 'b'}])
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'basic'))), 2)
+        self.assertEqual(sorted(row['site_id'] for row in read_section(self.root, 'basic').to_pylist()), ['1', '2'])
+
+        with SectionSink(self.root, overwrite=True) as sink:
+            sink.write('basic', [{'site_id': '3'}])
+        self.assertEqual(read_section(self.root, 'basic').to_pylist(), [{'site_id': '3'}])
+
+    def test_export_csv(self):
+        with SectionSink(self.root) as sink:
+            sink.write('basic', [{'NAME': 'a', 'site_id': '1'}, {'site_id': '2', 'SIZE': '5'}])
+        export_csv(self.root, self.dir.name)
+        with open(os.path.join(self.dir.name, 'basic.csv'), encoding='UTF-8') as fh:
+            self.assertEqual(list(csv.reader(fh)), [['site_id', 'NAME', 'SIZE'], ['1', 'a', ''], ['2', '', '5']])
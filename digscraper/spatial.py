@@ -0,0 +1,210 @@
+"""
+Find the same physical site in different sources (DAAHL, MEGA Jordan, ADEMNES, ...) by distance, without comparing every
+site with every other one.
+
+Sites are bucketed into a grid of roughly `cell_metres` square cells. A radius query only looks at the sites in the
+cells the circle can reach, and `pairs_within` does that for a whole batch of query points at once, so matching two
+sources costs about the number of nearby pairs rather than the product of their sizes.
+
+    daahl = GridIndex.from_sites(daahl_coordinates, daahl_ids)
+    daahl.radius(35.93, 31.95, 500)  # [(id, metres), ...], nearest first
+    daahl.nearest(35.93, 31.95, k=5)
+    match_sources({'daahl': (ids, lons, lats), 'mega': (ids, lons, lats)}, metres=250)
+
+Points are (longitude, latitude) in degrees. Cells don't wrap round the antimeridian, which is a long way from the Levant.
+"""
+import math
+
+import numpy as np
+
+from digscraper.geometry import EARTH_RADIUS
+
+METRES_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """
+    Great-circle distance in metres between points in degrees; any of the arguments can be arrays
+    """
+    lon1, lat1, lon2, lat2 = (np.radians(a) for a in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _cell_keys(ix, iy):
+    return ix.astype(np.int64) * 2 ** 32 + iy.astype(np.int64)
+
+
+def _cell_xy(keys):
+    """
+    The (ix, iy) that _cell_keys made the keys from
+    """
+    iy = (keys + 2 ** 31) % 2 ** 32 - 2 ** 31
+    return (keys - iy) // 2 ** 32, iy
+
+
+class GridIndex(object):
+    """
+    Sites bucketed by grid cell: the site indices sorted by cell, and where each occupied cell's run of them starts
+    """
+
+    def __init__(self, lons, lats, ids=None, cell_metres=1000):
+        # Every point needs coordinates; see _located
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.ids = np.asarray(ids) if ids is not None else np.arange(len(self.lons))
+        self.cell_lat = cell_metres / METRES_PER_DEGREE
+        # A degree of longitude is shortest at the highest latitude; size the cells so they're at least cell_metres wide
+        # there, and so wider everywhere else
+        top = float(np.abs(self.lats).max()) if len(self.lats) else 0.0
+        self.cell_lon = self.cell_lat / max(math.cos(math.radians(top)), 0.01)
+        keys = self._keys(self.lons, self.lats)
+        self.order = np.argsort(keys, kind='stable')
+        self.cells, self.starts, self.sizes = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.cell_x, self.cell_y = _cell_xy(self.cells)
+
+    @classmethod
+    def from_sites(cls, sites, ids, cell_metres=1000):
+        """
+        An index of each site's centroid, from geometry.SiteCoordinates; sites without coordinates are left out
+        """
+        centroids = sites.centroids()
+        found = np.isfinite(centroids[:, 0])
+        return cls(centroids[found, 0], centroids[found, 1], np.asarray(ids)[found], cell_metres)
+
+    def __len__(self):
+        return len(self.lons)
+
+    def _cell(self, lons, lats):
+        return np.floor(lons / self.cell_lon).astype(np.int64), np.floor(lats / self.cell_lat).astype(np.int64)
+
+    def _keys(self, lons, lats):
+        return _cell_keys(*self._cell(lons, lats))
+
+    def pairs_within(self, lons, lats, metres):
+        """
+        Every (query index, site index, distance) with the site within `metres` of the query point, as three arrays
+        ordered by query and then distance. Site indices are positions in this index; look them up in `ids`.
+        """
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        empty = np.empty(0, dtype=np.int64)
+        if not (np.isfinite(lons).all() and np.isfinite(lats).all()):
+            raise ValueError('Query points need coordinates')
+        if not len(self) or not len(lons):
+            return empty, empty, np.empty(0)
+        # How many cells out the circle can reach, at the query point furthest from the equator
+        reach_lat = metres / METRES_PER_DEGREE
+        top = min(float(np.abs(lats).max()) + reach_lat, 89.9)
+        reach_lon = reach_lat / math.cos(math.radians(top))
+        cells_lat = int(math.ceil(reach_lat / self.cell_lat))
+        cells_lon = int(math.ceil(reach_lon / self.cell_lon))
+
+        queries = []
+        candidates = []
+        for hit, cells in self._reachable(lons, lats, cells_lon, cells_lat):
+            if not len(hit):
+                continue
+            sizes = self.sizes[cells]
+            # Every site in each hit cell: the cell's start, plus 0, 1, ... up to its size
+            within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            queries.append(np.repeat(hit, sizes))
+            candidates.append(self.order[np.repeat(self.starts[cells], sizes) + within])
+        if not queries:
+            return empty, empty, np.empty(0)
+        queries = np.concatenate(queries)
+        candidates = np.concatenate(candidates)
+        distances = haversine(lons[queries], lats[queries], self.lons[candidates], self.lats[candidates])
+        close = distances <= metres
+        queries, candidates, distances = queries[close], candidates[close], distances[close]
+        order = np.lexsort((distances, queries))
+        return queries[order], candidates[order], distances[order]
+
+    def _reachable(self, lons, lats, cells_lon, cells_lat):
+        """
+        Yields (query indices, occupied cell positions) for the occupied cells within `cells_lon` and `cells_lat` cells
+        of each query point's cell
+        """
+        ix, iy = self._cell(lons, lats)
+        if (2 * cells_lon + 1) * (2 * cells_lat + 1) <= len(self.cells):
+            # Look up every cell in the window around the queries
+            for dx in range(-cells_lon, cells_lon + 1):
+                for dy in range(-cells_lat, cells_lat + 1):
+                    keys = _cell_keys(ix + dx, iy + dy)
+                    at = np.minimum(np.searchsorted(self.cells, keys), len(self.cells) - 1)
+                    hit = np.flatnonzero(self.cells[at] == keys)
+                    yield hit, at[hit]
+        elif len(lons) < len(self.cells):
+            # The window holds more cells than are occupied: check the occupied ones around each query instead
+            for q in range(len(lons)):
+                cells = np.flatnonzero(
+                    (np.abs(self.cell_x - ix[q]) <= cells_lon) & (np.abs(self.cell_y - iy[q]) <= cells_lat)
+                )
+                yield np.full(len(cells), q), cells
+        else:
+            for c in range(len(self.cells)):
+                hit = np.flatnonzero(
+                    (np.abs(ix - self.cell_x[c]) <= cells_lon) & (np.abs(iy - self.cell_y[c]) <= cells_lat)
+                )
+                yield hit, np.full(len(hit), c)
+
+    def radius(self, lon, lat, metres):
+        """
+        [(id, metres), ...] of the sites within `metres` of the point, nearest first
+        """
+        _, found, distances = self.pairs_within(lon, lat, metres)
+        return list(zip(self.ids[found].tolist(), distances.tolist()))
+
+    def nearest(self, lon, lat, k=1):
+        """
+        [(id, metres), ...] of the `k` sites nearest the point, nearest first
+        """
+        k = min(k, len(self))
+        if not k:
+            return []
+        # Beyond the far corner of the sites' bounding box a circle takes in about all of them
+        corner_lons = [self.lons.min(), self.lons.min(), self.lons.max(), self.lons.max()]
+        corner_lats = [self.lats.min(), self.lats.max(), self.lats.min(), self.lats.max()]
+        far = float(haversine(lon, lat, np.array(corner_lons), np.array(corner_lats)).max())
+        metres = self.cell_lat * METRES_PER_DEGREE
+        while metres < far:
+            found = self.radius(lon, lat, metres)
+            # A radius query is exact, so once it holds k sites they're the k nearest
+            if len(found) >= k:
+                return found[:k]
+            metres *= 2
+        # Measure the distance to every site instead
+        distances = haversine(lon, lat, self.lons, self.lats)
+        nearest = np.argsort(distances, kind='stable')[:k]
+        return list(zip(self.ids[nearest].tolist(), distances[nearest].tolist()))
+
+
+def match_sources(sources, metres, cell_metres=None):
+    """
+    Every pair of sites from two different sources within `metres` of each other, as dicts of source_a, id_a,
+    source_b, id_b and metres, nearest first within each site of source_a.
+
+    `sources` maps a source name to (ids, longitudes, latitudes). Each pair of sources is matched once, in the order
+    they're given.
+    """
+    names = list(sources)
+    indexes = {name: GridIndex(*_located(*sources[name]), cell_metres=cell_metres or metres) for name in names[1:]}
+    matches = []
+    for i, a in enumerate(names):
+        lons_a, lats_a, ids_a = _located(*sources[a])
+        for b in names[i + 1:]:
+            index = indexes[b]
+            queries, found, distances = index.pairs_within(lons_a, lats_a, metres)
+            for q, f, d in zip(ids_a[queries].tolist(), index.ids[found].tolist(), distances.tolist()):
+                matches.append({'source_a': a, 'id_a': q, 'source_b': b, 'id_b': f, 'metres': d})
+    return matches
+
+
+def _located(ids, lons, lats):
+    """
+    (lons, lats, ids) of just the sites that have coordinates
+    """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    found = np.isfinite(lons) & np.isfinite(lats)
+    return lons[found], lats[found], np.asarray(ids)[found]
@@ -0,0 +1,70 @@
+"""
+The grid index should find exactly what comparing every pair of sites finds.
+"""
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from digscraper import geometry, spatial
+
+
+class SpatialTest(TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # A couple of thousand sites over Jordan
+        self.lons = 35 + rng.rand(2000) * 2
+        self.lats = 29.5 + rng.rand(2000) * 3
+        self.index = spatial.GridIndex(self.lons, self.lats, ids=np.arange(2000) + 100, cell_metres=2000)
+
+    def brute_force(self, lon, lat, metres):
+        distances = spatial.haversine(lon, lat, self.lons, self.lats)
+        found = np.flatnonzero(distances <= metres)
+        return sorted(zip((found + 100).tolist(), distances[found].tolist()), key=lambda pair: pair[1])
+
+    def test_haversine(self):
+        # A degree of latitude
+        self.assertAlmostEqual(spatial.haversine(35, 31, 35, 32), 111195, delta=1)
+
+    def test_radius(self):
+        for lon, lat in [(36, 31), (35.0, 29.5), (36.7, 32.2)]:
+            for metres in (500, 5000, 20000):
+                found = self.index.radius(lon, lat, metres)
+                self.assertEqual([i for i, _ in found], [i for i, _ in self.brute_force(lon, lat, metres)])
+
+    def test_nearest(self):
+        found = self.index.nearest(36, 31, k=7)
+        self.assertEqual(found, self.brute_force(36, 31, 1e7)[:7])
+
+    def test_far_from_the_sites(self):
+        started = time.perf_counter()
+        for lon, lat in [(40, 31), (0, 0), (-120, -60)]:
+            self.assertEqual(self.index.nearest(lon, lat, k=3), self.brute_force(lon, lat, 1e8)[:3])
+            self.assertEqual(self.index.radius(lon, lat, 600000), self.brute_force(lon, lat, 600000))
+        # Few occupied cells to check, however many the circles reach
+        self.assertLess(time.perf_counter() - started, 5)
+        queries, found, _ = self.index.pairs_within(self.lons[:200], self.lats[:200], 400000)
+        self.assertEqual(len(found), sum(len(self.brute_force(lon, lat, 400000))
+                                         for lon, lat in zip(self.lons[:200], self.lats[:200])))
+
+    def test_pairs_within_matches_each_query(self):
+        queries, found, distances = self.index.pairs_within(self.lons[:50], self.lats[:50], 3000)
+        for q in range(50):
+            expected = [i for i, _ in self.brute_force(self.lons[q], self.lats[q], 3000)]
+            self.assertEqual((self.index.ids[found[queries == q]]).tolist(), expected)
+
+    def test_match_sources(self):
+        daahl = geometry.parse_kml(['35.0,31.0', '', '36.0,32.0'])
+        index = spatial.GridIndex.from_sites(daahl, ['d1', 'd2', 'd3'])
+        self.assertEqual(index.ids.tolist(), ['d1', 'd3'])
+        sources = {
+            'daahl': (index.ids, index.lons, index.lats),
+            'mega': (['m1', 'm2'], [35.001, 35.5], [31.0, float('nan')]),
+            'ademnes': (['a1'], [36.0], [32.0005]),
+        }
+        matches = spatial.match_sources(sources, metres=200)
+        self.assertEqual(
+            [(m['source_a'], m['id_a'], m['source_b'], m['id_b']) for m in matches],
+            [('daahl', 'd1', 'mega', 'm1'), ('daahl', 'd3', 'ademnes', 'a1')],
+        )
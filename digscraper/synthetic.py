@@ -0,0 +1,152 @@
+"""
+Made-up pages with the same structure as the real ones, in any size, for benchmarking the parsers without a scrape.
+
+    daahl_page(353102710, names=5, references=40)
+    mega_general_page(2431, fields=30, points=12)
+    daahl_kml(47000)
+    ademnes_page(12)
+
+Every generator takes an `rng` (a random.Random), so the same seed always gives the same pages.
+"""
+import random
+
+WORDS = [
+    'Khirbat', 'Horbat', 'Tall', 'Wadi', 'Ain', 'Umm', 'Jubeil', 'Naqqar', 'Adullam', 'Minya', 'Hisban', 'Isal',
+    'Survey', 'Iron', 'Age', 'Roman', 'Byzantine', 'tower', 'cistern', 'wall', 'sherds', 'terrace', 'ruins', 'field',
+]
+PERIODS = ['Chalcolithic', 'Early Bronze', 'Iron Age II', 'Hellenistic', 'Roman', 'Byzantine', 'Umayyad', 'Ottoman']
+FEATURES = ['Tower', 'Cistern', 'Wall', 'Settlement', 'Cairn', 'Sherd scatter', 'Terrace', 'Tomb']
+
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def kv_table(pairs):
+    """
+    The DAAHL "KEY:  value" table
+    """
+    rows = ''.join(
+        '<tr class=row1><td class=fldname style="width: 140px">{}</td><td class=data>{} </td></tr>\n'.format(k, v)
+        for k, v in pairs
+    )
+    return '<table class=record>\n{}</table>\n'.format(rows)
+
+
+def titled_table(title, header, rows):
+    """
+    The DAAHL table with a title row, a header row, and then data rows
+    """
+    cells = lambda tag, row: ''.join('<{0}>{1}</{0}>'.format(tag, c) for c in row)
+    return '<div class=section><table>\n<tr><td colspan={}><b>{}</b></td></tr>\n<tr>{}</tr>\n{}</table></div>\n'.format(
+        len(header), title, cells('th', header), ''.join('<tr>{}</tr>\n'.format(cells('td', row)) for row in rows),
+    )
+
+
+def daahl_page(site_id, names=3, components=4, references=3, contributor=True, notes_words=60, filler=200, rng=None):
+    """
+    A DAAHL SitesBrowseView page with the given number of alternate names, site components and references, and
+    `filler` words of page furniture around the data
+    """
+    rng = rng or random.Random(site_id)
+    parts = [
+        '<html><head><title>DAAHL Site Record</title></head><body>\n',
+        '<div id=menu><p>{}</p></div>\n'.format(words(rng, filler // 2)),
+        '<div id=main><div><div>\n',
+        kv_table([
+            ('DAAHL SITE #:', site_id),
+            ('SIZE:', rng.randint(1, 5000)),
+            ('ELEVATION:', rng.randint(-400, 1700)),
+            ('SITE NAME:', 'NN - {} &amp; Site&nbsp;{}'.format(words(rng, 2), site_id)),
+            ('LATITUDE:', '{:.5f}'.format(rng.uniform(29.5, 33.5))),
+            ('LONGITUDE:', '{:.5f}'.format(rng.uniform(34.9, 39.3))),
+            ('NOTES:', '{} <i>{}</i>'.format(words(rng, notes_words), words(rng, 3))),
+        ]),
+        titled_table('Alternate Names', ['MNEMONIC', 'NAME'], [
+            (rng.choice('ABCDE'), words(rng, 2)) for _ in range(names)
+        ]),
+        kv_table([('OVERALL CONDITION:', 'No Information'), ('DATE VISITED:', '1993-09-18')]),
+        titled_table('Site Components', ['PERIOD', 'FEATURE TYPE', 'SIZE (ha)', 'DESCRIPTION'], [
+            (rng.choice(PERIODS), rng.choice(FEATURES), rng.randint(0, 20), words(rng, 8)) for _ in range(components)
+        ]),
+    ]
+    if contributor:
+        parts.append(kv_table([
+            ('CONTRIBUTOR:', 'Dr. {}'.format(words(rng, 1))), ('INSTITUTION:', words(rng, 3)), ('E-MAIL:', ''),
+        ]))
+    parts.append(kv_table([
+        pair for i in range(references)
+        for pair in [('REFERENCE:', '{} {}'.format(words(rng, 2), 1950 + i)), ('TITLE:', words(rng, 6)),
+                     ('SERIAL NAME:', words(rng, 3))]
+    ]))
+    parts.append('</div></div></div>\n<div id=footer><p>{}</p></div></body></html>\n'.format(words(rng, filler // 2)))
+    return ''.join(parts)
+
+
+def mega_general_page(mega_number, fields=30, points=6, rng=None):
+    """
+    A MEGA Jordan SiteGeneral page: one single-row table of label and value cells, `fields` pairs of them, with a
+    coordinate string of `points` points
+    """
+    rng = rng or random.Random(mega_number)
+    lon, lat = rng.uniform(35, 39), rng.uniform(29.5, 33)
+    coordinates = ', '.join(
+        '{:.6f} {:.6f}'.format(lon + rng.uniform(-0.01, 0.01), lat + rng.uniform(-0.01, 0.01)) for _ in range(points)
+    )
+    pairs = [
+        ('MEGA Number', mega_number),
+        ('Site Name', words(rng, 2)),
+        ('Coordinates (UTM)', coordinates),
+        ('Periods', ', '.join(rng.sample(PERIODS, 3))),
+    ]
+    pairs.extend(('Field {}'.format(i), '<span>{}</span>'.format(words(rng, 4))) for i in range(fields - len(pairs)))
+    cells = ''.join('<td class=label>{}</td><td class=value>{}</td>'.format(k, v) for k, v in pairs)
+    return '<html><body><div id=content><table><tr>{}</tr></table></div></body></html>\n'.format(cells)
+
+
+def mega_report_page(gid, resource, rng=None):
+    """
+    Any of the MEGA Jordan report pages for a gid: SiteGeneral, or a plain table of records for the others
+    """
+    rng = rng or random.Random('{}-{}'.format(gid, resource))
+    if resource == 'SiteGeneral':
+        return mega_general_page(gid, rng=rng)
+    rows = ''.join(
+        '<tr><td>{}</td><td>{}</td><td>{}</td></tr>'.format(i, words(rng, 3), words(rng, 12))
+        for i in range(rng.randint(0, 8))
+    )
+    return '<html><body><h1>{}</h1><table>{}</table></body></html>\n'.format(resource, rows)
+
+
+def ademnes_page(site_id, rng=None):
+    """
+    An ADEMNES db/site.php page: a title, a table of labelled fields and some bibliography
+    """
+    rng = rng or random.Random(site_id)
+    fields = [
+        ('Site No.', site_id), ('Name', words(rng, 2)), ('Region', words(rng, 1)),
+        ('Longitude', '{:.5f}'.format(rng.uniform(34.9, 39.3))), ('Latitude', '{:.5f}'.format(rng.uniform(29.5, 33.5))),
+        ('Periods', ', '.join(rng.sample(PERIODS, 2))), ('Description', words(rng, 40)),
+    ]
+    rows = ''.join('<tr><th>{}</th><td>{}</td></tr>'.format(k, v) for k, v in fields)
+    books = ''.join('<li>{} ({})</li>'.format(words(rng, 6), 1950 + i) for i in range(rng.randint(0, 6)))
+    return '<html><body><h1>Site {}</h1><table>{}</table><ul>{}</ul></body></html>\n'.format(site_id, rows, books)
+
+
+def daahl_kml(sites, rng=None, site_url='http://daahl.ucsd.edu/DAAHL/SitesBrowseView.php?SiteNo={}'):
+    """
+    A DAAHL site list KML document with a Placemark for each of `sites` sites
+    """
+    rng = rng or random.Random(0)
+    placemarks = []
+    for i in range(sites):
+        placemarks.append(
+            '<Placemark><name>{}</name><description><![CDATA[<a href="{}">Site record</a>]]></description>'
+            '<Point><coordinates>{:.5f},{:.5f},0</coordinates></Point></Placemark>\n'.format(
+                words(rng, 2), site_url.format(300000000 + i), rng.uniform(34.9, 39.3), rng.uniform(29.5, 33.5),
+            )
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+        '{}</Document></kml>\n'.format(''.join(placemarks))
+    )
@@ -0,0 +1,311 @@
+"""
+A durable work queue with leases, kept in a SQL database so any number of worker processes can drain it and a restart
+picks up exactly where the last run stopped.
+
+A task is `ready` until a worker leases it. The lease hides it from other workers for `visibility` seconds; the worker
+then either acks it (`done`) or fails it, which puts it back to `ready` after a backoff. A task whose lease runs out
+without an ack (the worker died) becomes leasable again. After `max_attempts` tries a task is parked as `dead` for a
+human to look at.
+
+The same queue runs on SQLite, for one machine, or on the Postgres service from docker-compose.yml, where workers on
+several nodes claim batches with FOR UPDATE SKIP LOCKED and heartbeat their leases while they work.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sqlalchemy import Column, Float, Index, Integer, String, UniqueConstraint, create_engine, inspect, text
+from sqlalchemy.orm import declarative_base
+
+from digscraper.attempt_log import enable_wal
+
+logger = logging.getLogger(__name__)
+
+# Where distributed crawls keep their shared queues: docker-compose.yml points this at its Postgres service, and without
+# it the queue is a SQLite file in the current directory, for crawling from one machine
+DATABASE_URL = os.environ.get('DIGSCRAPER_DATABASE_URL') or 'sqlite:///queue.sqlite3'
+
+Base = declarative_base()
+
+Task = namedtuple('Task', ['id', 'payload', 'attempts'])
+
+READY, LEASED, DONE, DEAD = 'ready', 'leased', 'done', 'dead'
+
+
+class QueuedTask(Base):
+    __tablename__ = 'tasks'
+    id = Column(Integer, primary_key=True)
+    queue = Column(String(50), nullable=False)
+    payload = Column(String(250), nullable=False)
+    state = Column(String(10), nullable=False, default=READY)
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(Float, nullable=False, default=0)  # Unix time; for leased tasks, when the lease runs out
+    leased_by = Column(String(100))
+    last_error = Column(String(250))
+    result = Column(String(250))  # What the worker that finished the task reported
+    updated_at = Column(Float)
+
+    __table_args__ = (
+        UniqueConstraint('queue', 'payload'),
+        Index('ix_tasks_queue_state_available', 'queue', 'state', 'available_at'),
+    )
+
+
+def worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+    """
+    One named queue in a database, e.g. `WorkQueue('sqlite:///results/queue.sqlite3', 'megajordan')`
+    """
+
+    def __init__(self, url, name, visibility=10 * 60, max_attempts=5, backoff=30, max_backoff=60 * 60):
+        self.engine = url if not isinstance(url, str) else create_engine(url, connect_args=self._connect_args(url))
+        if self.engine.dialect.name == 'sqlite':
+            enable_wal(self.engine)
+        Base.metadata.create_all(self.engine)
+        if 'result' not in {c['name'] for c in inspect(self.engine).get_columns('tasks')}:
+            # Queues created before tasks had a result column
+            with self.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE tasks ADD COLUMN result VARCHAR(250)"))
+        self.name = name
+        self.visibility = visibility
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.worker = worker_name()
+
+    @staticmethod
+    def _connect_args(url):
+        # Several processes share one SQLite file; wait for the write lock instead of failing straight away
+        return {'timeout': 60} if url.startswith('sqlite') else {}
+
+    def put_many(self, payloads):
+        """
+        Add tasks. Payloads already in the queue, in any state, are ignored. Returns how many were new.
+        """
+        now = time.time()
+        rows = [{'queue': self.name, 'payload': p, 'now': now} for p in payloads]
+        if not rows:
+            return 0
+        with self.engine.begin() as conn:
+            result = conn.execute(text(
+                "INSERT INTO tasks (queue, payload, state, attempts, available_at, updated_at) "
+                "VALUES (:queue, :payload, 'ready', 0, 0, :now) ON CONFLICT DO NOTHING"
+            ), rows)
+            return result.rowcount
+
+    def put(self, payload):
+        return self.put_many([payload])
+
+    def lease(self, n=100):
+        """
+        Lease up to `n` tasks that are ready, or whose previous lease ran out. Returns a list of Tasks.
+        """
+        now = time.time()
+        params = {'queue': self.name, 'now': now, 'max_attempts': self.max_attempts}
+        with self.engine.begin() as conn:
+            # Abandoned leases that have used up their attempts go to the dead letters instead of round again
+            conn.execute(text(
+                "UPDATE tasks SET state = 'dead', last_error = 'lease expired', updated_at = :now "
+                "WHERE queue = :queue AND state = 'leased' AND available_at <= :now AND attempts >= :max_attempts"
+            ), params)
+            rows = conn.execute(text(
+                "UPDATE tasks SET state = 'leased', attempts = attempts + 1, leased_by = :worker, "
+                "  available_at = :now + :visibility, updated_at = :now "
+                "WHERE id IN ("
+                "  SELECT id FROM tasks WHERE queue = :queue AND state IN ('ready', 'leased') AND available_at <= :now "
+                "  ORDER BY available_at, id LIMIT :n {}"
+                ") RETURNING id, payload, attempts".format(self._skip_locked())
+            ), dict(params, worker=self.worker, visibility=self.visibility, n=n))
+            return [Task(*row) for row in rows]
+
+    def _skip_locked(self):
+        # SQLite serializes writers, so the single UPDATE is already atomic; other databases need row locks
+        return '' if self.engine.dialect.name == 'sqlite' else 'FOR UPDATE SKIP LOCKED'
+
+    def ack(self, task, result=None):
+        """
+        Mark a leased task as done, recording the worker's result
+        """
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE tasks SET state = 'done', leased_by = NULL, result = :result, updated_at = :now WHERE id = :id"
+            ), {'id': task.id, 'now': time.time(), 'result': result})
+
+    def fail(self, task, error):
+        """
+        Give a leased task back. It is retried after an exponential backoff, or dead-lettered once it is out of attempts.
+        """
+        now = time.time()
+        dead = task.attempts >= self.max_attempts
+        delay = min(self.backoff * 2 ** (task.attempts - 1), self.max_backoff)
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE tasks SET state = :state, available_at = :available_at, leased_by = NULL, "
+                "  last_error = :error, updated_at = :now WHERE id = :id"
+            ), {
+                'id': task.id, 'now': now, 'error': str(error)[:250],
+                'state': DEAD if dead else READY, 'available_at': now + delay,
+            })
+
+    def extend(self, tasks, visibility=None):
+        """
+        Push back the lease expiry of tasks this worker is still busy with
+        """
+        if not tasks:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE tasks SET available_at = :until WHERE id = :id AND state = 'leased' AND leased_by = :worker"
+            ), [
+                {'id': t.id, 'until': time.time() + (visibility or self.visibility), 'worker': self.worker}
+                for t in tasks
+            ])
+
+    def retry_dead(self):
+        """
+        Give every dead task a fresh set of attempts
+        """
+        with self.engine.begin() as conn:
+            return conn.execute(text(
+                "UPDATE tasks SET state = 'ready', attempts = 0, available_at = 0, updated_at = :now "
+                "WHERE queue = :queue AND state = 'dead'"
+            ), {'queue': self.name, 'now': time.time()}).rowcount
+
+    def stats(self):
+        """
+        {state: count} for this queue
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT state, COUNT(*) FROM tasks WHERE queue = :queue GROUP BY state"
+            ), {'queue': self.name})
+            return dict(rows.fetchall())
+
+    def pending(self):
+        """
+        How many tasks are still ready, waiting out a backoff, or leased to some worker
+        """
+        stats = self.stats()
+        return stats.get(READY, 0) + stats.get(LEASED, 0)
+
+    def drain(self, batch=100):
+        """
+        Yields leased Tasks, a batch at a time, until there is nothing left that this worker can lease right now
+        """
+        while True:
+            tasks = self.lease(batch)
+            if not tasks:
+                return
+            for task in tasks:
+                yield task
+
+
+class Heartbeat(object):
+    """
+    Background thread that keeps extending the leases of the tasks a worker is busy with, so a slow download isn't
+    handed to another worker. If the worker dies the heartbeats stop, the leases run out, and the tasks are reassigned.
+
+    `tasks` is any dict whose values are the Tasks in flight; it is read, never modified.
+    """
+
+    def __init__(self, queue, tasks, interval=None):
+        self.queue = queue
+        self.tasks = tasks
+        self.interval = interval or queue.visibility / 3.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='lease-heartbeat', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.queue.extend(list(self.tasks.values()))
+            except Exception:
+                logger.exception('Lease heartbeat failed')
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_queue(queue, fetcher, url_for, handle, batch=100, poll=None):
+    """
+    Fetch every task in `queue` with a FetchEngine.
+
+    `url_for(payload)` gives the URL to GET, and `handle(payload, response, attempt)` is the FetchEngine handler that
+    saves it. Tasks are acked when the response status is below 400, and failed (to be retried after a backoff, or
+    dead-lettered) otherwise, or when the engine gives up on the request. Leases are heartbeated while in flight. The
+    queue's database calls, leasing included, run on a thread of their own rather than in the event loop.
+
+    With `poll` set, keep polling every `poll` seconds until no task is ready or leased anywhere, picking up retries and
+    the tasks of workers that died; otherwise stop as soon as there's nothing to lease.
+
+    Returns {'done': n, 'failed': n}.
+    """
+    # Only draining a queue needs aiohttp, not planning or checking on one
+    from digscraper.fetch import FetchFailed, Job
+
+    in_flight = {}
+    counts = {'done': 0, 'failed': 0}
+    # Every lease, ack and fail is a database round trip, which may wait on another process's write lock: they run one
+    # at a time on this thread, in the order they were asked for, so the event loop never waits on the database.
+    db = ThreadPoolExecutor(max_workers=1, thread_name_prefix='queue-db')
+
+    async def run(url, task, response, attempt):
+        result = await handle(task.payload, response, attempt)
+        done = response.status < 400
+        await asyncio.get_running_loop().run_in_executor(
+            db, queue.ack if done else queue.fail, task, 'HTTP {}'.format(response.status),
+        )
+        # Only once it's acked or failed: if that raised, the engine reports a FetchFailed and it's failed below
+        del in_flight[url]
+        counts['done' if done else 'failed'] += 1
+        return result
+
+    async def jobs():
+        lease = partial(asyncio.get_running_loop().run_in_executor, db, queue.lease, batch)
+        tasks = await lease()
+        while tasks:
+            # While a full batch is handed out, lease the next one in the background
+            upcoming = lease() if len(tasks) == batch else None
+            for task in tasks:
+                url = url_for(task.payload)
+                in_flight[url] = task
+                yield Job(url, partial(run, url, task))
+            tasks = await upcoming if upcoming is not None else []
+            if not tasks:
+                # Tasks failed since then can be leased again once their backoff is over
+                tasks = await lease()
+
+    try:
+        with Heartbeat(queue, in_flight):
+            while True:
+                for result in fetcher.run(jobs()):
+                    if isinstance(result, FetchFailed):
+                        task = in_flight.pop(result.job.url, None)
+                        if task is None:
+                            continue
+                        try:
+                            queue.fail(task, repr(result.cause))
+                        except Exception:
+                            # Its lease runs out and it's retried, just later
+                            logger.exception('Could not fail %s', result.job.url)
+                        counts['failed'] += 1
+                if poll is None or not queue.pending():
+                    break
+                time.sleep(poll)
+    finally:
+        db.shutdown()
+    return counts
@@ -0,0 +1,170 @@
+"""
+Leases, retries and dead letters in the work queue, including several processes draining it at once.
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool
+from unittest import TestCase
+
+from digscraper.fetch import FetchEngine
+from digscraper.workqueue import Heartbeat, WorkQueue, run_queue
+
+
+def drain(url):
+    queue = WorkQueue(url, 'test')
+    leased = []
+    for task in queue.drain(batch=7):
+        leased.append(task.payload)
+        queue.ack(task)
+    return leased
+
+
+class EvenPages(BaseHTTPRequestHandler):
+    """
+    /<n> is a page when n is even, and a 404 when it's odd
+    """
+    def do_GET(self):
+        self.send_response(404 if int(self.path[1:]) % 2 else 200)
+        self.end_headers()
+        self.wfile.write(b'page')
+
+    def log_message(self, *args):
+        pass
+
+
+class WorkQueueTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.url = 'sqlite:///' + os.path.join(self.dir.name, 'queue.sqlite3')
+        self.queue = WorkQueue(self.url, 'test', visibility=60, max_attempts=2, backoff=0)
+
+    def tearDown(self):
+        self.queue.engine.dispose()
+        self.dir.cleanup()
+
+    def test_put_ignores_duplicates(self):
+        self.assertEqual(self.queue.put_many(['a', 'b', 'c']), 3)
+        self.assertEqual(self.queue.put_many(['b', 'c', 'd']), 1)
+        self.assertEqual(self.queue.stats(), {'ready': 4})
+
+    def test_lease_hides_tasks(self):
+        self.queue.put_many(['a', 'b'])
+        first = self.queue.lease(1)
+        second = self.queue.lease(5)
+        self.assertEqual([t.payload for t in first + second], ['a', 'b'])
+        self.assertEqual(self.queue.lease(5), [])
+
+    def test_expired_lease_is_retried_then_dead_lettered(self):
+        self.queue.visibility = 0
+        self.queue.put('a')
+        self.assertEqual(self.queue.lease()[0].attempts, 1)
+        time.sleep(0.01)
+        self.assertEqual(self.queue.lease()[0].attempts, 2)
+        time.sleep(0.01)
+        self.assertEqual(self.queue.lease(), [])
+        self.assertEqual(self.queue.stats(), {'dead': 1})
+        self.assertEqual(self.queue.retry_dead(), 1)
+        self.assertEqual(self.queue.lease()[0].attempts, 1)
+
+    def test_fail_then_dead(self):
+        self.queue.put('a')
+        task, = self.queue.lease()
+        self.queue.fail(task, 'HTTP 500')
+        task, = self.queue.lease()
+        self.queue.fail(task, 'HTTP 500')
+        self.assertEqual(self.queue.stats(), {'dead': 1})
+
+    def test_processes_never_share_a_task(self):
+        payloads = ['http://example.com/{}'.format(i) for i in range(500)]
+        self.queue.put_many(payloads)
+        with Pool(4) as pool:
+            leased = pool.map(drain, [self.url] * 4)
+        everything = [p for worker in leased for p in worker]
+        self.assertEqual(sorted(everything), sorted(payloads))
+        self.assertEqual(self.queue.stats(), {'done': 500})
+
+    def test_heartbeat_extends_leases(self):
+        self.queue.visibility = 0.2
+        self.queue.put('a')
+        tasks = {'a': self.queue.lease()[0]}
+        with Heartbeat(self.queue, tasks, interval=0.05):
+            time.sleep(0.5)
+            self.assertEqual(self.queue.lease(), [])
+        time.sleep(0.3)
+        self.assertEqual(len(self.queue.lease()), 1)
+
+    def test_run_queue_acks_and_fails(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), EvenPages)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        self.queue.put_many(str(i) for i in range(20))
+        saved = []
+
+        async def handle(payload, response, attempt):
+            saved.append((payload, await response.read()))
+
+        counts = run_queue(self.queue, FetchEngine(concurrency=5, retries=0), base.__add__, handle)
+        server.shutdown()
+        # With no backoff, each 404 is retried straight away, then dead-lettered after its second attempt
+        self.assertEqual(counts, {'done': 10, 'failed': 20})
+        self.assertEqual(len(saved), 30)
+        self.assertEqual(self.queue.stats(), {'done': 10, 'dead': 10})
+
+    def test_run_queue_fails_tasks_it_could_not_ack(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), EvenPages)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        self.queue.put_many(str(i) for i in range(0, 20, 2))
+        ack = self.queue.ack
+        calls = []
+
+        def flaky_ack(task, result=None):
+            calls.append(task.payload)
+            if len(calls) == 1:
+                raise RuntimeError('database is locked')
+            ack(task, result)
+
+        self.queue.ack = flaky_ack
+
+        async def handle(payload, response, attempt):
+            await response.read()
+
+        counts = run_queue(self.queue, FetchEngine(concurrency=5, retries=0), base.__add__, handle, poll=0.01)
+        server.shutdown()
+        self.assertEqual(counts, {'done': 10, 'failed': 1})
+        self.assertEqual(self.queue.stats(), {'done': 10})
+        self.assertEqual(len(calls), 11)
+
+    def test_run_queue_leases_off_the_event_loop(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), EvenPages)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        self.queue.put_many(str(i) for i in range(0, 40, 2))
+        lease = self.queue.lease
+        loops = []
+        blocked = []
+
+        def slow_lease(n=100):
+            # The event loop should still get round to this while the lease is waited for
+            if loops:
+                ran = threading.Event()
+                loops[0].call_soon_threadsafe(ran.set)
+                blocked.append(not ran.wait(1))
+            return lease(n)
+
+        self.queue.lease = slow_lease
+
+        async def handle(payload, response, attempt):
+            loops[:] = [asyncio.get_running_loop()]
+            await response.read()
+
+        counts = run_queue(self.queue, FetchEngine(concurrency=5, retries=0), base.__add__, handle, batch=5)
+        server.shutdown()
+        self.assertEqual(counts, {'done': 20, 'failed': 0})
+        self.assertTrue(blocked)
+        self.assertFalse(any(blocked))
@@ -1,28 +1,38 @@
-import os
-import sys
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import create_engine
+from digscraper.attempt_log import AttemptLog, enable_wal
+from digscraper.attempts import Attempt, create_schema
 
-engine = create_engine('sqlite:///fademnes.sqlite3')
-# Bind the engine to the metadata of the Base class so that the
-# declaratives can be accessed through a DBSession instance
-Base = declarative_base()
-Base.metadata.bind = engine
+DATABASE_PATH = 'fademnes.sqlite3'
 
+_engine = None
+_attempt_log = None
 
-class Attempt(Base):
-    __tablename__ = 'person'
-    id = Column(Integer, primary_key=True)
-    site_id = Column(Integer, nullable=False)
-    url = Column(String(250), nullable=False)
-    status_code = Column(Integer, nullable=False)
-    saved = Column(Boolean, default=False)
 
+def engine():
+    """
+    The attempts database, opened on first use
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine('sqlite:///{}'.format(DATABASE_PATH))
+        enable_wal(_engine)
+        # Create the attempts table and its indexes (migrating the old `person` table, if there is one). The schema and
+        # the statistics queries are shared by every source; see digscraper.attempts.
+        create_schema(_engine)
+    return _engine
 
-# Create all tables in the engine. This is equivalent to "Create Table"
-# statements in raw SQL.
-Base.metadata.create_all(engine)
 
-DBSession = sessionmaker(bind=engine)
+def DBSession():
+    return sessionmaker(bind=engine())()
+
+
+def attempt_log():
+    """
+    Scrapers record attempts here instead of committing through a DBSession; rows are written in batches in the
+    background
+    """
+    global _attempt_log
+    if _attempt_log is None:
+        _attempt_log = AttemptLog(engine(), Attempt)
+    return _attempt_log
@@ -0,0 +1,117 @@
+"""
+A persistent index of which (gid, resource) pages have been saved, so working out what's left is one SQL query instead
+of an os.listdir per gid.
+"""
+import os
+
+from sqlalchemy import Column, Integer, String, create_engine, text
+from sqlalchemy.orm import declarative_base
+
+from digscraper.attempt_log import enable_wal
+
+Base = declarative_base()
+
+
+class SavedPage(Base):
+    __tablename__ = 'saved_pages'
+    gid = Column(Integer, primary_key=True)
+    resource = Column(String(50), primary_key=True)
+
+
+class CompletionIndex(object):
+    """
+    The set of saved pages, updated by SiteInfo every time it saves one
+    """
+
+    def __init__(self, url):
+        self.engine = create_engine(url, connect_args={'timeout': 60} if url.startswith('sqlite') else {})
+        if self.engine.dialect.name == 'sqlite':
+            enable_wal(self.engine)
+        Base.metadata.create_all(self.engine)
+
+    def mark(self, gid, resource):
+        self.mark_many([(gid, resource)])
+
+    def mark_many(self, pages):
+        rows = [{'gid': int(gid), 'resource': resource} for gid, resource in pages]
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO saved_pages (gid, resource) VALUES (:gid, :resource) ON CONFLICT DO NOTHING"
+            ), rows)
+
+    def is_empty(self):
+        with self.engine.connect() as conn:
+            return not conn.execute(text("SELECT EXISTS (SELECT 1 FROM saved_pages)")).scalar()
+
+    def done(self, gid):
+        """
+        Resources saved for one gid
+        """
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("SELECT resource FROM saved_pages WHERE gid = :gid"), {'gid': int(gid)})
+            return [row[0] for row in rows]
+
+    def count(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM saved_pages")).scalar()
+
+    def saved(self):
+        """
+        Every saved (gid, resource)
+        """
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(text("SELECT gid, resource FROM saved_pages ORDER BY gid"))]
+
+    def to_do(self, start, stop, resources):
+        """
+        Every (gid, resource) in the gid range that hasn't been saved, ordered by gid and then by `resources`.
+
+        The candidate grid is generated inside SQL and anti-joined against the primary key.
+        """
+        if start >= stop:
+            return []
+        values = ', '.join('(CAST(:r{0} AS VARCHAR(50)), {0})'.format(i) for i in range(len(resources)))
+        params = {'r{}'.format(i): r for i, r in enumerate(resources)}
+        params.update(start=start, stop=stop)
+        query = text(
+            "WITH RECURSIVE gids(gid) AS (SELECT CAST(:start AS INTEGER) UNION ALL SELECT gid + 1 FROM gids WHERE gid + 1 < :stop), "
+            "resources(resource, pos) AS (VALUES {}) "
+            "SELECT g.gid, r.resource FROM gids g CROSS JOIN resources r "
+            "WHERE NOT EXISTS (SELECT 1 FROM saved_pages p WHERE p.gid = g.gid AND p.resource = r.resource) "
+            "ORDER BY g.gid, r.pos".format(values)
+        )
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(query, params)]
+
+    def partial_gids(self, start, stop, resources):
+        """
+        Gids in the range with some, but not all, of `resources` saved
+        """
+        placeholders = ', '.join(':r{}'.format(i) for i in range(len(resources)))
+        params = {'r{}'.format(i): r for i, r in enumerate(resources)}
+        params.update(start=start, stop=stop, n=len(resources))
+        query = text(
+            "SELECT gid FROM saved_pages WHERE gid >= :start AND gid < :stop AND resource IN ({}) "
+            "GROUP BY gid HAVING COUNT(*) < :n ORDER BY gid".format(placeholders)
+        )
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.execute(query, params)]
+
+    def bootstrap(self, results_dir):
+        """
+        One-off import of the pages already saved as files under results_dir/<gid>/<gid>-<resource>.html.
+        Returns how many pages were found.
+        """
+        pages = []
+        for gid in os.listdir(results_dir):
+            if not gid.isdigit():
+                continue
+            for basename in os.listdir(os.path.join(results_dir, gid)):
+                if basename.startswith('.') or not basename.endswith('.html'):
+                    continue
+                _, resource = basename[:-len('.html')].split('-', 1)
+                pages.append((gid, resource))
+        self.mark_many(pages)
+        return len(pages)
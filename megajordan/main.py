@@ -1,8 +1,8 @@
+import argparse
+import asyncio
 import random
 
-from requests import Session
-from concurrent import futures
-from time import sleep
+from multiprocessing import Process
 import logging
 import os
 import datetime as dt
@@ -10,12 +10,12 @@ import re
 from collections import defaultdict
 from pprint import pprint
 
-logger = logging.getLogger(__name__)
-
-session = Session()
-
-
+from digscraper import metrics
+from digscraper.files import CHUNK_SIZE, write_stream
+from digscraper.workqueue import WorkQueue, run_queue
+from megajordan.completion import CompletionIndex
 
+logger = logging.getLogger(__name__)
 
 
 class SiteInfo(object):
@@ -31,38 +31,57 @@ class SiteInfo(object):
     HERE = os.path.dirname(__file__)
     RESULTS_DIR = os.path.join(HERE, "results")
     FAILURE_DIR = os.path.join(RESULTS_DIR, 'failure')
-    for DIR in [RESULTS_DIR, FAILURE_DIR]:
-        try:
-            os.mkdir(DIR)
-        except OSError:
-            pass
+    # A digscraper.packstore.PackWriter to save successful pages into, instead of one file each under RESULTS_DIR
+    STORE = None
+
     def __init__(self, gid):
         self.gid = gid
 
-    def save_page(self, url, timeout=None):
+    @classmethod
+    def make_dirs(cls):
+        for directory in [cls.RESULTS_DIR, cls.FAILURE_DIR]:
+            os.makedirs(directory, exist_ok=True)
+
+    async def handle_page(self, url, response, attempt=None):
         """
-        A function to perform one unit of work: Make a request, save the response.
+        FetchEngine handler: stream the body of a page to disk
         """
-        # Expects a URL in the format "http://example.com/path/<resource>?gid=<gid>
+        path = self.page_path(url, response.status)
+        if path is None:
+            body = await response.read()
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.STORE.put, 'megajordan', *self.page_key(url), body,
+            )
+        else:
+            await write_stream(path, response.content.iter_chunked(CHUNK_SIZE))
+        if response.status < 400:
+            # A database write, which mustn't hold up the event loop
+            await asyncio.get_running_loop().run_in_executor(None, completion_index().mark, *self.page_key(url))
+        return response
 
+    @staticmethod
+    def page_key(url):
+        """
+        (gid, resource) for a URL in the format "http://example.com/path/<resource>?gid=<gid>"
+        """
         base, gid = url.split('=')
         base, _ = base.split("?")
         resource = base.split("/")[-1]
-        r = session.request('GET', url, timeout=timeout)
-        # Construct filename differently based on success/failure
-        if r.ok:
-            try:
-                os.mkdir("{}/{}".format(self.RESULTS_DIR, gid))
-            except OSError:
-                pass
-            filename = "{}/{}/{}-{}.html".format(self.RESULTS_DIR, gid, gid, resource)
-        else:
-            filename = "{}/{}-{}-{}.html".format(self.FAILURE_DIR, r.status_code, gid, resource)
+        return gid, resource
 
-        # Write it out regardless of status code
-        with open(filename, 'w', encoding='UTF-8') as fh:
-            fh.write(r.text)
-        return r
+    def page_path(self, url, status_code):
+        """
+        Where to save a response body: under the results or failure directory, depending on the status code. None
+        means a successful page goes into the pack store instead.
+        """
+        gid, resource = self.page_key(url)
+        # Construct filename differently based on success/failure
+        if status_code < 400 and self.STORE is not None:
+            return None
+        if status_code < 400:
+            return "{}/{}/{}-{}.html".format(self.RESULTS_DIR, gid, gid, resource)
+        # Failures get written out too, for debugging, but never where they'd count as done
+        return "{}/{}-{}-{}.html".format(self.FAILURE_DIR, status_code, gid, resource)
 
     @property
     def all(self):
@@ -74,24 +93,39 @@ class SiteInfo(object):
     
     @property
     def done(self):
-        pages = []
-        for basename in os.listdir(os.path.join(self.RESULTS_DIR, str(self.gid))):
-                gid, page = basename.split('-')
-                page = page.replace(".html", "")
-                pages.append("{}{}?gid={}".format(self.BASE_URL, page, self.gid))
-        return pages
+        """
+        Returns a list of the page urls already saved for this GID, according to the completion index
+        """
+        return ["{}{}?gid={}".format(self.BASE_URL, page, self.gid) for page in completion_index().done(self.gid)]
     
     @property
     def to_do(self):
         all = self.all
         done = self.done
         return [p for p in all if p not in done]
-    
-    def run(self):
-        for p in self.to_do:
-            self.save_page(p)
-        
-        
+
+
+# The work queue and the completion index live in here, so restarting a crawl doesn't mean rescanning RESULTS_DIR.
+# Point DIGSCRAPER_DATABASE_URL at the compose Postgres service to share one queue between several nodes.
+QUEUE_URL = os.environ.get('DIGSCRAPER_DATABASE_URL') or 'sqlite:///{}'.format(
+    os.path.join(SiteInfo.HERE, 'queue.sqlite3')
+)
+
+_completion_index = None
+
+
+def completion_index():
+    """
+    The index of saved pages, opened on first use
+    """
+    global _completion_index
+    if _completion_index is None:
+        _completion_index = CompletionIndex(QUEUE_URL)
+    return _completion_index
+
+
+def url_for(gid, resource):
+    return "{}{}?gid={}".format(SiteInfo.BASE_URL, resource, gid)
 
 
 def all_urls(start=0, stop=1):
@@ -106,19 +140,13 @@ def all_urls(start=0, stop=1):
 
 
 def finished_urls():
-    finished = [basename for basename in os.listdir(SiteInfo.RESULTS_DIR)]
-    finished_urls = []
-    for gid in finished:
-        finished_urls.extend(SiteInfo(gid).done)
-    return finished_urls
+    return [url_for(gid, resource) for gid, resource in completion_index().saved()]
 
 
 def partially_complete(start=102, stop=15000):
-    at_least_some_data = [gid for gid in os.listdir(SiteInfo.RESULTS_DIR)]
-    targets = []
-    for gid in at_least_some_data:
-        targets.extend(SiteInfo(gid).to_do)
-    return targets
+    partial = set(completion_index().partial_gids(start, stop, SiteInfo.PAGE_URLS))
+    return [url_for(gid, resource) for gid, resource in completion_index().to_do(start, stop, SiteInfo.PAGE_URLS)
+            if gid in partial]
 
   
 def tried_already():
@@ -132,70 +160,112 @@ def tried_already():
                 errors.append(re.search(r'(http://.*=\d+)', l).group(1))
     return success
 
- 
-    
-if __name__ == "__main__":
 
-  with open('finished.txt', 'a+') as fh:
-    # Enumerate what we've already done
-    print("Missing GIDs:      {}".format(len(range(102, 13000)) - len(os.listdir(SiteInfo.RESULTS_DIR))))
-    all = all_urls(102, 13000)
-    print("All urls:          {}".format(len(list(all))))
-    
-    finished = finished_urls()
-    print("Finished:          {}".format(len(finished)))
-    
-    tried = tried_already()
-
-    # Grab the list of URLS to work on.
-    missing_urls = set(all) - set(finished) # - set(tried)
-    print("Missing:           {}".format(len(missing_urls)))
-	
-    partials = partially_complete(start=102, stop=13000)
+def target_urls(start=102, stop=13000):
+    """
+    Every URL in the gid range that hasn't been saved yet: gids we have some pages for come first, in random order,
+    then the ones we have nothing for.
+    """
+    index = completion_index()
+    partial = set(index.partial_gids(start, stop, SiteInfo.PAGE_URLS))
+    partials, missing = [], []
+    for gid, resource in index.to_do(start, stop, SiteInfo.PAGE_URLS):
+        (partials if gid in partial else missing).append(url_for(gid, resource))
     random.shuffle(partials)
-    print("Partially Missing: {}".format(len(partials)))
-	
-    target_urls = partials + [u for u in missing_urls if u not in partials]
-    target_count = len(target_urls)
-	
-    print("Target URLS:       {}".format(len(target_urls)))
-    # print("\n".join(target_urls))
-    
-    URLS = [u for u in target_urls if u not in finished]
-    print("Left: {}".format(len(URLS)))
-    successes = len(finished)
-    total = successes + target_count
-    failures = 0
-
-    # raise Exception
-    backoff = 1  # second
-    # Start the load operations and mark each future with its URL
-	
-    while URLS:
-        url = URLS.pop()
-        try:
-            start = dt.datetime.now()
-            r = SiteInfo(None).save_page(url, 60)
-            successes += 1
-        except Exception as exc:
-            finish = dt.datetime.now()
-            print('[%s] backoff %s; %r generated an exception: %s' % (dt.datetime.now(), backoff, url, exc))
-            backoff *= 2
-            backoff = min(backoff, 60 * 60)
-            sleep(backoff)
-            failures += 1
-            URLS.append(url)
-        else:
-            finish = dt.datetime.now()
-            backoff = .1 #max(backoff / 2, 0.5)
-            sleep(backoff)
-            message = "[{}] {}/{}/{} ({:.2f}%) {} ({:.2f}s|{}s) {}".format(
-                dt.datetime.now(), successes, failures, total,
-                100 * float(successes) / total,
-                r.status_code, (finish - start).total_seconds(), backoff, r.url
-            )
-            fh.write(message + "\n")
-            print(message)
+    return partials + missing
+
+
+def work_queue():
+    return WorkQueue(QUEUE_URL, 'megajordan')
 
 
+def plan(start=102, stop=13000):
+    """
+    Fill the work queue with everything the completion index says is left. Only the very first run has to do this (and
+    build the index from what's on disk); every later start, or another worker process, just resumes the queue.
+    """
+    SiteInfo.make_dirs()
+    index = completion_index()
+    if index.is_empty():
+        print("Indexed:           {}".format(index.bootstrap(SiteInfo.RESULTS_DIR)))
+    queue = work_queue()
+    if not queue.stats():
+        added = queue.put_many(target_urls(start, stop))
+        print("Queued:            {}".format(added))
+    return queue
+
+
+def crawl(queue, fh, per_host=8, poll=None):
+    """
+    Drain the work queue with the shared FetchEngine, appending a progress line to `fh` as each page is saved.
+
+    Saved pages are acked. Error statuses, and requests that still fail after the engine's own retries, go back on the
+    queue to be tried again after a backoff, or are dead-lettered once they run out of attempts.
+    """
+    stats = queue.stats()
+    total = sum(stats.values())
+    progress = {'done': stats.get('done', 0)}
+
+    async def handle(url, response, attempt):
+        r = await SiteInfo(None).handle_page(url, response, attempt)
+        progress['done'] += r.status < 400
+        message = "[{}] {}/{} ({:.2f}%) {} {}".format(
+            dt.datetime.now(), progress['done'], total, 100 * float(progress['done']) / total, r.status, url
+        )
+        fh.write(message + "\n")
+        print(message)
 
+    from digscraper.fetch import FetchEngine
+
+    engine = FetchEngine(per_host=per_host, timeout=60, backoff=1, max_backoff=60 * 60, source='megajordan')
+    return run_queue(queue, engine, lambda url: url, handle, poll=poll)
+
+
+def work(per_host=8, poll=None, metrics_port=None):
+    """
+    One worker process: drain the shared queue until there is nothing left to lease, serving its crawl metrics on
+    `metrics_port` if given
+    """
+    global _completion_index
+    _completion_index = None  # Never use the parent's connections after the fork
+    if metrics_port:
+        metrics.serve(metrics_port)
+    with open('finished.txt', 'a+') as fh:
+        return crawl(work_queue(), fh, per_host=per_host, poll=poll)
+
+
+def main(argv=None):
+    """
+    Crawl megajordan.org site reports from the work queue
+    """
+    parser = argparse.ArgumentParser(description="Crawl megajordan.org site reports from a persistent work queue")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes draining the queue")
+    parser.add_argument('--per-host', type=int, default=8, help="Concurrent requests per worker")
+    parser.add_argument('--retry-dead', action='store_true', help="Give dead-lettered URLs another set of attempts")
+    parser.add_argument('--poll', type=float, help="Keep polling the queue every POLL seconds until nothing is left "
+                                                   "anywhere (for crawls shared between nodes)")
+    parser.add_argument('--metrics-port', type=int, help="Serve crawl metrics for Prometheus from this port on, one "
+                                                         "port per worker")
+    args = parser.parse_args(argv)
+
+    queue = plan(102, 13000)
+    if args.retry_dead:
+        print("Revived:           {}".format(queue.retry_dead()))
+    print("Queue:             {}".format(queue.stats()))
+    # SQLite connections mustn't be shared across a fork: close the pooled ones, and the workers open their own
+    completion_index().engine.dispose()
+    queue.engine.dispose()
+
+    workers = [
+        Process(target=work, args=(args.per_host, args.poll, args.metrics_port and args.metrics_port + i))
+        for i in range(args.workers)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    print("Queue:             {}".format(queue.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""
+Benchmarks for the MEGA Jordan SiteGeneral parser, on synthetic pages (see digscraper.synthetic).
+
+    python -m megajordan.parse_bench --save    # record a baseline on this machine
+    python -m megajordan.parse_bench           # compare against it; exits 1 if anything got slower
+"""
+import os
+import random
+import tempfile
+
+from digscraper import bench, synthetic
+from megajordan.parsers import add_geometry, general, general_data
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+
+def benchmarks(sites=2000):
+    """
+    {name: function} for every benchmark, with the synthetic pages they work on made up front
+    """
+    import pandas as pd
+
+    rng = random.Random(0)
+    directory = tempfile.mkdtemp()
+    typical = os.path.join(directory, '2431-SiteGeneral.html')
+    with open(typical, 'w', encoding='UTF-8') as fh:
+        fh.write(synthetic.mega_general_page(2431, rng=rng))
+    big = synthetic.mega_general_page(2432, fields=300, points=400, rng=rng).encode('UTF-8')
+    sheet = pd.DataFrame([general_data(synthetic.mega_general_page(i, rng=rng).encode('UTF-8')) for i in range(sites)])
+    return {
+        'general, typical page': lambda: general(typical),
+        'general_data, big page': lambda: general_data(big),
+        'add_geometry, {} sites'.format(sites): lambda: add_geometry(sheet.copy()),
+    }
+
+
+if __name__ == "__main__":
+    bench.main(benchmarks(), BASELINE, 'Time the MEGA Jordan parser on synthetic pages')
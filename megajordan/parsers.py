@@ -1,70 +1,149 @@
-import bs4
+import argparse
+import inspect
+import io
 import os
 
-import pandas as pd
 from pprint import pprint
 
+from digscraper import geometry, profiling
+from digscraper.parallel import parallel_map
+from digscraper.parsecache import cached_map, source_version
+from digscraper.sections import SectionExtractor, SectionSpec, parse_html
 from megajordan.main import SiteInfo
 
 
-def slurp(filename):
-    with open(filename, "r", encoding='UTF-8') as fh:
+def slurp_bytes(filename):
+    with open(filename, "rb") as fh:
         return fh.read()
 
 
-def chunker(seq, size):
-    chunks = []
-    for item in seq:
-        chunks.append(item)
-        if len(chunks) >= size:
-            yield chunks
-            chunks = []
+def decode(data):
+    """
+    The text of a UTF-8 file with these bytes, with its newlines translated as reading it in text mode would
+    """
+    return io.TextIOWrapper(io.BytesIO(data), encoding='UTF-8').read()
+
+
+def add_geometry(df):
+    """
+    Adds the mean, geometric median, bounding box and area (in the coordinates' own units) of every site's coordinates
+    to the general sheet
+    """
+    column = next((c for c in df.columns if 'Coordinates' in c), None)
+    if column is None:
+        return df
+    sites = geometry.parse_mega(df[column])
+    has_points = sites.counts > 0
 
+    def points(array):
+        return [tuple(p) if has else None for p, has in zip(array.tolist(), has_points)]
 
-def geo_median(coords):
-    if coords:
-        coords = coords.split(",")
-        coords = [c.split() for c in coords]
-        x = [float(c[0]) for c in coords]
-        y = [float(c[1]) for c in coords]
-        return (sum(x)/float(len(x)), sum(y)/float(len(y)))
+    df['Coordinate Mean'] = points(sites.centroids())
+    df['Coordinate Median'] = points(sites.medians())
+    df['Coordinate Bounds'] = points(sites.bounds())
+    df['Coordinate Area'] = sites.areas()
+    return df
 
 
-def general(filename):
+# The general page is one god-awful single-row table, read as key, value pairs of cells
+general_extractor = SectionExtractor([SectionSpec('basic_data', None, 'cells')])
+# Changes whenever the parsing code does, which invalidates the parse cache
+PARSER_VERSION = source_version(__file__, inspect.getfile(SectionExtractor))
+
+
+def general_data(data):
     """
-    Returns a list of
-    :param filename:
-    :return:
+    The basic data from the bytes of a SiteGeneral page
+    """
+    basic_data = {}
+    with profiling.stage('decode'):
+        text = decode(data)
+    with profiling.stage('parse_html'):
+        root = parse_html(text)
+    with profiling.stage('extract'):
+        cells = general_extractor.extract(root)['basic_data'][0]
+    for key, value in cells.items():
+        basic_data[key] = value
+    return basic_data
+
+
+def file_data(filename, data):
+    """
+    The page's data, after the gid and file name it came from
     """
-    soup = bs4.BeautifulSoup(slurp(filename), 'lxml')
-    # print(soup.prettify())
-    # Grab the basic data out of its god-awful single-row table, anchored by the MEGA NUMBER cell
     basename = os.path.basename(filename)
     gid, page = basename.split('-')
     basic_data = {'gid': gid, 'file': basename}
-    for key, value in chunker(soup.find_all('td'), 2):
-        if key.string is not None and value.string is not None:
-            key = key.string.strip()
-            value = value.string.strip()
-            basic_data[key] = value
-            if 'Coordinates' in key:
-                basic_data['Coordinate Mean'] = geo_median(basic_data[key])
+    basic_data.update(data)
     return basic_data
 
 
-if __name__ == "__main__":
-    general_sheet = []
+def general(filename):
+    """
+    Returns a dict of the basic data on a SiteGeneral page
+    :param filename:
+    :return:
+    """
+    return file_data(filename, general_data(slurp_bytes(filename)))
+
+
+def main(argv=None):
+    """
+    Parse the saved SiteGeneral pages into general.csv
+    """
+    import pandas as pd
+
+    from digscraper import dedup
+
+    parser = argparse.ArgumentParser(description='Parse the saved SiteGeneral pages into general.csv')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes to parse with')
+    parser.add_argument(
+        '--cache', default='parse_cache.sqlite3', help="Parse cache, so unchanged pages aren't re-parsed ('' for none)",
+    )
+    parser.add_argument('--page-index', default=dedup.DEFAULT_INDEX,
+                        help="Skip the pages `digscraper check megajordan` found empty or a template ('' to parse them "
+                             "all)")
+    profiling.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    skip = dedup.skipped_pages('megajordan', args.page_index)
+    if skip:
+        print('Skipping {} empty or template pages'.format(len(skip)))
     general_files = []
     for gid in os.listdir('results'):
+        if not gid.isdigit():
+            continue
         directory = os.path.join('results', gid)
-        general_files.extend([os.path.join(directory, f) for f in os.listdir(directory) if "General" in f])
+        general_files.extend([os.path.join(directory, f) for f in os.listdir(directory)
+                              if "General" in f and os.path.join(gid, f) not in skip])
+
+    general_files.sort()
+    with profiling.profiled(args) as profiler:
+        if profiler is not None:
+            # One page at a time, in this process, and never from the cache, so every page's time is seen
+            pages = profiler.map(general_data, general_files, slurp_bytes)
+            general_sheet = [file_data(f, data) for f, data in zip(general_files, pages)]
+        elif args.cache:
+            stats = {}
+            pages = cached_map(
+                general_data, slurp_bytes, general_files, args.cache, PARSER_VERSION, args.workers, stats=stats,
+            )
+            general_sheet = [file_data(f, data) for f, data in zip(general_files, pages)]
+            print('Parsed {misses} pages, {hits} unchanged'.format(**stats))
+        else:
+            general_sheet = list(parallel_map(general, general_files, args.workers))
 
-    for f in general_files:
-        general_sheet.append(general(f))
+        with profiling.stage('dataframe'):
+            df = pd.DataFrame(general_sheet)
+            df['MEGA Number'] = df['MEGA Number'].apply(int)
+            df = df.set_index('MEGA Number')
+            df = df.sort_index()
+        with profiling.stage('add_geometry'):
+            df = add_geometry(df)
+        with profiling.stage('to_csv'):
+            df.to_csv(os.path.join(SiteInfo.RESULTS_DIR, 'general.csv'))
+    pprint(df)
 
-    df = pd.DataFrame(general_sheet)
-    df['MEGA Number'] = df['MEGA Number'].apply(int)
-    df = df.set_index('MEGA Number')
-    df = df.sort_index()
-    df.to_csv(os.path.join(SiteInfo.RESULTS_DIR, 'general.csv'))
-    pprint(df)
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()